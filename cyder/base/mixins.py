@@ -1,6 +1,6 @@
 import os
 import fcntl
-from string import Template
+from string import Formatter, Template
 
 from django.core.urlresolvers import NoReverseMatch, reverse
 from django.db.models.loading import get_model
@@ -22,20 +22,63 @@ class DisplayMixin(object):
         'extra_just':   1
     }
 
-    def bind_render_record(self, pk=False, custom=None):
-        kwargs = vars(self)
-        if custom:
-            for key, value in custom.items():
-                kwargs[key] = value
+    @classmethod
+    def get_bind_template(cls, template=None):
+        """
+        Return ``template`` (the class's template by default) with the
+        justification knobs substituted in. Templates are compiled once per
+        class and cached.
+        """
+        if template is None:
+            template = cls.template
+        cache = cls.__dict__.get('_bind_templates')
+        if cache is None:
+            cache = {}
+            setattr(cls, '_bind_templates', cache)
+        if template not in cache:
+            cache[template] = Template(template).substitute(**cls.justs)
+        return cache[template]
+
+    @classmethod
+    def get_bind_formatter(cls, template=None):
+        """
+        Return a function that renders the compiled template from positional
+        values, and the names of the fields it expects, in order. This skips
+        building a dict of every attribute for each record, e.g.::
+
+            render, fields = AddressRecord.get_bind_formatter()
+            render(*(row[f] for f in fields))
+        """
+        template = cls.get_bind_template(template)
+        cache = cls._bind_templates
+        key = ('formatter', template)
+        if key not in cache:
+            fields = []
+            parts = []
+            for literal, name, spec, conversion in (
+                    Formatter().parse(template)):
+                parts.append(literal.replace('{', '{{').replace('}', '}}'))
+                if name is not None:
+                    parts.append('{{{0}{1}{2}}}'.format(
+                        len(fields),
+                        '!' + conversion if conversion else '',
+                        ':' + spec if spec else ''))
+                    fields.append(name)
+            cache[key] = (''.join(parts).format, tuple(fields))
+        return cache[key]
 
-        template = Template(self.template).substitute(**self.justs)
-        bind_name = self.fqdn + "."
+    def bind_render_record(self, pk=False, custom=None):
+        render, fields = self.get_bind_formatter(self.template)
 
         if not self.ttl:
             self.ttl = 3600
 
-        return template.format(bind_name=bind_name, rdtype=self.rdtype,
-                               rdclass='IN', **kwargs)
+        values = {'bind_name': self.fqdn + ".", 'rdtype': self.rdtype,
+                  'rdclass': 'IN'}
+        if custom:
+            values.update(custom)
+        return render(*[values[f] if f in values else getattr(self, f)
+                        for f in fields])
 
 
 class ObjectUrlMixin(object):
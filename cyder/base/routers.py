@@ -0,0 +1,58 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import connections, DEFAULT_DB_ALIAS
+
+
+# The snapshot this thread is reading from, if any. See :func:`read_snapshot`.
+_snapshot = threading.local()
+
+
+class SnapshotRouter(object):
+    """
+    Send reads to the database snapshot opened by :func:`read_snapshot`, if
+    this thread has one open. Otherwise, defer to the next router.
+    """
+
+    def db_for_read(self, model, **hints):
+        return getattr(_snapshot, 'alias', None)
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_syncdb(self, db, model):
+        return None
+
+
+@contextmanager
+def read_snapshot(alias):
+    """
+    Make every read in this thread inside the block come from one
+    consistent REPEATABLE READ snapshot of the database `alias` (usually a
+    replica), so a build sees the data as it was at a single moment. Writes
+    still go to the primary, so rows written inside the block can't be read
+    back from it.
+
+    If `alias` is None, this does nothing.
+    """
+    if alias is None or getattr(_snapshot, 'alias', None) is not None:
+        yield
+        return
+    if alias == DEFAULT_DB_ALIAS:
+        # Writes made inside the block would be rolled back with the
+        # snapshot.
+        raise ValueError("Can't read from a snapshot of the primary")
+
+    cursor = connections[alias].cursor()
+    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+    cursor.execute('START TRANSACTION WITH CONSISTENT SNAPSHOT')
+    _snapshot.alias = alias
+    try:
+        yield
+    finally:
+        _snapshot.alias = None
+        # Nothing was written, so there's nothing to commit.
+        cursor.execute('ROLLBACK')
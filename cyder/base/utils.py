@@ -23,6 +23,25 @@ def copy_tree(*args, **kwargs):
     distutils.dir_util.copy_tree(*args, **kwargs)
 
 
+def copy_files(src_dir, dest_dir, rel_paths):
+    """Copy each file in `rel_paths` from `src_dir` to `dest_dir`."""
+    for rel_path in rel_paths:
+        dest = os.path.join(dest_dir, rel_path)
+        if not os.path.isdir(os.path.dirname(dest)):
+            os.makedirs(os.path.dirname(dest))
+        shutil.copy2(os.path.join(src_dir, rel_path), dest)
+
+
+def list_files(root_dir):
+    """Return the path of every file under `root_dir`, relative to it."""
+    rel_paths = []
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        for filename in filenames:
+            rel_paths.append(os.path.relpath(os.path.join(dirpath, filename),
+                                             root_dir))
+    return rel_paths
+
+
 def shell_out(command, use_shlex=True):
     """
     A little helper function that will shell out and return stdout,
@@ -209,12 +228,18 @@ def transaction_atomic(func):
     `commit=False`.
 
     Exceptions pass through this decorator intact.
+
+    Build tasks scheduled inside the outermost function are collected and
+    written once, just before the transaction commits. See
+    :func:`cyder.core.task.models.Task.batch`.
     """
 
     def outer(*args, **kwargs):
         if kwargs.pop('commit', True):
+            from cyder.core.task.models import Task
             with transaction.commit_on_success():
-                return func(*args, **kwargs)
+                with Task.batch():
+                    return func(*args, **kwargs)
         else:
             return func(*args, **kwargs)
     outer.__name__ = func.__name__
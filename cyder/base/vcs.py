@@ -1,6 +1,6 @@
 import os
-import re
 from os.path import dirname, basename
+from pipes import quote
 
 from cyder.base.utils import dict_merge, Logger, run_command
 
@@ -46,18 +46,23 @@ class VCSRepo(object):
         self.logger = logger
 
     @repo_chdir_wrapper
-    def reset_to_head(self):
-        self._reset_to_head()
+    def reset_to_head(self, paths=None):
+        self._reset_to_head(paths)
 
     @repo_chdir_wrapper
-    def reset_and_pull(self):
-        """Make the working tree match what's currently upstream."""
-        self._reset_to_head()
+    def reset_and_pull(self, paths=None):
+        """
+        Make the working tree match what's currently upstream. If `paths` is
+        a list of paths, only those are reset, unless something else differs
+        from HEAD too.
+        """
+        self._reset_to_head(paths)
         self._pull()
 
     @repo_chdir_wrapper
-    def commit_and_push(self, message, sanity_check=True):
-        self._commit_and_push(message, sanity_check=sanity_check)
+    def commit_and_push(self, message, sanity_check=True, paths=None):
+        self._commit_and_push(message, sanity_check=sanity_check,
+                              paths=paths)
 
     @repo_chdir_wrapper
     def get_revision(self):
@@ -82,11 +87,28 @@ class VCSRepo(object):
 
 
 class GitRepo(VCSRepo):
+    # How many paths to pass to a single git command
+    paths_per_command = 1000
+
     @repo_chdir_wrapper
     def commit_and_push(self, message, sanity_check=True,
-                        empty=False):
+                        empty=False, paths=None):
+        """
+        Commit and push every change in the working tree, or only the
+        changes to `paths` if it's a list of paths.
+        """
         self._commit_and_push(message, sanity_check=sanity_check,
-                              empty=empty)
+                              empty=empty, paths=paths)
+
+    def _iter_path_args(self, paths):
+        """
+        Split `paths` into lists short enough for one command line. Yield
+        each list and the list quoted as command arguments.
+        """
+        paths = list(paths)
+        for i in xrange(0, len(paths), self.paths_per_command):
+            chunk = paths[i:i + self.paths_per_command]
+            yield chunk, ' '.join(quote(path) for path in chunk)
 
     def _get_revision(self):
         revision, _, _ = self._run_command('git rev-parse HEAD')
@@ -97,9 +119,14 @@ class GitRepo(VCSRepo):
                                              ignore_failure=True)
         return returncode != 0
 
-    def _commit_and_push(self, message, sanity_check=True, empty=False):
-        if not empty:
+    def _commit_and_push(self, message, sanity_check=True, empty=False,
+                         paths=None):
+        if empty:
+            pass
+        elif paths is None:
             self._add_all()
+        else:
+            self._add_paths(paths)
 
         if not self._is_index_dirty() and not empty:
             self.logger.log_notice('There were no changes. Nothing to commit.')
@@ -114,9 +141,47 @@ class GitRepo(VCSRepo):
         self._commit(message, allow_empty=empty)
         self._push()
 
-    def _reset_to_head(self):
-        self._run_command('git reset --hard')
-        self._run_command('git clean -dxf')
+    def _changed_paths(self):
+        """
+        Return the paths that differ from HEAD in the index or the working
+        tree, untracked files included.
+        """
+        output, _, _ = self._run_command(
+            'git status --porcelain -z --untracked-files=all')
+        changed = set()
+        entries = iter(output.split('\0'))
+        for entry in entries:
+            if not entry:
+                continue
+            changed.add(entry[3:])
+            if entry[0] in 'RC':
+                # A rename or copy is followed by the path it came from.
+                changed.add(next(entries))
+        return changed
+
+    def _reset_to_head(self, paths=None):
+        if paths is not None:
+            paths = set(os.path.normpath(path) for path in paths)
+            # Resetting the index would unstage changes to other paths and
+            # leave them in the working tree, so reset everything then.
+            if not self._changed_paths().issubset(paths):
+                paths = None
+
+        if paths is None:
+            self._run_command('git reset --hard')
+            self._run_command('git clean -dxf')
+            return
+
+        self._run_command('git reset -q')
+        for chunk, path_args in self._iter_path_args(paths):
+            tracked, _, _ = self._run_command('git ls-files -- ' + path_args)
+            tracked = tracked.splitlines()
+            if tracked:
+                self._run_command('git checkout -q -- ' + ' '.join(
+                    quote(path) for path in tracked))
+            for path in set(chunk).difference(tracked):
+                if os.path.lexists(path):
+                    os.remove(path)
 
     def _remove_all(self):
         self._run_command('git rm -rf .', ignore_failure=True)
@@ -127,21 +192,22 @@ class GitRepo(VCSRepo):
     def _add_all(self):
         self._run_command('git add -A .')
 
-    def _get_line_count_difference(self):
-        diff_ignore = (re.compile(r'--- \S'), re.compile(r'\+\+\+ \S'))
+    def _add_paths(self, paths):
+        for _, path_args in self._iter_path_args(paths):
+            self._run_command('git add -A -- ' + path_args)
 
-        output, _, _ = self._run_command('git diff --cached')
+    def _get_line_count_difference(self):
+        # Only staged changes are counted, so this covers exactly the paths
+        # that were added.
+        output, _, _ = self._run_command('git diff --cached --numstat')
 
-        added, removed = 0, 0
-        for line in output.split('\n'):
-            if any(regex.match(line) for regex in diff_ignore):
-                continue
-            if line.startswith('+'):
-                added += 1
-            elif line.startswith('-'):
-                removed += 1
+        difference = 0
+        for line in output.splitlines():
+            added, removed, _ = line.split('\t', 2)
+            if added != '-':  # Binary files have no line counts.
+                difference += int(added) - int(removed)
 
-        return added - removed
+        return difference
 
     def _commit(self, message, allow_empty=False):
         cmd = ('git commit' + (' --allow-empty' if allow_empty else '') +
@@ -84,8 +84,20 @@ class Ctnr(BaseModel, ObjectUrlMixin):
             {'name': 'description', 'datatype': 'string', 'editable': True},
         ]}
 
-    def build_legacy_classes(self, ip_type):
-        if ip_type == '4':
+    def build_legacy_classes(self, ip_type, data=None):
+        return ''.join(self.iter_legacy_classes(ip_type, data=data))
+
+    def iter_legacy_classes(self, ip_type, data=None):
+        """
+        Yield the pieces of this container's legacy classes, as returned by
+        :func:`build_legacy_classes`.
+
+        If `data` is a :class:`DHCPData`, render from it instead of querying
+        the database.
+        """
+        if data is not None:
+            ranges = data.get_legacy_ranges(self)
+        elif ip_type == '4':
             ranges = self.ranges.filter(
                 Q(range_type=DYNAMIC, dhcp_enabled=True) |
                 Q(start_str='10.255.255.255'), ip_type='4')
@@ -93,19 +105,20 @@ class Ctnr(BaseModel, ObjectUrlMixin):
             ranges = self.ranges.filter(
                 ip_type='6', range_type=DYNAMIC, dhcp_enabled=True)
 
-        build_str = ""
         for range_ in ranges:
             classname = '{0}:{1}:{2}'.format(
                 self.name, range_.start_str, range_.end_str)
-            build_str += (
+            yield (
                 'class "{0}" {{\n'
                 '\tmatch hardware;\n'
                 '}}\n'.format(classname))
-            clients = range_.dynamicinterface_set.filter(
-                system__ctnr=self, dhcp_enabled=True).exclude(mac=None)
+            if data is not None:
+                clients = data.get_legacy_clients(range_, self)
+            else:
+                clients = range_.dynamicinterface_set.filter(
+                    system__ctnr=self, dhcp_enabled=True).exclude(mac=None)
             for client in clients:
-                build_str += client.build_subclass(classname)
-        return build_str
+                yield client.build_subclass(classname)
 
 
 class CtnrUser(BaseModel, ObjectUrlMixin):
@@ -1,4 +1,13 @@
-from django.db import models
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import models, DEFAULT_DB_ALIAS
+from django.db.models import F
+
+
+# Tasks scheduled inside Task.batch() blocks, per thread.
+_batch = threading.local()
 
 
 class DNSManager(models.Manager):
@@ -6,12 +15,20 @@ class DNSManager(models.Manager):
         return super(DNSManager, self).get_queryset().filter(ttype='dns')
 
 
+class DHCPManager(models.Manager):
+    def get_queryset(self):
+        return super(DHCPManager, self).get_queryset().filter(ttype='dhcp')
+
+
 class Task(models.Model):
     task = models.CharField(max_length=255, blank=False)
     ttype = models.CharField(max_length=255, blank=False)
+    # How many times (or batches) the task was scheduled before it ran.
+    scheduled_count = models.PositiveIntegerField(default=1)
 
     objects = models.Manager()
     dns = DNSManager()
+    dhcp = DHCPManager()
 
     class Meta:
         app_label = 'cyder'
@@ -27,6 +44,123 @@ class Task(models.Model):
     def save(self):
         super(Task, self).save()
 
+    @staticmethod
+    def schedule(ttype, task):
+        """
+        Schedule a task unless it's already scheduled. Inside a
+        :func:`Task.batch` block, the task is written when the outermost
+        block ends.
+
+        Return False if the task was already scheduled in the current batch.
+        """
+        task = str(task)
+        pending = getattr(_batch, 'pending', None)
+        if pending is None:
+            Task.write_tasks([(ttype, task)])
+        elif (ttype, task) in pending:
+            return False
+        else:
+            pending.add((ttype, task))
+        return True
+
+    @staticmethod
+    def write_tasks(tasks):
+        """
+        Write each (ttype, task) pair that isn't already scheduled, and count
+        another request for each one that is.
+        """
+        by_ttype = defaultdict(set)
+        for ttype, task in tasks:
+            by_ttype[ttype].add(task)
+
+        # Read from the primary database even inside read_snapshot(), which
+        # would otherwise miss tasks written since the snapshot was taken.
+        db_tasks = Task.objects.using(DEFAULT_DB_ALIAS)
+        new_tasks = []
+        for ttype, ttype_tasks in by_ttype.iteritems():
+            scheduled = set(db_tasks.filter(ttype=ttype,
+                                            task__in=ttype_tasks)
+                                    .values_list('task', flat=True))
+            new_tasks.extend(Task(ttype=ttype, task=task)
+                             for task in ttype_tasks - scheduled)
+            if scheduled:
+                db_tasks.filter(ttype=ttype, task__in=scheduled).update(
+                    scheduled_count=F('scheduled_count') + 1)
+        if new_tasks:
+            db_tasks.bulk_create(new_tasks)
+
+    @staticmethod
+    def begin_batch():
+        depth = getattr(_batch, 'depth', 0)
+        if depth == 0:
+            _batch.pending = set()
+        _batch.depth = depth + 1
+
+    @staticmethod
+    def end_batch(write=True, force=False):
+        """
+        End the innermost batch, or every open batch if `force` is true. If
+        that ends the outermost one, write its tasks, unless `write` is
+        false.
+        """
+        depth = getattr(_batch, 'depth', 0)
+        if depth == 0:
+            return
+        if force:
+            depth = 1
+        _batch.depth = depth - 1
+        if depth == 1:
+            pending, _batch.pending = _batch.pending, None
+            if write and pending:
+                Task.write_tasks(pending)
+
+    @staticmethod
+    @contextmanager
+    def batch():
+        """
+        Collect the tasks scheduled in this block so each is written once,
+        when the outermost block ends. If the block raises, the tasks are
+        dropped along with the transaction they belong to.
+        """
+        Task.begin_batch()
+        try:
+            yield
+        except:
+            Task.end_batch(write=False)
+            raise
+        Task.end_batch()
+
     @staticmethod
     def schedule_zone_rebuild(soa):
-        Task(task=str(soa.pk), ttype='dns').save()
+        return Task.schedule('dns', soa.pk)
+
+    @staticmethod
+    def schedule_dhcp_build():
+        """
+        Schedule a DHCP build. Every change is coalesced into one 'rebuild'
+        task. A build claims it by renaming it to 'building' (see
+        :func:`Task.claim_dhcp_build`), so changes made while the build runs
+        schedule a new 'rebuild' task instead of being deleted with it.
+        """
+        return Task.schedule('dhcp', 'rebuild')
+
+    @staticmethod
+    def claim_dhcp_build():
+        """
+        Claim the pending DHCP build and return the ids of the tasks
+        claimed, including any claimed by earlier builds that weren't
+        pushed. Delete them with :func:`Task.finish_dhcp_build` once the
+        build is pushed.
+
+        Like :func:`Task.write_tasks`, this bypasses any open snapshot so it
+        sees the 'building' tasks it just claimed.
+        """
+        db_tasks = Task.dhcp.using(DEFAULT_DB_ALIAS)
+        db_tasks.filter(task='rebuild').update(task='building')
+        return list(db_tasks.filter(task='building')
+                            .values_list('pk', flat=True))
+
+    @staticmethod
+    def finish_dhcp_build(task_ids):
+        Task.dhcp.using(DEFAULT_DB_ALIAS).filter(
+            pk__in=task_ids, task='building').delete()
@@ -1,28 +1,142 @@
 from __future__ import unicode_literals
 
 import errno
+import hashlib
 import os
 import shlex
 import subprocess
 import sys
 import syslog
 import time
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from traceback import format_exception
 
 from cyder.base.mixins import MutexMixin
+from cyder.base.routers import read_snapshot
 from cyder.base.utils import (
-    copy_tree, dict_merge, Logger, run_command, set_attrs, shell_out)
+    copy_files, dict_merge, Logger, remove_dir_contents, run_command,
+    set_attrs, shell_out)
 from cyder.base.vcs import GitRepo
 
+from cyder.core.task.models import Task
 from cyder.core.utils import fail_mail
-from cyder.core.ctnr.models import Ctnr
-from cyder.cydhcp.network.models import Network
-from cyder.cydhcp.vrf.models import Vrf
-from cyder.cydhcp.workgroup.models import Workgroup
+from cyder.cydhcp.build.dhcp_data import DHCPData
 
 from cyder.settings import DHCPBUILD
 
 
+# The buffer size of the files the config is streamed to
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+def file_hash(path):
+    """Return the SHA-1 hash of the file at `path`, or None if it's missing."""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except IOError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+
+
+def write_file(data, stage_dir, prod_dir, target_file, shard_dir=None):
+    """
+    Write the dhcpd config rendered from `data` to `target_file` in
+    `stage_dir`. The config is streamed to the file piece by piece, so it's
+    never held in memory.
+
+    If `shard_dir` is set, each block of the config goes in its own file in
+    a subdirectory of `shard_dir` for the IP type, and `target_file` only
+    includes them. The staged `target_file` includes the staged blocks, so
+    its syntax can be checked, and :func:`relocate_includes` points the
+    pushed copy at the blocks in prod. Every block is staged, but only those
+    whose file in `prod_dir` has different contents are pushed.
+
+    Return the paths of the files written and the files to remove from
+    `prod_dir`, relative to `stage_dir` and `prod_dir`.
+    """
+    if shard_dir is None:
+        with open(os.path.join(stage_dir, target_file), 'wb',
+                  WRITE_BUFFER_SIZE) as f:
+            for piece in data.iter_config():
+                f.write(piece.encode('utf-8'))
+        return [target_file], []
+
+    subdir = os.path.join(shard_dir, 'v' + data.ip_type)
+    stage_include_dir = stage_shard_dir(stage_dir, shard_dir)
+    stage_subdir = os.path.join(stage_dir, subdir)
+    prod_subdir = os.path.join(prod_dir, subdir)
+    if os.path.isdir(stage_subdir):
+        remove_dir_contents(stage_subdir)
+    else:
+        os.makedirs(stage_subdir)
+    if os.path.isdir(prod_subdir):
+        stale = set(os.listdir(prod_subdir))
+    else:
+        stale = set()
+
+    written = []
+    with open(os.path.join(stage_dir, target_file), 'wb') as target:
+        for name, pieces in data.iter_blocks():
+            fname = name + '.conf'
+            stage_fname = os.path.join(stage_subdir, fname)
+            block_hash = hashlib.sha1()
+            empty = True
+            with open(stage_fname, 'wb', WRITE_BUFFER_SIZE) as f:
+                for piece in pieces:
+                    piece = piece.encode('utf-8')
+                    block_hash.update(piece)
+                    f.write(piece)
+                    empty = empty and not piece
+            if empty:
+                os.remove(stage_fname)
+                continue
+
+            target.write('include "{0}";\n'.format(os.path.join(
+                stage_include_dir, 'v' + data.ip_type, fname))
+                .encode('utf-8'))
+            stale.discard(fname)
+            if (block_hash.hexdigest() !=
+                    file_hash(os.path.join(prod_subdir, fname))):
+                written.append(os.path.join(subdir, fname))
+    written.append(target_file)
+
+    return written, [os.path.join(subdir, stale_fname)
+                     for stale_fname in sorted(stale)]
+
+
+def stage_shard_dir(stage_dir, shard_dir):
+    """Return the absolute path of `shard_dir` in `stage_dir`."""
+    return os.path.join(os.path.abspath(stage_dir), shard_dir)
+
+
+def relocate_includes(path, old_dir, new_dir):
+    """
+    Rewrite the lines of the dhcpd config at `path` that include files
+    under `old_dir` to include them from `new_dir` instead.
+    """
+    old_prefix = 'include "{0}/'.format(old_dir)
+    new_prefix = 'include "{0}/'.format(new_dir)
+    with open(path, 'rb') as f:
+        lines = f.read().decode('utf-8').splitlines(True)
+    with open(path, 'wb', WRITE_BUFFER_SIZE) as f:
+        for line in lines:
+            if line.startswith(old_prefix):
+                line = new_prefix + line[len(old_prefix):]
+            f.write(line.encode('utf-8'))
+
+
+# The jobs given to the worker processes forked by
+# :func:`DHCPBuilder.write_files`
+_write_jobs = None
+
+
+def _write_file(index):
+    return write_file(*_write_jobs[index])
+
+
 class DHCPBuilder(MutexMixin, Logger):
     def __init__(self, *args, **kwargs):
         kwargs = dict_merge(DHCPBUILD, {
@@ -31,6 +145,10 @@ class DHCPBuilder(MutexMixin, Logger):
             'to_syslog': False,
         }, kwargs)
         set_attrs(self, kwargs)
+        self.dhcp_task_ids = []
+        self.built = False
+        self.written_files = []
+        self.removed_files = []
 
         self.repo = GitRepo(
             self.prod_dir, self.line_decrease_limit, self.line_increase_limit,
@@ -72,7 +190,12 @@ class DHCPBuilder(MutexMixin, Logger):
                            failure_logger=failure_logger,
                            failure_msg=failure_msg)
 
-    def build(self):
+    def build(self, force=False):
+        """
+        Build the v4 and v6 config files if DHCP data has changed since the
+        last push, or if `force` is true. Return whether they were built.
+        """
+        self.built = False
         try:
             with open(self.stop_file) as stop_fd:
                 now = time.time()
@@ -96,40 +219,118 @@ class DHCPBuilder(MutexMixin, Logger):
                 raise
 
         try:
-            for ip_type, files in (('4', self.files_v4), ('6', self.files_v6)):
-                self.log_info('Building v{}...'.format(ip_type))
-                with open(os.path.join(self.stage_dir, files['target_file']),
-                          'w') as f:
-                    for ctnr in Ctnr.objects.all():
-                        f.write(ctnr.build_legacy_classes(ip_type))
-                    for vrf in Vrf.objects.all():
-                        f.write(vrf.build_vrf(ip_type))
-                    for network in Network.objects.filter(
-                            ip_type=ip_type, enabled=True):
-                        f.write(network.build_subnet())
-                    for workgroup in Workgroup.objects.all():
-                        f.write(workgroup.build_workgroup(ip_type))
-
-                if files['check_file']:
-                    self.check_syntax(
-                        ip_type=ip_type, filename=files['check_file'])
+            # The pending build is claimed before the snapshot is taken, so
+            # the snapshot has every change it was scheduled for. Changes
+            # made after the claim schedule another build.
+            self.dhcp_task_ids = Task.claim_dhcp_build()
+            if not (self.dhcp_task_ids or force):
+                self.log_info('Nothing to build')
+                return False
+            # Both files are generated from the same snapshot, if there is
+            # one, so they agree with each other.
+            with read_snapshot(self.snapshot_db):
+                data_v4 = DHCPData('4')
+                data_v6 = DHCPData('6', shared=data_v4)
+            self.write_files([(data_v4, self.files_v4['target_file']),
+                              (data_v6, self.files_v6['target_file'])])
+
+            checks = [(ip_type, files['check_file'])
+                      for ip_type, files in (('4', self.files_v4),
+                                             ('6', self.files_v6))
+                      if files['check_file']]
+            # dhcpd runs in its own process, so threads are enough to run
+            # the checks at the same time.
+            pool = ThreadPool(max(len(checks), 1))
+            try:
+                pool.map(lambda check: self.check_syntax(*check), checks)
+            finally:
+                pool.close()
+                pool.join()
         except:
             self.log(syslog.LOG_ERR,
                 'DHCP build failed.\nOriginal exception: ' + e.message)
             raise
 
         self.log_info('DHCP build successful')
+        self.built = True
+        return True
+
+    def write_files(self, files):
+        """
+        Render each :class:`DHCPData` in `files`, a list of (data, target
+        file) pairs, with :func:`write_file`. When `jobs` is greater than
+        one, the files are rendered at the same time by forked worker
+        processes, which inherit the loaded data.
+
+        The files written and the files to remove are recorded for
+        :func:`push`.
+        """
+        global _write_jobs
+
+        for data, _ in files:
+            self.log_info('Building v{}...'.format(data.ip_type))
+
+        jobs = [(data, self.stage_dir, self.prod_dir, target_file,
+                 self.shard_dir)
+                for data, target_file in files]
+        if self.jobs > 1 and len(jobs) > 1:
+            # The workers don't query the database, so they can't disturb
+            # the connections they inherit.
+            _write_jobs = jobs
+            pool = Pool(min(self.jobs, len(jobs)))
+            try:
+                results = pool.map(_write_file, range(len(jobs)))
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+                _write_jobs = None
+        else:
+            results = [write_file(*job) for job in jobs]
+
+        self.written_files = []
+        self.removed_files = []
+        for written, removed in results:
+            self.written_files.extend(written)
+            self.removed_files.extend(removed)
+        self.log_debug('{0} files written, {1} to remove'.format(
+            len(self.written_files), len(self.removed_files)))
 
     def push(self, sanity_check=True):
-        self.repo.reset_and_pull()
+        """
+        Copy the generated config files to prod_dir, and commit and push
+        them. Only those files are reset, copied and added. Then delete the
+        tasks the build was started for.
+
+        If the last build didn't build anything, there's nothing to push.
+        """
+        if not self.built:
+            self.log_info('Nothing to push')
+            return
+
+        targets = self.written_files + self.removed_files
+        self.repo.reset_and_pull(targets)
 
         try:
-            copy_tree(self.stage_dir, self.prod_dir)
+            copy_files(self.stage_dir, self.prod_dir, self.written_files)
+            if self.shard_dir is not None:
+                # The staged target files include the staged blocks.
+                for files in (self.files_v4, self.files_v6):
+                    relocate_includes(
+                        os.path.join(self.prod_dir, files['target_file']),
+                        stage_shard_dir(self.stage_dir, self.shard_dir),
+                        self.shard_include_dir or self.shard_dir)
+            for rel_path in self.removed_files:
+                os.remove(os.path.join(self.prod_dir, rel_path))
+            self.repo.commit_and_push('Update config',
+                                      sanity_check=sanity_check, paths=targets)
         except:
-            self.repo.reset_to_head()
+            self.repo.reset_to_head(targets)
             raise
 
-        self.repo.commit_and_push('Update config', sanity_check=sanity_check)
+        Task.finish_dhcp_build(self.dhcp_task_ids)
 
     def check_syntax(self, ip_type, filename):
         out, err, ret = run_command("{} -{} -t -cf {}".format(
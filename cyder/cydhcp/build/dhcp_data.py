@@ -0,0 +1,194 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from django.db.models import Q
+
+from cyder.base.eav.constants import ATTRIBUTE_OPTION, ATTRIBUTE_STATEMENT
+from cyder.core.ctnr.models import Ctnr
+from cyder.cydhcp.constants import DYNAMIC
+from cyder.cydhcp.interface.dynamic_intr.models import DynamicInterface
+from cyder.cydhcp.interface.static_intr.models import StaticInterface
+from cyder.cydhcp.network.models import Network, NetworkAV
+from cyder.cydhcp.range.models import Range, RangeAV
+from cyder.cydhcp.vrf.models import Vrf
+from cyder.cydhcp.workgroup.models import Workgroup, WorkgroupAV
+
+
+def avs_by_entity(queryset):
+    """
+    Return a dict mapping (entity id, attribute type) to a list of AVs, in
+    the AV model's order.
+    """
+    avs = defaultdict(list)
+    for av in queryset.select_related('attribute'):
+        avs[(av.entity_id, av.attribute.attribute_type)].append(av)
+    return avs
+
+
+class DHCPData(object):
+    """
+    Everything a DHCP build of one IP type needs, loaded in a constant
+    number of queries and indexed so that
+    :func:`Ctnr.build_legacy_classes`, :func:`Vrf.build_vrf`,
+    :func:`Network.build_subnet` and :func:`Workgroup.build_workgroup` can
+    render from memory. Each of those methods takes one of these as its
+    `data` argument.
+
+    The containers, VRFs and workgroups don't depend on the IP type. If
+    `shared` is another :class:`DHCPData`, they're taken from it instead of
+    being loaded again.
+    """
+
+    def __init__(self, ip_type, shared=None):
+        self.ip_type = ip_type
+
+        if shared is not None:
+            self.ctnrs = shared.ctnrs
+            self.vrfs = shared.vrfs
+            self.workgroups = shared.workgroups
+            self.workgroup_avs = shared.workgroup_avs
+        else:
+            self.ctnrs = list(Ctnr.objects.all())
+            self.vrfs = list(Vrf.objects.all())
+            self.workgroups = list(Workgroup.objects.all())
+            self.workgroup_avs = avs_by_entity(WorkgroupAV.objects.all())
+
+        networks = list(Network.objects.filter(ip_type=ip_type)
+                                       .order_by('pk'))
+        self.subnets = [n for n in networks if n.enabled]
+        self.networks_by_vrf = defaultdict(list)
+        for network in networks:
+            self.networks_by_vrf[network.vrf_id].append(network)
+
+        ranges = list(Range.objects.filter(network__ip_type=ip_type)
+                                   .select_related('network__vrf', 'domain')
+                                   .order_by('pk'))
+        self.ranges_by_network = defaultdict(list)
+        for range_ in ranges:
+            self.ranges_by_network[range_.network_id].append(range_)
+
+        self.ctnrs_by_range = defaultdict(list)
+        self.legacy_ranges_by_ctnr = defaultdict(list)
+        if ip_type == '4':
+            legacy_q = (Q(range__range_type=DYNAMIC,
+                          range__dhcp_enabled=True) |
+                        Q(range__start_str='10.255.255.255'))
+        else:
+            legacy_q = Q(range__range_type=DYNAMIC, range__dhcp_enabled=True)
+        ctnr_ranges = (Ctnr.ranges.through.objects
+                       .filter(range__ip_type=ip_type)
+                       .select_related('ctnr', 'range')
+                       .order_by('range', 'ctnr'))
+        legacy_pks = set(ctnr_ranges.filter(legacy_q)
+                                    .values_list('pk', flat=True))
+        for ctnr_range in ctnr_ranges:
+            self.ctnrs_by_range[ctnr_range.range_id].append(ctnr_range.ctnr)
+            if ctnr_range.pk in legacy_pks:
+                self.legacy_ranges_by_ctnr[ctnr_range.ctnr_id].append(
+                    ctnr_range.range)
+
+        self.network_avs = avs_by_entity(
+            NetworkAV.objects.filter(entity__ip_type=ip_type))
+        self.range_avs = avs_by_entity(
+            RangeAV.objects.filter(entity__ip_type=ip_type))
+
+        self.dynamic_by_range = defaultdict(list)
+        self.dynamic_by_workgroup = defaultdict(list)
+        for client in (DynamicInterface.objects
+                       .filter(range__ip_type=ip_type, dhcp_enabled=True)
+                       .select_related('system', 'range__domain')
+                       .order_by('pk')):
+            self.dynamic_by_range[client.range_id].append(client)
+            self.dynamic_by_workgroup[client.workgroup_id].append(client)
+
+        self.static = list(StaticInterface.objects
+                           .filter(ip_type=ip_type, dhcp_enabled=True)
+                           .order_by('ip_upper', 'ip_lower', 'pk'))
+        self.static_keys = [(s.ip_upper, s.ip_lower) for s in self.static]
+        self.static_by_workgroup = defaultdict(list)
+        for client in sorted(self.static, key=lambda s: s.pk):
+            self.static_by_workgroup[client.workgroup_id].append(client)
+
+    def get_avs(self, entity, attribute_type):
+        if isinstance(entity, Network):
+            avs = self.network_avs
+        elif isinstance(entity, Range):
+            avs = self.range_avs
+        else:
+            avs = self.workgroup_avs
+        return avs.get((entity.pk, attribute_type), [])
+
+    def get_options(self, entity):
+        return self.get_avs(entity, ATTRIBUTE_OPTION)
+
+    def get_statements(self, entity):
+        return self.get_avs(entity, ATTRIBUTE_STATEMENT)
+
+    def get_legacy_ranges(self, ctnr):
+        return self.legacy_ranges_by_ctnr[ctnr.pk]
+
+    def get_legacy_clients(self, range_, ctnr):
+        return [c for c in self.dynamic_by_range[range_.pk]
+                if c.system.ctnr_id == ctnr.pk and c.mac is not None]
+
+    def get_range_ctnrs(self, range_):
+        return self.ctnrs_by_range[range_.pk]
+
+    def get_vrf_networks(self, vrf):
+        return self.networks_by_vrf[vrf.pk]
+
+    def get_ranges(self, network):
+        return self.ranges_by_network[network.pk]
+
+    def get_subnet_ranges(self, network):
+        return [r for r in self.ranges_by_network[network.pk]
+                if r.range_type == DYNAMIC and r.dhcp_enabled]
+
+    def get_static_clients(self, range_):
+        """
+        Return the DHCP-enabled static interfaces whose addresses are in
+        `range_`, matching :func:`Range.staticinterfaces`.
+        """
+        if range_.ip_type != self.ip_type:
+            return []
+        if range_.start_upper == range_.end_upper:
+            lo = bisect_left(self.static_keys,
+                             (range_.start_upper, range_.start_lower))
+            hi = bisect_right(self.static_keys,
+                              (range_.end_upper, range_.end_lower))
+        else:
+            lo = bisect_left(self.static_keys, (range_.start_upper + 1,))
+            hi = bisect_left(self.static_keys, (range_.end_upper,))
+        return sorted(self.static[lo:hi], key=lambda s: s.pk)
+
+    def get_dynamic_clients(self, range_):
+        return self.dynamic_by_range[range_.pk]
+
+    def get_workgroup_clients(self, workgroup):
+        return (self.dynamic_by_workgroup[workgroup.pk],
+                self.static_by_workgroup[workgroup.pk])
+
+    def iter_blocks(self):
+        """
+        Yield (name, pieces) for each block of this IP type's dhcpd config,
+        in order: each container's legacy classes, each VRF's class, each
+        subnet and each workgroup. `pieces` is an iterator over the block's
+        text, which may be empty.
+        """
+        for ctnr in self.ctnrs:
+            yield ('ctnr-{0}'.format(ctnr.pk),
+                   ctnr.iter_legacy_classes(self.ip_type, self))
+        for vrf in self.vrfs:
+            yield 'vrf-{0}'.format(vrf.pk), vrf.iter_vrf(self.ip_type, self)
+        for network in self.subnets:
+            yield ('subnet-{0}'.format(network.pk),
+                   network.iter_subnet(data=self))
+        for workgroup in self.workgroups:
+            yield ('workgroup-{0}'.format(workgroup.pk),
+                   workgroup.iter_workgroup(self.ip_type, self))
+
+    def iter_config(self):
+        """Yield the pieces of this IP type's dhcpd config file."""
+        for _, pieces in self.iter_blocks():
+            for piece in pieces:
+                yield piece
@@ -0,0 +1,40 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from cyder.core.ctnr.models import Ctnr
+from cyder.core.system.models import System
+from cyder.core.task.models import Task
+from cyder.cydhcp.interface.dynamic_intr.models import DynamicInterface
+from cyder.cydhcp.interface.static_intr.models import StaticInterface
+from cyder.cydhcp.network.models import Network, NetworkAV
+from cyder.cydhcp.range.models import Range, RangeAV
+from cyder.cydhcp.vrf.models import Vrf, VrfAV
+from cyder.cydhcp.workgroup.models import Workgroup, WorkgroupAV
+from cyder.settings import MIGRATING
+
+
+# Models whose rows end up in the dhcpd config. Containers and systems are
+# included because their names and ranges are used in legacy classes and
+# host options.
+DHCP_MODELS = (
+    Ctnr, System, DynamicInterface, StaticInterface, Network, NetworkAV,
+    Range, RangeAV, Vrf, VrfAV, Workgroup, WorkgroupAV,
+)
+
+
+def schedule_dhcp_build(sender, instance, **kwargs):
+    if MIGRATING:
+        return
+    Task.schedule_dhcp_build()
+
+
+def schedule_dhcp_build_m2m(sender, instance, action, **kwargs):
+    if MIGRATING:
+        return
+    if action.startswith('post_'):
+        Task.schedule_dhcp_build()
+
+
+for model in DHCP_MODELS:
+    post_save.connect(schedule_dhcp_build, sender=model)
+    post_delete.connect(schedule_dhcp_build, sender=model)
+m2m_changed.connect(schedule_dhcp_build_m2m, sender=Ctnr.ranges.through)
@@ -1,16 +1,23 @@
 import os
+from distutils.spawn import find_executable
+from django.db import connection
 from django.test import TestCase
+from django.utils.unittest import skipUnless
 
 from cyder.base.eav.models import Attribute
 from cyder.base.utils import copy_tree, remove_dir_contents
 from cyder.base.vcs import GitRepo, GitRepoManager, SanityCheckFailure
 
+from cyder.core.ctnr.models import Ctnr
 from cyder.core.system.models import System
+from cyder.core.task.models import Task
 
 from cyder.cydhcp.build.builder import DHCPBuilder
 from cyder.cydhcp.interface.dynamic_intr.models import DynamicInterface
 from cyder.cydhcp.network.models import Network, NetworkAV
 from cyder.cydhcp.range.models import Range
+from cyder.cydhcp.vrf.models import Vrf
+from cyder.cydhcp.workgroup.models import Workgroup
 
 
 DHCPBUILD = {
@@ -93,6 +100,37 @@ class DHCPBuildTest(TestCase):
 
         self.assertNotEqual(rev2, rev3)
 
+    def test_nothing_to_build(self):
+        """Test that a build is skipped when no DHCP data has changed since
+        the last push"""
+        self.assertTrue(self.builder.build())
+        self.builder.push(sanity_check=False)
+        self.assertFalse(Task.dhcp.exists())
+
+        self.assertFalse(self.builder.build())
+        self.assertTrue(self.builder.build(force=True))
+
+        DynamicInterface.objects.create(
+            system=System.objects.get(name='Test_system_5'),
+            mac='ab:cd:ef:ab:cd:ef',
+            range=Range.objects.get(name='Test range 1'),
+        )
+        self.assertTrue(Task.dhcp.exists())
+        self.assertTrue(self.builder.build())
+
+    def test_change_during_build(self):
+        """Test that a change made while a build runs is built next time"""
+        self.assertTrue(self.builder.build())
+        DynamicInterface.objects.create(
+            system=System.objects.get(name='Test_system_5'),
+            mac='ab:cd:ef:ab:cd:ef',
+            range=Range.objects.get(name='Test range 1'),
+        )
+        self.builder.push(sanity_check=False)
+        self.assertEqual(list(Task.dhcp.values_list('task', flat=True)),
+                         ['rebuild'])
+        self.assertTrue(self.builder.build())
+
     def test_sanity_check_increase(self):
         """Test sanity check when line count increases"""
 
@@ -148,3 +186,127 @@ class DHCPBuildTest(TestCase):
         self.builder.repo.line_decrease_limit = 100
         self.builder.build()
         self.builder.push(sanity_check=True)
+
+    def build_query_count(self):
+        connection.use_debug_cursor = True
+        try:
+            start = len(connection.queries)
+            self.builder.build()
+            return len(connection.queries) - start
+        finally:
+            connection.use_debug_cursor = None
+
+    def test_bulk_build(self):
+        """Test that the number of queries a build makes doesn't depend on
+        the number of hosts, and that it renders the same config as building
+        each object from its own queries"""
+        queries = self.build_query_count()
+
+        system = System.objects.get(name='Test_system_5')
+        range_ = Range.objects.get(name='Test range 1')
+        for i in xrange(10):
+            DynamicInterface.objects.create(
+                system=system, range=range_,
+                workgroup=Workgroup.objects.get(name='Test workgroup'),
+                mac='ab:cd:ef:ab:cd:{0:02x}'.format(i))
+
+        self.assertEqual(self.build_query_count(), queries)
+
+        for ip_type, files in (('4', DHCPBUILD['files_v4']),
+                               ('6', DHCPBUILD['files_v6'])):
+            expected = ''
+            for ctnr in Ctnr.objects.all():
+                expected += ctnr.build_legacy_classes(ip_type)
+            for vrf in Vrf.objects.all():
+                expected += vrf.build_vrf(ip_type)
+            for network in Network.objects.filter(ip_type=ip_type,
+                                                  enabled=True):
+                expected += network.build_subnet()
+            for workgroup in Workgroup.objects.all():
+                expected += workgroup.build_workgroup(ip_type)
+
+            with open(os.path.join(DHCPBUILD['stage_dir'],
+                                   files['target_file'])) as f:
+                self.assertEqual(f.read(), expected)
+
+    def test_parallel_build(self):
+        """Test that rendering the v4 and v6 files at the same time gives
+        the same files as rendering them one after the other"""
+        self.builder.build()
+        expected = {}
+        for files in (DHCPBUILD['files_v4'], DHCPBUILD['files_v6']):
+            with open(os.path.join(DHCPBUILD['stage_dir'],
+                                   files['target_file'])) as f:
+                expected[files['target_file']] = f.read()
+            os.remove(os.path.join(DHCPBUILD['stage_dir'],
+                                   files['target_file']))
+
+        self.builder.jobs = 2
+        self.builder.build()
+        for target_file, contents in expected.iteritems():
+            with open(os.path.join(DHCPBUILD['stage_dir'],
+                                   target_file)) as f:
+                self.assertEqual(f.read(), contents)
+
+    def test_sharded_build(self):
+        """Test that a sharded build includes the same config as a normal
+        build, and only writes the blocks that changed"""
+        self.builder.build()
+        with open(os.path.join(DHCPBUILD['stage_dir'], 'dhcpd.conf')) as f:
+            expected = f.read()
+
+        self.builder.shard_dir = 'dhcpd.d'
+        self.builder.build()
+        self.builder.push(sanity_check=False)
+        contents = ''
+        with open(os.path.join(DHCPBUILD['prod_dir'], 'dhcpd.conf')) as f:
+            for line in f:
+                self.assertTrue(line.startswith('include "dhcpd.d/v4/'))
+                with open(os.path.join(DHCPBUILD['prod_dir'],
+                                       line.split('"')[1])) as block:
+                    contents += block.read()
+        self.assertEqual(contents, expected)
+
+        network = Network.objects.get(network_str='192.168.0.0/16')
+        NetworkAV.objects.create(
+            entity=network,
+            attribute=Attribute.objects.get(attribute_type='o',
+                                            name='routers'),
+            value='192.168.0.1',
+        )
+        self.builder.build()
+        self.assertEqual(
+            sorted(self.builder.written_files),
+            ['dhcpd.conf', 'dhcpd.conf.6',
+             'dhcpd.d/v4/subnet-{0}.conf'.format(network.pk)])
+        self.assertEqual(self.builder.removed_files, [])
+        self.builder.push(sanity_check=False)
+
+    @skipUnless(find_executable('dhcpd'), 'dhcpd is not installed')
+    def test_sharded_syntax_check(self):
+        """Test that a sharded build's syntax check reads the staged blocks,
+        including the ones that didn't change"""
+        self.builder.shard_dir = 'dhcpd.d'
+        self.builder.shard_include_dir = '/etc/dhcp/dhcpd.d'
+        self.builder.files_v4 = {
+            'target_file': 'dhcpd.conf.data',
+            'check_file': 'dhcpd.conf',
+        }
+        self.assertTrue(self.builder.build())
+        self.builder.push(sanity_check=False)
+        with open(os.path.join(DHCPBUILD['prod_dir'],
+                               'dhcpd.conf.data')) as f:
+            for line in f:
+                self.assertTrue(line.startswith('include "/etc/dhcp/dhcpd.d/'))
+
+        # No block changed, so none is pushed, but all are checked.
+        self.assertTrue(self.builder.build(force=True))
+        self.assertEqual(sorted(self.builder.written_files),
+                         ['dhcpd.conf.6', 'dhcpd.conf.data'])
+
+        block_dir = os.path.join(DHCPBUILD['stage_dir'], 'dhcpd.d', 'v4')
+        with open(os.path.join(block_dir,
+                               sorted(os.listdir(block_dir))[0]), 'a') as f:
+            f.write('this is not valid;\n')
+        self.assertRaises(Exception, self.builder.check_syntax, '4',
+                          'dhcpd.conf')
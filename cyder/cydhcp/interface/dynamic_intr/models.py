@@ -15,6 +15,7 @@ from cyder.core.system.models import System
 from cyder.cydhcp.constants import DEFAULT_WORKGROUP
 from cyder.cydhcp.interface.dynamic_intr.validation import is_dynamic_range
 from cyder.cydhcp.range.models import Range
+from cyder.cydhcp.range.utils import update_dynamic_usage
 from cyder.cydhcp.utils import format_mac, join_dhcp_args
 from cyder.cydhcp.workgroup.models import Workgroup
 from cyder.cydhcp.validation import validate_system_dynamic_ctnr
@@ -119,27 +120,25 @@ class DynamicInterface(BaseModel, ObjectUrlMixin, ExpirableMixin):
     def delete(self, *args, **kwargs):
         delete_system = kwargs.pop('delete_system', True)
         update_range_usage = kwargs.pop('update_range_usage', True)
-        rng = self.range
         if delete_system:
             if (not self.system.dynamicinterface_set.exclude(
                     id=self.id).exists() and
                     not self.system.staticinterface_set.exists()):
                 self.system.delete(commit=False)
         super(DynamicInterface, self).delete()
-        if rng and update_range_usage:
-            rng.save(commit=False)
+        if update_range_usage:
+            update_dynamic_usage((self.range, self.dhcp_enabled), None)
 
     @transaction_atomic
     def save(self, *args, **kwargs):
         self.full_clean()
 
         update_range_usage = kwargs.pop('update_range_usage', True)
-        old_range = None
+        old = None
         if self.id is not None:
-            old_range = DynamicInterface.objects.get(id=self.id).range
+            old = DynamicInterface.objects.get(id=self.id)
+            old = (old.range, old.dhcp_enabled)
 
         super(DynamicInterface, self).save()
-        if self.range and update_range_usage:
-            self.range.save(commit=False)
-            if old_range:
-                old_range.save(commit=False)
+        if update_range_usage:
+            update_dynamic_usage(old, (self.range, self.dhcp_enabled))
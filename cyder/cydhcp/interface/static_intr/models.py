@@ -16,7 +16,7 @@ from cyder.base.models import ExpirableMixin
 from cyder.base.utils import transaction_atomic
 from cyder.core.system.models import System
 from cyder.cydhcp.constants import (STATIC, DEFAULT_WORKGROUP)
-from cyder.cydhcp.range.utils import find_range
+from cyder.cydhcp.range.utils import find_range, update_static_usage
 from cyder.cydhcp.utils import format_mac, join_dhcp_args
 from cyder.cydhcp.workgroup.models import Workgroup
 from cyder.cydhcp.validation import validate_system_static_ctnr
@@ -134,22 +134,18 @@ class StaticInterface(BaseAddressRecord, BasePTR, ExpirableMixin):
         self.full_clean()
 
         update_range_usage = kwargs.pop('update_range_usage', True)
-        old_range = None
+        old_ip = None
         if self.id is not None:
-            old_range = StaticInterface.objects.get(id=self.id).range
+            old = StaticInterface.objects.get(id=self.id)
+            old_ip = (old.ip_str, old.ip_type)
 
         super(StaticInterface, self).save(*args, **kwargs)
         self.schedule_zone_rebuild()
         if update_range_usage:
-            new_range = self.range
-            if new_range:
-                new_range.save(commit=False)
-            if old_range:
-                old_range.save(commit=False)
+            update_static_usage(old_ip, (self.ip_str, self.ip_type))
 
     @transaction_atomic
     def delete(self, *args, **kwargs):
-        rng = self.range
         update_range_usage = kwargs.pop('update_range_usage', True)
         delete_system = kwargs.pop('delete_system', True)
 
@@ -160,8 +156,8 @@ class StaticInterface(BaseAddressRecord, BasePTR, ExpirableMixin):
                 self.system.delete(commit=False)
 
         super(StaticInterface, self).delete(*args, **kwargs)
-        if rng and update_range_usage:
-            rng.save(commit=False)
+        if update_range_usage:
+            update_static_usage((self.ip_str, self.ip_type), None)
 
     def schedule_zone_rebuild(self):
         if self.domain.soa is not None:
@@ -219,13 +219,29 @@ class Network(BaseModel, ObjectUrlMixin):
             networks = self.get_related_networks()
         return set([network.site for network in networks]).discard(None)
 
-    def build_subnet(self, raw=False):
+    def build_subnet(self, raw=False, data=None):
+        return ''.join(self.iter_subnet(raw=raw, data=data))
+
+    def iter_subnet(self, raw=False, data=None):
+        """
+        Yield the pieces of this network's subnet block, as returned by
+        :func:`build_subnet`.
+
+        If `data` is a :class:`DHCPData`, render from it instead of querying
+        the database.
+        """
         self.update_network()
-        statements = self.networkav_set.filter(
-            attribute__attribute_type=ATTRIBUTE_STATEMENT)
-        options = self.networkav_set.filter(
-            attribute__attribute_type=ATTRIBUTE_OPTION)
-        ranges = self.range_set.filter(range_type=DYNAMIC, dhcp_enabled=True)
+        if data is not None:
+            statements = data.get_statements(self)
+            options = data.get_options(self)
+            ranges = data.get_subnet_ranges(self)
+        else:
+            statements = self.networkav_set.filter(
+                attribute__attribute_type=ATTRIBUTE_STATEMENT)
+            options = self.networkav_set.filter(
+                attribute__attribute_type=ATTRIBUTE_OPTION)
+            ranges = self.range_set.filter(range_type=DYNAMIC,
+                                           dhcp_enabled=True)
         if self.ip_type == IP_TYPE_4:
             build_str = "\nsubnet {0} netmask {1} {{\n".format(
                 self.network.network, self.network.netmask)
@@ -240,10 +256,10 @@ class Network(BaseModel, ObjectUrlMixin):
             if self.dhcpd_raw_include:
                 build_str += "\t# Raw network options\n"
                 build_str += join_dhcp_args(self.dhcpd_raw_include.split("\n"))
+        yield build_str
         for range_ in ranges:
-            build_str += range_.build_range()
-        build_str += "}\n"
-        return build_str
+            yield range_.build_range(data=data)
+        yield "}\n"
 
     def get_related(self):
         related_networks = self.get_related_networks()
@@ -1,17 +1,33 @@
 from django.shortcuts import get_object_or_404
 
+import ipaddr
+
 from cyder.base.views import cy_detail
 from cyder.cydhcp.network.models import Network
 from cyder.cydhcp.network.utils import calc_networks
+from cyder.cydhcp.range.occupancy import DETAIL_MAP_SIZE, OccupancyMap
 
 
 def network_detail(request, pk):
     network = get_object_or_404(Network, pk=pk)
     parent_networks, child_networks = calc_networks(network)
+    largest_free = None
+    try:
+        occupancy = OccupancyMap.for_network(network,
+                                             max_size=DETAIL_MAP_SIZE)
+    except ValueError:  # Too big to map
+        occupancy = None
+    else:
+        block = occupancy.largest_free_block()
+        if block:
+            largest_free = (ipaddr.IPAddress(block[0], int(network.ip_type)),
+                            ipaddr.IPAddress(block[1], int(network.ip_type)),
+                            block[1] - block[0] + 1)
 
     return cy_detail(request, Network, 'network/network_detail.html', {
         'Ranges': 'range_set',
         'Parent Networks': parent_networks,
         'Child Networks': child_networks,
         'Attributes': 'networkav_set',
-    }, obj=network)
+    }, obj=network, occupancy=occupancy,
+        largest_free=largest_free)
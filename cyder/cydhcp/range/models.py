@@ -1,7 +1,11 @@
 # encoding=utf-8
 
+import heapq
+from itertools import islice
+
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models
+from django.db.models import F, Q
 
 from cyder.base.constants import IP_TYPES, IP_TYPE_4, IP_TYPE_6
 from cyder.base.eav.constants import ATTRIBUTE_OPTION, ATTRIBUTE_STATEMENT
@@ -16,8 +20,9 @@ from cyder.cydhcp.constants import (ALLOW_OPTIONS, ALLOW_ANY, ALLOW_KNOWN,
                                     STATIC, DYNAMIC)
 from cyder.cydhcp.interface.static_intr.models import StaticInterface
 from cyder.cydhcp.network.models import Network
+from cyder.cydhcp.range.utils import count_static_used
 from cyder.cydhcp.utils import (IPFilter, four_to_two, join_dhcp_args,
-                                start_end_filter)
+                                one_to_two, start_end_filter, two_to_one)
 from cyder.cydns.models import ViewMixin
 from cyder.cydns.domain.models import Domain
 from cyder.cydns.address_record.models import AddressRecord
@@ -96,6 +101,11 @@ class Range(BaseModel, ViewMixin, ObjectUrlMixin):
     description = models.TextField(blank=True)
 
     range_usage = models.IntegerField(max_length=3, null=True, blank=True)
+    # The number of addresses used by address records, PTRs and static
+    # interfaces (for static ranges) or of DHCP-enabled dynamic interfaces
+    # (for dynamic ranges). Kept up to date by those objects; see
+    # :func:`add_used`.
+    used_count = models.IntegerField(default=0, editable=False)
 
     search_fields = ('start_str', 'end_str', 'name')
     sort_fields = ('start_lower', 'end_lower')
@@ -202,9 +212,30 @@ class Range(BaseModel, ViewMixin, ObjectUrlMixin):
 
         update_range_usage = kwargs.pop('update_range_usage', True)
         if update_range_usage:
-            self.range_usage = self.get_usage()
+            self.update_used_count()
         super(Range, self).save(*args, **kwargs)
 
+    def update_used_count(self):
+        """
+        Recount :attr:`used_count` if this range is new or its type or
+        bounds have changed. Otherwise the counter, which records keep up
+        to date as they're saved, is reread so a stale copy of it isn't
+        saved over it.
+        """
+        fields = ('range_type', 'ip_type', 'start_upper', 'start_lower',
+                  'end_upper', 'end_lower')
+        old = None
+        if self.pk is not None:
+            rows = Range.objects.filter(pk=self.pk).values_list(
+                'used_count', 'range_usage', *fields)
+            old = rows[0] if rows else None
+        if old is not None and old[2:] == tuple(getattr(self, f)
+                                                 for f in fields):
+            self.used_count, self.range_usage = old[:2]
+        else:
+            self.used_count = self.count_used()
+            self.range_usage = self.calc_usage(self.used_count)
+
     def clean(self):
         try:
             if self.ip_type == IP_TYPE_4:
@@ -281,7 +312,12 @@ class Range(BaseModel, ViewMixin, ObjectUrlMixin):
 
         super(Range, self).delete(*args, **kwargs)
 
-    def get_allow_deny_list(self):
+    def get_allow_deny_list(self, data=None):
+        if data is not None:
+            ctnrs = data.get_range_ctnrs(self)
+        else:
+            ctnrs = self.ctnr_set.all()
+
         if self.allow == ALLOW_ANY:
             allow = []
         elif self.allow == ALLOW_KNOWN:
@@ -290,7 +326,7 @@ class Range(BaseModel, ViewMixin, ObjectUrlMixin):
             allow += [
                 'allow members of "{0}:{1}:{2}"'.format(
                     ctnr.name, self.start_str, self.end_str)
-                for ctnr in self.ctnr_set.all()]
+                for ctnr in ctnrs]
         else:
             allow = []
             if self.allow == ALLOW_VRF:
@@ -300,7 +336,7 @@ class Range(BaseModel, ViewMixin, ObjectUrlMixin):
                 allow += [
                     'allow members of "{0}:{1}:{2}"'.format(
                         ctnr.name, self.start_str, self.end_str)
-                    for ctnr in self.ctnr_set.all()]
+                    for ctnr in ctnrs]
             if not allow:
                 allow += ['deny unknown-clients']
 
@@ -308,31 +344,45 @@ class Range(BaseModel, ViewMixin, ObjectUrlMixin):
 
     def check_for_overlaps(self):
         """
-        This function will look at all the other ranges and make sure we don't
-        overlap with any of them.
+        Make sure this range doesn't overlap any other range.
+
+        Since ranges don't overlap each other, if this range overlaps any of
+        them, it overlaps the one that starts last before this one ends. So
+        only that range is checked, and it's found with one lookup on the
+        (start_upper, start_lower, end_upper, end_lower) index.
         """
         self._range_ips()
 
-        for oldrange in Range.objects.all():
-            if oldrange.pk == self.pk:
-                continue
+        candidates = Range.objects.filter(
+            Q(start_upper__lt=self.end_upper) |
+            Q(start_upper=self.end_upper, start_lower__lte=self.end_lower))
+        if self.pk is not None:
+            candidates = candidates.exclude(pk=self.pk)
+        for oldrange in candidates.order_by('-start_upper',
+                                            '-start_lower')[:1]:
             oldrange._range_ips()
-            #the range being tested is above this range
-            if self._start > oldrange._end:
-                continue
-            # start > end
-            if self._end < oldrange._start:
+            # oldrange starts before this range ends, so they overlap unless
+            # it ends before this range starts.
+            if oldrange._end < self._start:
                 continue
             raise ValidationError(
                 u"Old range {0} would overlap with new range {1}".format(
                     oldrange.get_ip_str(padded=False),
                     self.get_ip_str(padded=False)))
 
-    def build_range(self):
-        range_options = self.rangeav_set.filter(
-            attribute__attribute_type=ATTRIBUTE_OPTION)
-        range_statements = self.rangeav_set.filter(
-            attribute__attribute_type=ATTRIBUTE_STATEMENT)
+    def build_range(self, data=None):
+        """
+        If `data` is a :class:`DHCPData`, render from it instead of querying
+        the database.
+        """
+        if data is not None:
+            range_options = data.get_options(self)
+            range_statements = data.get_statements(self)
+        else:
+            range_options = self.rangeav_set.filter(
+                attribute__attribute_type=ATTRIBUTE_OPTION)
+            range_statements = self.rangeav_set.filter(
+                attribute__attribute_type=ATTRIBUTE_STATEMENT)
         build_str = "\tpool {\n"
         build_str += "\t\t# Pool Statements\n"
         build_str += "\t\tfailover peer \"dhcp\";\n"
@@ -345,7 +395,8 @@ class Range(BaseModel, ViewMixin, ObjectUrlMixin):
             build_str += "\t\t# Raw pool includes\n"
             build_str += "\t\t{0};".format(self.dhcp_raw_include)
         build_str += "\t\t# Allow statements\n"
-        build_str += join_dhcp_args(self.get_allow_deny_list(), depth=2)
+        build_str += join_dhcp_args(self.get_allow_deny_list(data=data),
+                                    depth=2)
         if self.ip_type == IP_TYPE_4:
             build_str += "\t\trange {0} {1};\n".format(self.start_str,
                                                        self.end_str)
@@ -362,44 +413,78 @@ class Range(BaseModel, ViewMixin, ObjectUrlMixin):
                             object_=self)
 
     def get_usage(self):
-        if self.range_type == 'st':
-            from cyder.cydhcp.range.range_usage import range_usage
-            _, usage = range_usage(self.start_lower, self.end_lower,
-                                   self.ip_type)
+        return self.calc_usage(self.count_used())
+
+    def count_used(self):
+        """Count what :attr:`used_count` counts from scratch."""
+        if self.range_type == STATIC:
+            start, end = four_to_two(self.start_upper, self.start_lower,
+                                     self.end_upper, self.end_lower)
+            return count_static_used(start, end, self.ip_type)
         else:
             DynamicInterface = models.get_model('cyder', 'dynamicinterface')
-            used = float(DynamicInterface.objects.filter(
-                range=self, dhcp_enabled=True).count())
-            capacity = float(self.end_lower - self.start_lower + 1)
-            usage = (used/capacity)*100
+            return DynamicInterface.objects.filter(
+                range=self, dhcp_enabled=True).count()
+
+    def calc_usage(self, used):
+        """Return `used` as a percentage of this range's size."""
+        start, end = four_to_two(self.start_upper, self.start_lower,
+                                 self.end_upper, self.end_lower)
+        return int(float(used) / (end - start + 1) * 100)
 
-        return usage
+    @staticmethod
+    def add_used(pk, delta):
+        """
+        Add `delta` to the :attr:`used_count` of the range with primary key
+        `pk` and update its :attr:`range_usage`, without saving (and so
+        revalidating) the whole range.
+        """
+        Range.objects.filter(pk=pk).update(used_count=F('used_count') + delta)
+        rng = Range.objects.get(pk=pk)
+        Range.objects.filter(pk=pk).update(
+            range_usage=rng.calc_usage(rng.used_count))
 
     def get_next_ip(self):
         """Finds the most appropriate IP address within a range. If it can't
-        find an IP it returns None. If it finds an IP it returns an IPv4Address
-        object.
+        find an IP it returns None. If it finds an IP it returns an
+        IPv4Address or IPv6Address object.
 
-            :returns: ipaddr.IPv4Address
+            :returns: ipaddr.IPv4Address or ipaddr.IPv6Address
         """
-        if self.network.ip_type != '4':
-            return None
-        elif self.ip_type != '4':
-            return None
-
-        ip = find_free_ip(self.start_lower, self.end_lower, ip_type='4')
-        if ip:
-            return ip
-        else:
-            return None
+        ips = self.get_next_ips(1)
+        return ips[0] if ips else None
+
+    def get_next_ips(self, count):
+        """
+        Return up to `count` of the lowest free addresses in this range, as
+        IPv4Address or IPv6Address objects.
+        """
+        if self.network.ip_type != self.ip_type:
+            return []
+
+        start, end = four_to_two(self.start_upper, self.start_lower,
+                                 self.end_upper, self.end_lower)
+        return find_free_ips(start, end, ip_type=self.ip_type, count=count)
 
     def bind_render_record(self, **kwargs):
+        return "\n".join(self.iter_generate(**kwargs))
+
+    def iter_generate(self, **kwargs):
+        """
+        Yield the $GENERATE directives that cover this range one at a time.
+        """
         if self.range_type == STATIC or self.ip_type == IP_TYPE_6:
-            return ""
+            return
 
         DEFAULT_TTL = 3600
         reverse = kwargs.pop('reverse', False)
-        built = ""
+        if reverse:
+            template = ("$GENERATE {3:>3}-{4:<3}  {1:44} {2}  "
+                        "IN  PTR     {0}")
+        else:
+            template = ("$GENERATE {3:>3}-{4:<3}  {0:44} {2}  "
+                        "IN  A       {1}")
+
         start = map(int, self.start_str.split("."))
         end = map(int, self.end_str.split("."))
         for a in range(start[0], end[0] + 1):
@@ -414,58 +499,176 @@ class Range(BaseModel, ViewMixin, ObjectUrlMixin):
                     host = "{0}-{1}-{2}-$.{3}.".format(a, b, c, self.domain)
                     if reverse:
                         ip = "$.{2}.{1}.{0}.in-addr.arpa.".format(a, b, c)
-                        template = ("$GENERATE {3:>3}-{4:<3}  {1:44} {2}  "
-                                    "IN  PTR     {0}")
                     else:
                         ip = "{0}.{1}.{2}.$".format(a, b, c)
-                        template = ("$GENERATE {3:>3}-{4:<3}  {0:44} {2}  "
-                                    "IN  A       {1}")
 
-                    rec = template.format(host, ip, DEFAULT_TTL, d1, d2)
-                    built = "\n".join([built, rec]).strip()
+                    yield template.format(host, ip, DEFAULT_TTL, d1, d2)
 
-        return built
 
+def ip_range_q(start, end, ip_type):
+    """
+    Return a Q object matching the objects whose addresses are between the
+    integers `start` and `end`, inclusive.
+    """
+    start_upper, start_lower = one_to_two(start)
+    end_upper, end_lower = one_to_two(end)
+    if start_upper == end_upper:
+        q = Q(ip_upper=start_upper, ip_lower__gte=start_lower,
+              ip_lower__lte=end_lower)
+    else:
+        q = (Q(ip_upper=start_upper, ip_lower__gte=start_lower) |
+             Q(ip_upper__gt=start_upper, ip_upper__lt=end_upper) |
+             Q(ip_upper=end_upper, ip_lower__lte=end_lower))
+    return q & Q(ip_type=ip_type)
 
-def find_free_ip(start, end, ip_type='4'):
-    """Given start and end numbers, find a free IP.
+
+def iter_used_ips(start, end, ip_type):
+    """
+    Yield the addresses between `start` and `end` used by address records,
+    PTRs and static interfaces, in order, as integers. An address used more
+    than once is yielded more than once. Each model's addresses are sorted
+    by the database in a single query.
+    """
+    q = ip_range_q(start, end, ip_type)
+    used = [model.objects.filter(q).order_by('ip_upper', 'ip_lower')
+                         .values_list('ip_upper', 'ip_lower').iterator()
+            for model in (AddressRecord, PTR, StaticInterface)]
+    for upper, lower in heapq.merge(*used):
+        yield two_to_one(upper, lower)
+
+
+def iter_free_ips(start, end, ip_type):
+    """
+    Yield the free addresses between `start` and `end`, in order, as
+    integers, by walking every used address before the last free one taken.
+    :func:`find_free_ips` only uses this when `start` and `end` have
+    different upper halves, which :func:`iter_gap_ips` can't handle.
+    """
+    candidate = start
+    for used in iter_used_ips(start, end, ip_type):
+        while candidate < used:
+            yield candidate
+            candidate += 1
+        candidate = max(candidate, used + 1)
+    while candidate <= end:
+        yield candidate
+        candidate += 1
+
+
+# The first address of each run of free addresses in a range is either the
+# range's first address or just after a used one, so only those candidates
+# are checked, in the database. Only used addresses below the range's last
+# address are candidates, so adding one can't overflow.
+GAP_STARTS_SQL = """
+SELECT c.ip FROM (
+    SELECT %s AS ip
+    UNION
+    SELECT ip_lower + 1 FROM {address_record} WHERE {bounds}
+    UNION
+    SELECT ip_lower + 1 FROM {ptr} WHERE {bounds}
+    UNION
+    SELECT ip_lower + 1 FROM {static_interface} WHERE {bounds}
+) c
+WHERE NOT EXISTS (SELECT 1 FROM {address_record} u WHERE {used})
+    AND NOT EXISTS (SELECT 1 FROM {ptr} u WHERE {used})
+    AND NOT EXISTS (SELECT 1 FROM {static_interface} u WHERE {used})
+ORDER BY c.ip
+LIMIT %s
+"""
+GAP_STARTS_BOUNDS = ("ip_type = %s AND ip_upper = %s AND ip_lower >= %s "
+                     "AND ip_lower < %s")
+GAP_STARTS_USED = "u.ip_type = %s AND u.ip_upper = %s AND u.ip_lower = c.ip"
+USED_MODELS = (AddressRecord, PTR, StaticInterface)
+
+
+def find_gap_starts(start, end, ip_type, count):
+    """
+    Return the first address of each of the first `count` runs of free
+    addresses between `start` and `end`, which must have the same upper
+    half, as integers. The runs are found in a single query.
+    """
+    upper, start_lower = one_to_two(start)
+    _, end_lower = one_to_two(end)
+    qn = connection.ops.quote_name
+    sql = GAP_STARTS_SQL.format(
+        address_record=qn(AddressRecord._meta.db_table),
+        ptr=qn(PTR._meta.db_table),
+        static_interface=qn(StaticInterface._meta.db_table),
+        bounds=GAP_STARTS_BOUNDS, used=GAP_STARTS_USED)
+    params = ([start_lower] + [ip_type, upper, start_lower, end_lower] * 3 +
+              [ip_type, upper] * 3 + [count])
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    return [two_to_one(upper, lower) for lower, in cursor.fetchall()]
+
+
+def next_used_ip(start, end, ip_type):
+    """
+    Return the lowest used address between `start` and `end` as an integer,
+    or None if there isn't one.
+    """
+    q = ip_range_q(start, end, ip_type)
+    used = []
+    for model in USED_MODELS:
+        used.extend(two_to_one(upper, lower) for upper, lower in
+                    model.objects.filter(q).order_by('ip_upper', 'ip_lower')
+                                 .values_list('ip_upper', 'ip_lower')[:1])
+    return min(used) if used else None
+
+
+def iter_gap_ips(start, end, ip_type, count):
+    """
+    Yield up to `count` of the lowest free addresses between `start` and
+    `end`, which must have the same upper half, as integers. The runs they
+    are in are found by :func:`find_gap_starts`, and only a run that is
+    read past its first address costs another query, to find where it ends.
+    So the cost doesn't grow with the number of used addresses.
+    """
+    for ip in find_gap_starts(start, end, ip_type, count):
+        yield ip
+        if ip == end:
+            return
+        run_end = next_used_ip(ip + 1, end, ip_type)
+        run_end = end if run_end is None else run_end - 1
+        while ip < run_end:
+            ip += 1
+            yield ip
+
+
+def find_free_ips(start, end, ip_type='4', count=1):
+    """Given start and end numbers, find up to `count` of the lowest free IPs.
     :param start: The start number
     :type start: int
     :param end: The end number
     :type end: int
     :param ip_type: The type of IP you are looking for.
     :type ip_type: str either '4' or '6'
+    :returns: A list of ipaddr.IPv4Address or ipaddr.IPv6Address objects
     """
     if ip_type == IP_TYPE_4:
-        records = AddressRecord.objects.filter(ip_upper=0, ip_lower__gte=start,
-                                               ip_lower__lte=end)
-        ptrs = PTR.objects.filter(ip_upper=0, ip_lower__gte=start,
-                                  ip_lower__lte=end)
-        intrs = StaticInterface.objects.filter(ip_upper=0, ip_lower__gte=start,
-                                               ip_lower__lte=end)
-        if not records and not intrs:
-            ip = ipaddr.IPv4Address(start)
-            return ip
-        for i in xrange(start, end + 1):
-            taken = False
-            for record in records:
-                if record.ip_lower == i:
-                    taken = True
-                    break
-            for ptr in ptrs:
-                if ptr.ip_lower == i:
-                    taken = True
-                    break
-            if not taken:
-                for intr in intrs:
-                    if intr.ip_lower == i:
-                        taken = True
-                        break
-            if not taken:
-                ip = ipaddr.IPv4Address(i)
-                return ip
+        IPKlass = ipaddr.IPv4Address
     else:
-        raise NotImplemented
+        IPKlass = ipaddr.IPv6Address
+    if one_to_two(start)[0] == one_to_two(end)[0]:
+        free_ips = iter_gap_ips(start, end, ip_type, count)
+    else:
+        free_ips = iter_free_ips(start, end, ip_type)
+    return [IPKlass(ip) for ip in islice(free_ips, count)]
+
+
+def find_free_ip(start, end, ip_type='4'):
+    """Given start and end numbers, find a free IP.
+    :param start: The start number
+    :type start: int
+    :param end: The end number
+    :type end: int
+    :param ip_type: The type of IP you are looking for.
+    :type ip_type: str either '4' or '6'
+    :returns: An ipaddr.IPv4Address or ipaddr.IPv6Address, or None if every
+        IP is taken
+    """
+    ips = find_free_ips(start, end, ip_type=ip_type)
+    return ips[0] if ips else None
 
 
 class RangeAV(EAVBase):
@@ -0,0 +1,119 @@
+from cyder.cydhcp.range.models import iter_used_ips
+from cyder.cydhcp.utils import four_to_two
+
+
+FREE = '\x00'
+USED = '\x01'
+
+# The most addresses a map may cover (16 MiB of bitmap, a /8).
+MAX_MAP_SIZE = 1 << 24
+
+# The most addresses a detail page maps on each request (64 KiB of bitmap, a
+# /16). Bigger networks and ranges are left to capacity_report.
+DETAIL_MAP_SIZE = 1 << 16
+
+
+class OccupancyMap(object):
+    """
+    Which addresses between `start` and `end` (integers, inclusive) are used
+    by address records, PTRs and static interfaces, as a bytearray with one
+    byte per address. The used addresses are read in one sorted query per
+    model.
+
+    Counting and finding runs are done by the bytearray's own `count` and
+    `find`, so their cost doesn't depend on how many addresses each run
+    spans.
+    """
+
+    def __init__(self, start, end, ip_type, used_ips=None,
+                 max_size=MAX_MAP_SIZE):
+        size = end - start + 1
+        if size > max_size:
+            raise ValueError("Can't map {0} addresses".format(size))
+        self.start = start
+        self.end = end
+        self.ip_type = ip_type
+        self.bitmap = bytearray(size)
+        if used_ips is None:
+            used_ips = iter_used_ips(start, end, ip_type)
+        for ip in used_ips:
+            self.bitmap[ip - start] = USED
+
+    @classmethod
+    def for_network(cls, network, **kwargs):
+        network.update_network()
+        return cls(int(network.network.network),
+                   int(network.network.broadcast), network.ip_type, **kwargs)
+
+    @classmethod
+    def for_range(cls, range_, **kwargs):
+        start, end = four_to_two(range_.start_upper, range_.start_lower,
+                                 range_.end_upper, range_.end_lower)
+        return cls(start, end, range_.ip_type, **kwargs)
+
+    def submap(self, start, end):
+        """
+        Return the map of the addresses between `start` and `end`, which
+        must be in this map, without querying again.
+        """
+        if not self.start <= start <= end <= self.end:
+            raise ValueError('{0}-{1} is outside this map'.format(start, end))
+        submap = OccupancyMap.__new__(OccupancyMap)
+        submap.start = start
+        submap.end = end
+        submap.ip_type = self.ip_type
+        submap.bitmap = self.bitmap[start - self.start:end - self.start + 1]
+        return submap
+
+    @property
+    def size(self):
+        return len(self.bitmap)
+
+    @property
+    def used(self):
+        return self.bitmap.count(USED)
+
+    @property
+    def free(self):
+        return self.size - self.used
+
+    @property
+    def usage(self):
+        """The percentage of addresses used, rounded down."""
+        return int(float(self.used) / self.size * 100)
+
+    def is_used(self, ip):
+        return self.bitmap[ip - self.start] == ord(USED)
+
+    def runs(self, start=None):
+        """
+        Yield (used, first, last) for each run of used or free addresses in
+        order, starting with the one containing `start` (by default, this
+        map's first address).
+        """
+        i = 0 if start is None else start - self.start
+        size = self.size
+        while i < size:
+            used = self.bitmap[i] == ord(USED)
+            j = self.bitmap.find(FREE if used else USED, i)
+            if j == -1:
+                j = size
+            yield used, self.start + i, self.start + j - 1
+            i = j
+
+    def free_runs(self):
+        """Yield (first, last) for each run of free addresses."""
+        for used, first, last in self.runs():
+            if not used:
+                yield first, last
+
+    def largest_free_block(self):
+        """
+        Return (first, last) for the first of the longest runs of free
+        addresses, or None if every address is used.
+        """
+        largest = None
+        for first, last in self.free_runs():
+            if largest is None or last - first > largest[1] - largest[0]:
+                largest = first, last
+        return largest
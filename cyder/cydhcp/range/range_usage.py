@@ -1,87 +1,174 @@
-from itertools import chain, groupby
+import heapq
+from collections import defaultdict
 
+import ipaddr
 import json
-from cyder.base.constants import IP_TYPE_4, IP_TYPE_6
+from cyder.base.constants import IP_TYPE_4
 
-from cyder.cydhcp.utils import start_end_filter, two_to_one
+from django.db.models import Q
+
+from cyder.cydhcp.range.models import ip_range_q
+from cyder.cydhcp.utils import two_to_one
 from cyder.cydhcp.interface.static_intr.models import StaticInterface
 
 from cyder.cydns.address_record.models import AddressRecord
 from cyder.cydns.ptr.models import PTR
 
 
-def contiguous_ips(ip_list, ip_type=IP_TYPE_4):
+def iter_model_records(model, start, end, ip_type, reverse=False,
+                       chunk_size=100):
     """
-    Given a sorted set of ips of the same type group them into a list of
-    the contiguous sublists
+    Yield the `model` objects whose addresses are between `start` and `end`,
+    ordered by address and then primary key (both descending if `reverse`).
+    They're read `chunk_size` at a time, each chunk starting where the last
+    one stopped, so only as many are read as are consumed (plus at most one
+    chunk).
     """
-    grouped_ips = []
-    contiguous_list = []
+    if reverse:
+        order = ('-ip_upper', '-ip_lower', '-pk')
+    else:
+        order = ('ip_upper', 'ip_lower', 'pk')
+    q = ip_range_q(start, end, ip_type)
+    while True:
+        chunk = list(model.objects.filter(q).order_by(*order)[:chunk_size])
+        for record in chunk:
+            yield record
+        if len(chunk) < chunk_size:
+            return
+
+        last = chunk[-1]
+        last_ip = two_to_one(last.ip_upper, last.ip_lower)
+        q = Q(ip_upper=last.ip_upper, ip_lower=last.ip_lower,
+              ip_type=ip_type)
+        if reverse:
+            q &= Q(pk__lt=last.pk)
+            if last_ip > start:
+                q |= ip_range_q(start, last_ip - 1, ip_type)
+        else:
+            q &= Q(pk__gt=last.pk)
+            if last_ip < end:
+                q |= ip_range_q(last_ip + 1, end, ip_type)
+
+
+def iter_ip_records(start, end, ip_type, reverse=False, chunk_size=100):
     """
-    We need to group together objects which have the same ip addres.
-    They willb e stored in a tuple with the first element being an
-    ipaddr object and the second element is a list of records which
-    have that ip address.
+    Yield (ip, record) for each address record, PTR and static interface
+    between `start` and `end`, ordered by address (descending if
+    `reverse`). The records of each address come address records first,
+    then PTRs, then static interfaces, each by primary key.
     """
-    for ip, grp in groupby(ip_list, key=lambda rec: rec.get_wrapped_ip()):
-        grouped_ips.append((ip, list(grp)))
-    if not grouped_ips:
-        return [], 0
-    ips_used = len(grouped_ips)
-    current_list = [grouped_ips[0]]
-    for ip_grp in grouped_ips[1:]:
-        """
-        If the next record is the successor of the last contiguous record
-        add it to the current list of contiguous records else add that
-        contiguous list to the list of contigguous ranges and start a new one.
-        """
-        if current_list[-1][0] == ip_grp[0] + 1:
-            current_list.append(ip_grp)
-        else:
-            contiguous_list.append(current_list)
-            current_list = [ip_grp]
-    contiguous_list.append(current_list)
-    return contiguous_list, ips_used
+    sign = -1 if reverse else 1
+    iters = [
+        ((sign * two_to_one(r.ip_upper, r.ip_lower), i, sign * r.pk, r)
+         for r in iter_model_records(model, start, end, ip_type,
+                                     reverse=reverse, chunk_size=chunk_size))
+        for i, model in enumerate((AddressRecord, PTR, StaticInterface))]
+    for ip, _, _, record in heapq.merge(*iters):
+        yield sign * ip, record
 
 
-def range_usage(start, end, ip_type):
+class RangeUsagePage(object):
     """
-    Takes a start and end address as integers and returns a range usage list
-    containing tuples of the available ips and lists of contiguously used ip
-    addresses.
+    One page of a static range's usage: up to `per_page` used addresses
+    starting at the address `cursor`, with the free runs between them. The
+    next page starts just after this page's last used address.
+
+    Given the range's `used_count`, the last page holds only the used
+    addresses left over after the full pages, so it starts where paging
+    forward from the start would. Without it, the last page is the last
+    `per_page` used addresses, which may overlap the page before.
+
+    Only the records on this page (and on the pages just before this one
+    and at the end of the range, to link to them) are read, so building a
+    page doesn't depend on how big the range is.
     """
-    ip_start, ip_end, ipf_q = start_end_filter(start, end, ip_type)
-    record_ip = lambda x: two_to_one(x.ip_upper, x.ip_lower)
-    taken_ips = sorted(chain(
-        AddressRecord.objects.filter(ipf_q),
-        PTR.objects.filter(ipf_q),
-        StaticInterface.objects.filter(ipf_q)),
-        key=record_ip)
-    contiguous_ip_list, total_used = contiguous_ips(taken_ips)
-    total_ips = (end - start) + 1
-    range_usage_list = []
-    free_range_start = ip_start
-    for filled_range in contiguous_ip_list:
-        # if the first address in the current contiguous range is greater
-        # than the first free address add that free range of ips to the range
-        # usage list
-        if free_range_start < filled_range[0][0]:
-            range_usage_list.append(
-                ("Free",
-                 free_range_start, filled_range[0][0] - 1,
-                 json.dumps({"ip_str": str(free_range_start),
-                             "ip_type": ip_type})))
-        # the new free range may start with the next address after the end of
-        # the current filled range
-        free_range_start = filled_range[-1][0] + 1
-        range_usage_list.append(filled_range)
-    # handle the case where there is an additional free range after the final
-    # filled range
-    if free_range_start < ip_end:
-        range_usage_list.append(
-            ("Free",
-             free_range_start, ip_end,
-             json.dumps({"ip_str": str(free_range_start),
-                         "ip_type": ip_type})))
-
-    return range_usage_list, int((float(total_used) / total_ips) * 100)
+
+    def __init__(self, start, end, ip_type, cursor=None, per_page=50,
+                 used_count=None):
+        if ip_type == IP_TYPE_4:
+            self.IPKlass = ipaddr.IPv4Address
+        else:
+            self.IPKlass = ipaddr.IPv6Address
+        self.start = start
+        self.end = end
+        self.ip_type = ip_type
+        self.per_page = per_page
+        if cursor is None or not start <= cursor <= end:
+            cursor = start
+        self.cursor = cursor
+
+        records = defaultdict(list)
+        ips = []
+        next_cursor = None
+        for ip, record in iter_ip_records(cursor, end, ip_type,
+                                          chunk_size=per_page + 1):
+            if not ips or ips[-1] != ip:
+                if len(ips) == per_page:
+                    next_cursor = ips[-1] + 1
+                    break
+                ips.append(ip)
+            records[ip].append(record)
+
+        self.rows = []
+        free_start = cursor
+        for ip in ips:
+            if free_start < ip or not self.rows:
+                if free_start < ip:
+                    self.rows.append(self.free_row(free_start, ip - 1))
+                self.rows.append([])
+            self.rows[-1].append((self.IPKlass(ip), records[ip]))
+            free_start = ip + 1
+        if next_cursor is None and free_start <= end:
+            self.rows.append(self.free_row(free_start, end))
+
+        self.next_cursor = next_cursor
+        if cursor > start:
+            self.previous_cursor = self.cursor_before(cursor)
+        else:
+            self.previous_cursor = None
+        if next_cursor is not None:
+            self.last_cursor = self.cursor_before(
+                end + 1, (used_count or 0) % per_page or per_page)
+        else:
+            self.last_cursor = cursor
+
+    def free_row(self, first, last):
+        return ("Free", self.IPKlass(first), self.IPKlass(last),
+                json.dumps({"ip_str": str(self.IPKlass(first)),
+                            "ip_type": self.ip_type}))
+
+    def cursor_before(self, cursor, count=None):
+        """
+        Return where the page of `count` used addresses (by default, a full
+        page) that ends just before `cursor` starts.
+        """
+        if count is None:
+            count = self.per_page
+        ips = 0
+        last_ip = None
+        for ip, _ in iter_ip_records(self.start, cursor - 1, self.ip_type,
+                                     reverse=True,
+                                     chunk_size=self.per_page + 1):
+            if ip != last_ip:
+                if ips == count:
+                    return ip + 1
+                ips += 1
+                last_ip = ip
+        return self.start
+
+    def ip_str(self, ip):
+        return None if ip is None else str(self.IPKlass(ip))
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
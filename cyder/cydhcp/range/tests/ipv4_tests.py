@@ -1,9 +1,13 @@
 from django.core.exceptions import ValidationError
 
+import ipaddr
+
 from cyder.base.tests import ModelTestMixin, TestCase
 from cyder.cydns.domain.models import Domain
 from cyder.cydhcp.network.models import Network
-from cyder.cydhcp.range.models import Range
+from cyder.cydhcp.range.models import Range, iter_free_ips
+from cyder.cydhcp.range.occupancy import OccupancyMap
+from cyder.cydhcp.range.range_usage import iter_ip_records, RangeUsagePage
 from cyder.cydhcp.interface.static_intr.models import StaticInterface
 from cyder.cydns.tests.utils import create_zone
 from cyder.core.system.models import System
@@ -185,6 +189,25 @@ class V4RangeTests(TestCase, ModelTestMixin):
             ip_type='4',
         )
 
+    def test_overlap_gaps(self):
+        for start_str, end_str in (("10.0.4.5", "10.0.4.55"),
+                                   ("10.0.4.60", "10.0.4.63")):
+            Range.objects.create(start_str=start_str, end_str=end_str,
+                                 network=self.s, ip_type='4')
+
+        # Ranges that cover others, or end inside them, overlap.
+        for start_str, end_str in (("10.0.4.1", "10.0.4.70"),
+                                   ("10.0.4.56", "10.0.4.70"),
+                                   ("10.0.4.56", "10.0.4.60")):
+            self.assertRaises(
+                ValidationError, Range.objects.create,
+                start_str=start_str, end_str=end_str, network=self.s,
+                ip_type='4')
+
+        # The gap between them is free.
+        Range.objects.create(start_str="10.0.4.56", end_str="10.0.4.59",
+                             network=self.s, ip_type='4')
+
     def test_bad_create10(self):
         # Update range to something outside of the subnet.
         Range.objects.create(
@@ -252,3 +275,181 @@ class V4RangeTests(TestCase, ModelTestMixin):
             ip_str=str(r.get_next_ip()), system=system,
             mac="00:00:00:00:00:01")
         self.assertEqual(r.get_next_ip(), None)
+
+    def test_next_ips(self):
+        system = System.objects.create(name='foobar', ctnr=self.ctnr)
+        r = Range.objects.create(
+            start_str="10.0.34.1",
+            end_str="10.0.34.5",
+            network=self.s,
+            ip_type='4',
+        )
+        self.ctnr.ranges.add(r)
+
+        for i, ip_str in enumerate(("10.0.34.1", "10.0.34.3")):
+            StaticInterface.objects.create(
+                label="foo{0}".format(i), domain=self.d, ip_type='4',
+                ip_str=ip_str, system=system, mac="00:00:00:00:00:01")
+
+        self.assertEqual(map(str, r.get_next_ips(2)),
+                         ["10.0.34.2", "10.0.34.4"])
+        self.assertEqual(map(str, r.get_next_ips(10)),
+                         ["10.0.34.2", "10.0.34.4", "10.0.34.5"])
+
+    def test_next_ips_match_walk(self):
+        system = System.objects.create(name='foobar', ctnr=self.ctnr)
+        r = Range.objects.create(
+            start_str="10.0.35.1",
+            end_str="10.0.35.20",
+            network=self.s,
+            ip_type='4',
+        )
+        self.ctnr.ranges.add(r)
+
+        for i in (1, 2, 3, 7, 8, 12, 20):
+            StaticInterface.objects.create(
+                label="foo{0}".format(i), domain=self.d, ip_type='4',
+                ip_str="10.0.35.{0}".format(i), system=system,
+                mac="00:00:00:00:00:{0:02}".format(i))
+
+        start = int(ipaddr.IPv4Address("10.0.35.1"))
+        end = int(ipaddr.IPv4Address("10.0.35.20"))
+        free = [ipaddr.IPv4Address(ip)
+                for ip in iter_free_ips(start, end, '4')]
+        self.assertEqual(len(free), 13)
+        for count in (1, 2, 5, 13, 20):
+            self.assertEqual(r.get_next_ips(count), free[:count])
+
+    def test_usage_counter(self):
+        system = System.objects.create(name='foobar', ctnr=self.ctnr)
+        r1 = Range.objects.create(
+            start_str="10.0.35.1",
+            end_str="10.0.35.4",
+            network=self.s,
+            ip_type='4',
+        )
+        r2 = Range.objects.create(
+            start_str="10.0.36.1",
+            end_str="10.0.36.4",
+            network=self.s,
+            ip_type='4',
+        )
+        self.ctnr.ranges.add(r1, r2)
+
+        def used(r):
+            r = Range.objects.get(pk=r.pk)
+            self.assertEqual(r.used_count, r.count_used())
+            return r.used_count, r.range_usage
+
+        self.assertEqual(used(r1), (0, 0))
+        intr1 = StaticInterface.objects.create(
+            label="foo1", domain=self.d, ip_type='4', ip_str="10.0.35.1",
+            system=system, mac="00:00:00:00:00:01")
+        self.assertEqual(used(r1), (1, 25))
+        intr2 = StaticInterface.objects.create(
+            label="foo2", domain=self.d, ip_type='4', ip_str="10.0.35.2",
+            system=system, mac="00:00:00:00:00:02")
+        self.assertEqual(used(r1), (2, 50))
+        # Saving a stale copy of the range doesn't save its stale counter.
+        r1.save()
+        self.assertEqual(used(r1), (2, 50))
+
+        intr2.ip_str = "10.0.36.2"
+        intr2.save()
+        self.assertEqual(used(r1), (1, 25))
+        self.assertEqual(used(r2), (1, 25))
+        intr2.mac = "00:00:00:00:00:03"
+        intr2.save()
+        self.assertEqual(used(r2), (1, 25))
+
+        intr1.delete()
+        self.assertEqual(used(r1), (0, 0))
+
+    def test_occupancy(self):
+        system = System.objects.create(name='foobar', ctnr=self.ctnr)
+        r = Range.objects.create(
+            start_str="10.0.37.1",
+            end_str="10.0.37.10",
+            network=self.s,
+            ip_type='4',
+        )
+        self.ctnr.ranges.add(r)
+
+        for i, ip_str in enumerate(("10.0.37.2", "10.0.37.3", "10.0.37.7")):
+            StaticInterface.objects.create(
+                label="foo{0}".format(i), domain=self.d, ip_type='4',
+                ip_str=ip_str, system=system,
+                mac="00:00:00:00:00:0{0}".format(i))
+
+        base = int(ipaddr.IPv4Address("10.0.37.0"))
+        occupancy = OccupancyMap.for_range(r)
+        self.assertEqual((occupancy.used, occupancy.size, occupancy.usage),
+                         (3, 10, 30))
+        self.assertRaises(ValueError, OccupancyMap.for_range, r, max_size=9)
+        self.assertEqual(
+            [(used, first - base, last - base)
+             for used, first, last in occupancy.runs()],
+            [(False, 1, 1), (True, 2, 3), (False, 4, 6), (True, 7, 7),
+             (False, 8, 10)])
+        self.assertEqual(occupancy.largest_free_block(),
+                         (base + 4, base + 6))
+
+        network_map = OccupancyMap.for_network(self.s)
+        self.assertEqual(network_map.used, 3)
+        self.assertEqual(
+            list(network_map.submap(base + 2, base + 7).runs()),
+            list(OccupancyMap(base + 2, base + 7, '4').runs()))
+
+    def test_usage_pages(self):
+        system = System.objects.create(name='foobar', ctnr=self.ctnr)
+        r = Range.objects.create(
+            start_str="10.0.38.1",
+            end_str="10.0.38.20",
+            network=self.s,
+            ip_type='4',
+        )
+        self.ctnr.ranges.add(r)
+
+        ip_strs = ["10.0.38.{0}".format(i) for i in (2, 3, 4, 9, 15, 20)]
+        for i, ip_str in enumerate(ip_strs):
+            StaticInterface.objects.create(
+                label="foo{0}".format(i), domain=self.d, ip_type='4',
+                ip_str=ip_str, system=system,
+                mac="00:00:00:00:00:0{0}".format(i))
+
+        start = int(ipaddr.IPv4Address("10.0.38.1"))
+        end = int(ipaddr.IPv4Address("10.0.38.20"))
+        for reverse in (False, True):
+            ips = [str(ipaddr.IPv4Address(ip)) for ip, _ in iter_ip_records(
+                start, end, '4', reverse=reverse, chunk_size=2)]
+            self.assertEqual(ips, ip_strs[::-1] if reverse else ip_strs)
+
+        def rows(page):
+            return [(str(row[1]), str(row[2])) if row[0] == "Free"
+                    else [str(ip) for ip, _ in row] for row in page]
+
+        page1 = RangeUsagePage(start, end, '4', per_page=4)
+        self.assertEqual(rows(page1), [
+            ("10.0.38.1", "10.0.38.1"),
+            ["10.0.38.2", "10.0.38.3", "10.0.38.4"],
+            ("10.0.38.5", "10.0.38.8"),
+            ["10.0.38.9"]])
+        self.assertFalse(page1.has_previous)
+
+        page2 = RangeUsagePage(start, end, '4', cursor=page1.next_cursor,
+                               per_page=4)
+        self.assertEqual(rows(page2), [
+            ("10.0.38.10", "10.0.38.14"),
+            ["10.0.38.15"],
+            ("10.0.38.16", "10.0.38.19"),
+            ["10.0.38.20"]])
+        self.assertFalse(page2.has_next)
+        self.assertEqual(page2.previous_cursor, start)
+        self.assertEqual(page1.last_cursor,
+                         int(ipaddr.IPv4Address("10.0.38.4")))
+
+        used_count = Range.objects.get(pk=r.pk).used_count
+        self.assertEqual(used_count, 6)
+        page1 = RangeUsagePage(start, end, '4', per_page=4,
+                               used_count=used_count)
+        self.assertEqual(page1.last_cursor, page2.cursor)
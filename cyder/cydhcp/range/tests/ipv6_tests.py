@@ -233,3 +233,22 @@ class V6RangeTests(TestCase, ModelTestMixin):
 
         x()
         self.assertRaises(ValidationError, x)
+
+    def test_next_ips(self):
+        # The range spans two values of ip_upper.
+        r = Range.objects.create(
+            start_str="1234:1234:1234:1:ffff:ffff:ffff:fffe",
+            end_str="1234:1234:1234:2::1",
+            network=self.s,
+            ip_type='6',
+        )
+        self.assertEqual(
+            r.get_next_ips(10),
+            [ipaddr.IPv6Address(ip_str) for ip_str in (
+                "1234:1234:1234:1:ffff:ffff:ffff:fffe",
+                "1234:1234:1234:1:ffff:ffff:ffff:ffff",
+                "1234:1234:1234:2::",
+                "1234:1234:1234:2::1")])
+        self.assertEqual(
+            r.get_next_ip(),
+            ipaddr.IPv6Address("1234:1234:1234:1:ffff:ffff:ffff:fffe"))
@@ -1,6 +1,10 @@
-from django.db.models import get_model, Q
+from collections import defaultdict
 
-from cyder.cydhcp.utils import start_end_filter, two_to_one, one_to_two
+from django.db import connection
+from django.db.models import Count, get_model, Q
+
+from cyder.cydhcp.utils import (four_to_two, start_end_filter, two_to_one,
+                                one_to_two)
 
 from django.http import HttpResponse
 
@@ -26,6 +30,146 @@ def find_range(ip_str):
         return None
 
 
+def ip_use_count(ip_str, ip_type):
+    """
+    Return how many address records, PTRs and static interfaces use the
+    address `ip_str`.
+    """
+    ip_upper, ip_lower = one_to_two(int(ipaddr.IPAddress(ip_str)))
+    cursor = connection.cursor()
+    cursor.execute(
+        _format_used_sql(IP_USE_COUNT_SQL, match=IP_USE_COUNT_MATCH),
+        [ip_upper, ip_lower, ip_type] * 3)
+    return cursor.fetchone()[0]
+
+
+def update_static_usage(old, new):
+    """
+    Update the usage counters of the static ranges containing an object's
+    old and new addresses after it has been saved or deleted. `old` and
+    `new` are (ip_str, ip_type) pairs, or None if the object didn't or
+    doesn't exist. An address only counts once, however many objects use
+    it.
+    """
+    Range = get_model('cyder', 'range')
+    if old == new:
+        return
+    if old is not None:
+        rng = find_range(old[0])
+        if (rng and rng.range_type == STATIC and
+                not ip_use_count(*old)):
+            Range.add_used(rng.pk, -1)
+    if new is not None:
+        rng = find_range(new[0])
+        if (rng and rng.range_type == STATIC and
+                ip_use_count(*new) == 1):
+            Range.add_used(rng.pk, 1)
+
+
+def update_dynamic_usage(old, new):
+    """
+    Update the usage counters of a dynamic interface's old and new ranges
+    after it has been saved or deleted. `old` and `new` are
+    (range, dhcp_enabled) pairs, or None if the interface didn't or doesn't
+    exist.
+    """
+    Range = get_model('cyder', 'range')
+    old_range = old and old[1] and old[0]
+    new_range = new and new[1] and new[0]
+    if old_range and new_range and old_range.pk == new_range.pk:
+        return
+    if old_range and old_range.range_type == DYNAMIC:
+        Range.add_used(old_range.pk, -1)
+    if new_range and new_range.range_type == DYNAMIC:
+        Range.add_used(new_range.pk, 1)
+
+
+# Counts the distinct addresses used by address records, PTRs and static
+# interfaces between two addresses. UNION removes the duplicates. Each table
+# is only read between the bounds, so its address index can be used.
+STATIC_USAGE_SQL = """
+SELECT COUNT(*) FROM (
+    SELECT ip_upper, ip_lower FROM {address_record} WHERE {bounds}
+    UNION
+    SELECT ip_upper, ip_lower FROM {ptr} WHERE {bounds}
+    UNION
+    SELECT ip_upper, ip_lower FROM {static_interface} WHERE {bounds}
+) u
+"""
+STATIC_USAGE_BOUNDS = """ip_type = %s
+        AND (ip_upper > %s OR (ip_upper = %s AND ip_lower >= %s))
+        AND (ip_upper < %s OR (ip_upper = %s AND ip_lower <= %s))"""
+
+# Counts the address records, PTRs and static interfaces using an address.
+IP_USE_COUNT_SQL = """
+SELECT
+    (SELECT COUNT(*) FROM {address_record} WHERE {match}) +
+    (SELECT COUNT(*) FROM {ptr} WHERE {match}) +
+    (SELECT COUNT(*) FROM {static_interface} WHERE {match})
+"""
+IP_USE_COUNT_MATCH = "ip_upper = %s AND ip_lower = %s AND ip_type = %s"
+
+
+def _format_used_sql(sql, **kwargs):
+    qn = connection.ops.quote_name
+    return sql.format(
+        address_record=qn('address_record'), ptr=qn('ptr'),
+        static_interface=qn('static_interface'), **kwargs)
+
+
+def count_static_used(start, end, ip_type):
+    """
+    Return how many distinct addresses between `start` and `end` are used
+    by address records, PTRs and static interfaces, in one query.
+    """
+    start_upper, start_lower = one_to_two(start)
+    end_upper, end_lower = one_to_two(end)
+    cursor = connection.cursor()
+    cursor.execute(
+        _format_used_sql(STATIC_USAGE_SQL, bounds=STATIC_USAGE_BOUNDS),
+        [ip_type, start_upper, start_upper, start_lower,
+         end_upper, end_upper, end_lower] * 3)
+    return cursor.fetchone()[0]
+
+
+def recompute_range_usage(Range=None, DynamicInterface=None):
+    """
+    Recount the usage counter and percentage of every range, with one
+    bounded query per static range and one for all dynamic ones. Return how
+    many ranges were updated.
+
+    Migrations pass their frozen `Range` and `DynamicInterface` models.
+    """
+    Range = Range or get_model('cyder', 'range')
+    DynamicInterface = (DynamicInterface or
+                        get_model('cyder', 'dynamicinterface'))
+
+    used = dict(
+        (row['range'], row['count'])
+        for row in DynamicInterface.objects
+            .filter(range__range_type=DYNAMIC, dhcp_enabled=True)
+            .values('range').annotate(count=Count('id')))
+
+    # Ranges with the same usage are updated together.
+    pks_by_usage = defaultdict(list)
+    for pk, range_type, ip_type, su, sl, eu, el in Range.objects.values_list(
+            'pk', 'range_type', 'ip_type', 'start_upper', 'start_lower',
+            'end_upper', 'end_lower'):
+        start, end = four_to_two(su, sl, eu, el)
+        if range_type == STATIC:
+            count = count_static_used(start, end, ip_type)
+        else:
+            count = used.get(pk, 0)
+        usage = int(float(count) / (end - start + 1) * 100)
+        pks_by_usage[(count, usage)].append(pk)
+
+    for (count, usage), pks in pks_by_usage.iteritems():
+        Range.objects.filter(pk__in=pks).update(
+            used_count=count, range_usage=usage)
+
+    return sum(len(pks) for pks in pks_by_usage.itervalues())
+
+
 def ip_taken(ip, records):
     """
     Given an ip as an integer and a queryset find an object in the queryset
@@ -156,7 +300,7 @@ def range_wizard_get_ip(request):
     Range = get_model('cyder', 'range')
     rng = Range.objects.get(id=rngId)
 
-    if freeIp == 'true' and rng and rng.ip_type == '4':
+    if freeIp == 'true' and rng:
         ip_str = rng.get_next_ip()
         if not ip_str:
             ip_str = 'This range is full!'
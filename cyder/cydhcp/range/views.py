@@ -14,7 +14,8 @@ from cyder.core.ctnr.models import Ctnr
 from cyder.cydhcp.constants import (ALLOW_ANY, ALLOW_KNOWN, ALLOW_VRF,
                                     ALLOW_LEGACY)
 from cyder.cydhcp.range.models import Range, RangeAV
-from cyder.cydhcp.range.range_usage import range_usage
+from cyder.cydhcp.range.occupancy import DETAIL_MAP_SIZE, OccupancyMap
+from cyder.cydhcp.range.range_usage import RangeUsagePage
 from cyder.cydhcp.utils import two_to_one
 from cyder.cydhcp.vrf.models import Vrf
 from cyder.cydns.ip.models import ipv6_to_longs
@@ -38,21 +39,35 @@ def range_detail(request, pk):
 
     range_type = mrange.range_type
     range_data = []
-    ip_usage_percent = None
+    ip_usage_percent = mrange.range_usage
     dynamic_interfaces = []
     dynamic_interfaces_page_obj = None
     dynamic_interfaces_table = None
+    occupancy = None
+    largest_free = None
     if range_type == 'st':
-        start_upper = mrange.start_upper
-        start_lower = mrange.start_lower
-        end_upper = mrange.end_upper
-        end_lower = mrange.end_lower
-        range_data, ip_usage_percent = range_usage(
-            two_to_one(start_upper, start_lower),
-            two_to_one(end_upper, end_lower),
-            mrange.ip_type)
+        start = two_to_one(mrange.start_upper, mrange.start_lower)
+        end = two_to_one(mrange.end_upper, mrange.end_lower)
+        try:
+            cursor = int(ipaddr.IPAddress(request.GET.get('start'),
+                                          int(mrange.ip_type)))
+        except ValueError:
+            cursor = None
+        range_data = RangeUsagePage(start, end, mrange.ip_type, cursor=cursor,
+                                    used_count=mrange.used_count)
+        try:
+            occupancy = OccupancyMap.for_range(mrange,
+                                               max_size=DETAIL_MAP_SIZE)
+        except ValueError:  # Too big to map
+            pass
+        else:
+            block = occupancy.largest_free_block()
+            if block:
+                largest_free = (
+                    ipaddr.IPAddress(block[0], int(mrange.ip_type)),
+                    ipaddr.IPAddress(block[1], int(mrange.ip_type)),
+                    block[1] - block[0] + 1)
     else:
-        ip_usage_percent = mrange.range_usage
         DynamicInterface = get_model('cyder', 'dynamicinterface')
         dynamic_interfaces = DynamicInterface.objects.filter(range=mrange)
         dynamic_interfaces_page_obj = make_paginator(
@@ -71,12 +86,14 @@ def range_detail(request, pk):
         'obj_type': 'range',
         'pretty_obj_type': mrange.pretty_type,
         'ranges_table': range_table,
-        'range_data': make_paginator(request, range_data, 50),
+        'range_data': range_data,
         'range_type': range_type,
         'attrs_table': tablefy(mrange.rangeav_set.all(),
                                request=request),
         'allow_list': allow,
         'range_used': ip_usage_percent,
+        'occupancy': occupancy,
+        'largest_free': largest_free,
         'dynamic_intr_table': dynamic_interfaces_table,
         'page_obj': dynamic_interfaces_page_obj,
         'ctnr_table': ctnr_table
@@ -67,23 +67,42 @@ class Vrf(BaseModel, ObjectUrlMixin):
 
         super(Vrf, self).save(*args, **kwargs)
 
-    def build_vrf(self, ip_type):
-        build_str = ('class "{0}" {{\n'
-                     '\tmatch hardware;\n'
-                     '}}\n'
-                     .format(self.name))
-
-        for network_ in self.network_set.filter(ip_type=ip_type):
-            for range_ in network_.range_set.all():
-                clients = chain(
-                    range_.staticinterfaces.filter(dhcp_enabled=True),
-                    range_.dynamicinterface_set.filter(dhcp_enabled=True)
-                )
+    def build_vrf(self, ip_type, data=None):
+        return ''.join(self.iter_vrf(ip_type, data=data))
+
+    def iter_vrf(self, ip_type, data=None):
+        """
+        Yield the pieces of this VRF's class, as returned by
+        :func:`build_vrf`.
+
+        If `data` is a :class:`DHCPData`, render from it instead of querying
+        the database.
+        """
+        yield ('class "{0}" {{\n'
+               '\tmatch hardware;\n'
+               '}}\n'
+               .format(self.name))
+
+        if data is not None:
+            networks = data.get_vrf_networks(self)
+        else:
+            networks = self.network_set.filter(ip_type=ip_type)
+        for network_ in networks:
+            if data is not None:
+                ranges = data.get_ranges(network_)
+            else:
+                ranges = network_.range_set.all()
+            for range_ in ranges:
+                if data is not None:
+                    clients = chain(data.get_static_clients(range_),
+                                    data.get_dynamic_clients(range_))
+                else:
+                    clients = chain(
+                        range_.staticinterfaces.filter(dhcp_enabled=True),
+                        range_.dynamicinterface_set.filter(dhcp_enabled=True)
+                    )
                 for client in clients:
-                    build_str += client.build_subclass(self.name)
-
-
-        return build_str
+                    yield client.build_subclass(self.name)
 
 
 class VrfAV(EAVBase):
@@ -54,21 +54,38 @@ class Workgroup(BaseModel, ObjectUrlMixin):
 
         super(Workgroup, self).save(*args, **kwargs)
 
-    def build_workgroup(self, ip_type):
+    def build_workgroup(self, ip_type, data=None):
+        return ''.join(self.iter_workgroup(ip_type, data=data))
+
+    def iter_workgroup(self, ip_type, data=None):
+        """
+        Yield the pieces of this workgroup's group block, as returned by
+        :func:`build_workgroup`. Each host is yielded separately, so large
+        workgroups can be written without building the whole block.
+
+        If `data` is a :class:`DHCPData`, render from it instead of querying
+        the database.
+        """
         from cyder.cydhcp.interface.static_intr.models import StaticInterface
         from cyder.cydhcp.interface.dynamic_intr.models import DynamicInterface
-        build_str = ''
-        dynamic_clients = DynamicInterface.objects.filter(
-            workgroup=self, range__ip_type=ip_type, dhcp_enabled=True)
-        static_clients = StaticInterface.objects.filter(
-            workgroup=self, ip_type=ip_type, dhcp_enabled=True)
+        if data is not None:
+            dynamic_clients, static_clients = data.get_workgroup_clients(self)
+        else:
+            dynamic_clients = DynamicInterface.objects.filter(
+                workgroup=self, range__ip_type=ip_type, dhcp_enabled=True)
+            static_clients = StaticInterface.objects.filter(
+                workgroup=self, ip_type=ip_type, dhcp_enabled=True)
         if not (static_clients or dynamic_clients):
-            return ''
-        build_str += 'group {{ #{0}\n'.format(self.name)
-        statements = self.workgroupav_set.filter(
-            attribute__attribute_type=ATTRIBUTE_STATEMENT)
-        options = list(self.workgroupav_set.filter(
-            attribute__attribute_type=ATTRIBUTE_OPTION))
+            return
+        build_str = 'group {{ #{0}\n'.format(self.name)
+        if data is not None:
+            statements = data.get_statements(self)
+            options = list(data.get_options(self))
+        else:
+            statements = self.workgroupav_set.filter(
+                attribute__attribute_type=ATTRIBUTE_STATEMENT)
+            options = list(self.workgroupav_set.filter(
+                attribute__attribute_type=ATTRIBUTE_OPTION))
 
         def is_host_option(option):
             return any(x in option.value for x in ['%h', '%i', '%m', '%6m'])
@@ -84,10 +101,10 @@ class Workgroup(BaseModel, ObjectUrlMixin):
         if statements:
             build_str += join_dhcp_args(statements)
         build_str += '\t# Static Hosts in Workgroup\n'
+        yield build_str
         for client in chain(dynamic_clients, static_clients):
-            build_str += client.build_host(host_options)
-        build_str += '}\n'
-        return build_str
+            yield client.build_host(host_options)
+        yield '}\n'
 
 
 class WorkgroupAV(EAVBase):
@@ -5,7 +5,7 @@ from django.core.exceptions import ValidationError
 
 from cyder.base.constants import IP_TYPE_6, IP_TYPE_4
 from cyder.base.utils import transaction_atomic
-from cyder.cydhcp.range.utils import find_range
+from cyder.cydhcp.range.utils import update_static_usage
 from cyder.cydns.cname.models import CNAME
 from cyder.cydns.ip.models import Ip
 from cyder.cydns.models import CydnsRecord, LabelDomainMixin
@@ -216,24 +216,20 @@ class AddressRecord(BaseAddressRecord):
         self.full_clean()
 
         update_range_usage = kwargs.pop('update_range_usage', True)
-        old_range = None
+        old_ip = None
         if self.id is not None:
-            old_ip = AddressRecord.objects.get(id=self.id).ip_str
-            old_range = find_range(old_ip)
+            old = AddressRecord.objects.get(id=self.id)
+            old_ip = (old.ip_str, old.ip_type)
         super(AddressRecord, self).save(*args, **kwargs)
-        rng = find_range(self.ip_str)
-        if rng and update_range_usage:
-            rng.save(commit=False)
-            if old_range:
-                old_range.save(commit=False)
+        if update_range_usage:
+            update_static_usage(old_ip, (self.ip_str, self.ip_type))
 
     @transaction_atomic
     def delete(self, *args, **kwargs):
         update_range_usage = kwargs.pop('update_range_usage', True)
-        rng = find_range(self.ip_str)
         super(AddressRecord, self).delete(*args, **kwargs)
-        if rng and update_range_usage:
-            rng.save(commit=False)
+        if update_range_usage:
+            update_static_usage((self.ip_str, self.ip_type), None)
 
     def set_is_glue(self):
         self.is_glue = True
@@ -693,3 +693,15 @@ class AddressRecordTests(DNSTest, ModelTestMixin):
             self.assertRaises(
                 ValidationError, self.create_ar,
                 label='foo', domain=self.o_e, ip_str=ip_str, ip_type=ip_type)
+
+    def test_bind_formatter(self):
+        """Test that rendering from field tuples matches bind_render_record"""
+        a = self.create_ar(
+            label='foo', domain=self.o_e, ip_str='128.193.40.4', ip_type='4')
+        render, fields = AddressRecord.get_bind_formatter()
+        values = dict(vars(a), bind_name=a.fqdn + '.', rdtype=a.rdtype,
+                      rdclass='IN')
+        self.assertEqual(render(*(values[f] for f in fields)),
+                         a.bind_render_record())
+        self.assertIs(AddressRecord.get_bind_template(),
+                      AddressRecord.get_bind_template())
@@ -2,18 +2,30 @@ from __future__ import unicode_literals
 
 import inspect
 import os
+import re
 import sys
 import syslog
 import time
 import errno
+import hashlib
+import json
 
+from contextlib import contextmanager
+from itertools import chain
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
 from traceback import format_exception
 
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import Max, Sum
+
 from cyder.settings import BINDBUILD, ZONES_WITH_NO_CONFIG
 
 from cyder.base.mixins import MutexMixin
+from cyder.base.routers import read_snapshot
 from cyder.base.utils import (
-    copy_tree, dict_merge, Logger, remove_dir_contents, run_command, set_attrs)
+    copy_files, dict_merge, list_files, Logger, remove_dir_contents,
+    run_command, set_attrs)
 from cyder.base.vcs import GitRepo
 
 from cyder.core.task.models import Task
@@ -21,9 +33,20 @@ from cyder.core.utils import fail_mail
 
 from cyder.cydns.soa.models import SOA
 from cyder.cydns.view.models import View
-from cyder.cydns.cybind.zone_builder import build_zone_data
+from cyder.cydns.cybind.zone_builder import (
+    fetch_zone_records, iter_zone_data, render_soa_only)
 from cyder.cydns.cybind.models import DNSBuildRun
 from cyder.cydns.cybind.serial_utils import get_serial
+from cyder.cydns.cybind.zone_checker import check_zone
+from cyder.cydns.cybind.zone_delta import render_nsupdate, zone_records
+
+
+# Values of BINDBUILD['zone_checks']
+ZONE_CHECK_BUILTIN = 'builtin'
+ZONE_CHECK_EXTERNAL = 'named-checkzone'
+
+# A zone statement written by :func:`DNSBuilder.render_zone_stmt`
+ZONE_STMT_RE = re.compile(r'^zone "([^"]+)" .*?^\}+;\n', re.M | re.S)
 
 
 class DNSBuilder(MutexMixin, Logger):
@@ -32,8 +55,19 @@ class DNSBuilder(MutexMixin, Logger):
             'quiet': False,
             'verbose': False,
             'to_syslog': False,
+            'profile': False,
         }, kwargs)
         set_attrs(self, kwargs)
+        self.stage_stats = {}
+        self._stage_stack = []
+        # Kept so zone worker processes can be given an identical builder.
+        self.builder_opts = kwargs
+        # Set by build() and recorded by push() once it has succeeded.
+        self.zone_hashes = None
+
+        if self.keep_build_runs is not None and self.keep_build_runs < 1:
+            self.error('keep_build_runs must be at least 1 or None, not '
+                       '{0}'.format(self.keep_build_runs))
 
         self.repo = GitRepo(
             self.prod_dir, self.line_decrease_limit, self.line_increase_limit,
@@ -69,6 +103,60 @@ class DNSBuilder(MutexMixin, Logger):
     def run_command(self, command, failure_msg=None):
         return run_command(command, logger=self, failure_msg=failure_msg)
 
+    def query_count(self):
+        """
+        Return how many queries have been logged. Queries are only logged
+        by connections using the debug cursor.
+        """
+        return sum(len(conn.queries) for conn in connections.all())
+
+    @contextmanager
+    def timed(self, stage):
+        """
+        If `profile` is true, add the time spent and queries made inside the
+        block to `stage` in :attr:`stage_stats`. Stages are exclusive: time
+        spent in a stage nested in another only counts toward the inner one.
+        """
+        if not self.profile:
+            yield
+            return
+
+        # start time, start query count, nested seconds, nested queries
+        frame = [time.time(), self.query_count(), 0.0, 0]
+        self._stage_stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stage_stack.pop()
+            seconds = time.time() - frame[0]
+            queries = self.query_count() - frame[1]
+            stats = self.stage_stats.setdefault(
+                stage, {'seconds': 0.0, 'queries': 0})
+            stats['seconds'] += seconds - frame[2]
+            stats['queries'] += queries - frame[3]
+            if self._stage_stack:
+                self._stage_stack[-1][2] += seconds
+                self._stage_stack[-1][3] += queries
+
+    def timed_iter(self, stage, iterable):
+        """
+        Like :func:`timed`, for the time spent producing each item of a lazy
+        `iterable`.
+        """
+        if not self.profile:
+            return iterable
+
+        def timed_items():
+            items = iter(iterable)
+            while True:
+                with self.timed(stage):
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        return
+                yield item
+        return timed_items()
+
     def get_scheduled(self):
         """
         Find all DNS tasks that indicate we need to rebuild a certain zone.
@@ -130,15 +218,19 @@ class DNSBuilder(MutexMixin, Logger):
 
     def write_stage_zone(self, stage_fname, root_domain, fname, data):
         """
-        Write a zone_file.
+        Write a zone_file. `data` may be a string or an iterable of strings,
+        which is written as it is consumed.
         Return the path to the file.
         """
         if not os.path.exists(os.path.dirname(stage_fname)):
             os.makedirs(os.path.dirname(stage_fname))
         self.log_debug("Stage zone file is {0}".format(stage_fname),
                        root_domain=root_domain)
+        if isinstance(data, basestring):
+            data = (data,)
         with open(stage_fname, 'w+') as fd:
-            fd.write(data)
+            for chunk in data:
+                fd.write(chunk)
         return stage_fname
 
     def run_checkzone(self, zone_file, root_domain):
@@ -153,6 +245,65 @@ class DNSBuilder(MutexMixin, Logger):
                         .format(root_domain.name)
         )
 
+    def check_zone(self, zone_file, root_domain):
+        """Check the structure of the zone file in-process. If there are
+        problems raise an exception.
+        """
+        with open(zone_file) as fd:
+            errors = check_zone(fd, root_domain.name)
+        if errors:
+            self.error('Zone check failed on zone {0}:\n{1}'
+                       .format(root_domain.name, '\n'.join(errors)),
+                       root_domain=root_domain)
+
+    def run_checkzones(self, checks):
+        """
+        Run named-checkzone on each (zone job, zone file) pair in `checks`.
+        Zones that fail are scheduled to be rebuilt before the error is
+        raised.
+        """
+        if not checks:
+            return
+        self.log_debug('Running named-checkzone on {0} zone files'
+                       .format(len(checks)))
+        with self.timed('check'):
+            failures = self.run_concurrently(
+                self.run_checkzone,
+                [(zone_file, job[1]) for job, zone_file in checks])
+        if failures:
+            failed_zones = set(root_domain for (_, root_domain), _
+                               in failures)
+            for job, _ in checks:
+                if job[1] in failed_zones:
+                    job[0].schedule_rebuild()
+            self.error('\n'.join(error for _, error in failures))
+
+    def run_concurrently(self, func, args_list):
+        """
+        Call `func` with each tuple of arguments in `args_list`, running up to
+        `check_jobs` calls at a time. Since the checks are separate processes,
+        threads are enough to run them in parallel.
+
+        Return (arguments, error message) for each call that raised.
+        """
+        def call(args):
+            try:
+                func(*args)
+            except Exception as e:
+                return args, unicode(e)
+            return args, None
+
+        if self.check_jobs > 1 and len(args_list) > 1:
+            pool = ThreadPool(min(self.check_jobs, len(args_list)))
+            try:
+                results = pool.map(call, args_list)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(call, args_list)
+        return [(args, error) for args, error in results if error]
+
     def run_checkconf(self, conf_file):
         self.run_command(
             ' '.join((self.named_checkconf, conf_file)),
@@ -172,18 +323,51 @@ class DNSBuilder(MutexMixin, Logger):
             fd.write(stmts)
         return stage_config
 
-    def build_zone(self, view, file_meta, view_data, root_domain):
+    def build_zone(self, view, file_meta, soa_data, view_data, root_domain,
+                   serial):
         """
-        This function will write the zone's zone file to the staging area and
-        call named-checkconf on the files.
+        This function will stream the zone's zone file to the staging area,
+        hashing it as it goes. `soa_data` is written first, with `serial`
+        filled in, but the hash is taken without the serial so that a serial
+        bump alone doesn't change it. If `view_data` is empty, no file is
+        written.
+
+        Return the hash and the path to the file, or None if there is no
+        file.
         """
+        t_start = time.time()  # tic
+        zhash = hashlib.sha1()
+        view_data = iter(self.timed_iter('render', view_data))
+        try:
+            first = next(view_data)
+        except StopIteration:
+            # Though there is no zone file, we keep it in the
+            # config to claim authority (for DNS poison, etc.)
+            self.log_debug(
+                '< {0} > No data found in this view. '
+                'No zone file will be made, but it will be '
+                'included in the config for '
+                'this view.'.format(view.name),
+                root_domain=root_domain)
+            return zhash.hexdigest(), None
+
+        def hashed_data():
+            zhash.update(soa_data.encode('utf-8'))
+            yield soa_data.format(serial=serial)
+            for data in chain((first,), view_data):
+                zhash.update(data.encode('utf-8'))
+                yield data
+
         stage_fname = os.path.join(self.stage_dir, file_meta['rel_fname'])
-        self.write_stage_zone(
-            stage_fname, root_domain, file_meta['rel_fname'], view_data
-        )
+        with self.timed('write'):
+            self.write_stage_zone(
+                stage_fname, root_domain, file_meta['rel_fname'],
+                hashed_data())
         self.log_debug(
-            "Built stage_{0}_file to {1}".format(view.name, stage_fname),
+            "Built stage_{0}_file to {1} in {2} seconds"
+            .format(view.name, stage_fname, time.time() - t_start),
             root_domain=root_domain)
+        return zhash.hexdigest(), stage_fname
 
     def calc_fname(self, view, root_domain):
         return "{0}.{1}".format(root_domain.name, view.name)
@@ -202,9 +386,126 @@ class DNSBuilder(MutexMixin, Logger):
         zone_stmt += '}};\n'
         return zone_stmt
 
+    def get_prod_zone_stmts(self, ztype='master'):
+        """
+        Read the zone statements in the production config files. Return them
+        as templates like those :func:`render_zone_stmt` returns, in a dict
+        of dicts: {view name: {zone name: zone statement}}.
+        """
+        config_dir = os.path.join(self.prod_dir, 'config')
+        prefix = ztype + '.'
+        if not os.path.isdir(config_dir):
+            self.error('There is no production config in {0}. Build every '
+                       'zone first.'.format(config_dir))
+
+        prod_stmts = {}
+        for config_fname in os.listdir(config_dir):
+            if not config_fname.startswith(prefix):
+                continue
+            with open(os.path.join(config_dir, config_fname)) as fd:
+                config = fd.read()
+            view_stmts = prod_stmts[config_fname[len(prefix):]] = {}
+            for match in ZONE_STMT_RE.finditer(config):
+                view_stmts[match.group(1)] = (
+                    match.group(0).replace('{', '{{').replace('}', '}}')
+                    .replace('\ttype {0};'.format(ztype), '\ttype {ztype};'))
+        return prod_stmts
+
+    def merge_zone_stmts(self, zone_stmts, zone_names):
+        """
+        Combine the zone statements of the zones in `zone_names`, as returned
+        by :func:`build_zone_files`, with the production zone statements of
+        every other zone, so the config doesn't have to be rebuilt from
+        scratch when only some zones were built.
+        """
+        prod_stmts = self.get_prod_zone_stmts()
+        stmts_by_view = {}
+        for view_name in set(prod_stmts) | set(zone_stmts):
+            view_stmts = stmts_by_view[view_name] = dict(
+                (zone_name, stmt) for zone_name, stmt
+                in prod_stmts.get(view_name, {}).iteritems()
+                if zone_name not in zone_names)
+            for stmt in zone_stmts.get(view_name, []):
+                view_stmts[ZONE_STMT_RE.match(stmt).group(1)] = stmt
+
+        # A full build orders zones by name in the database, whose collation
+        # may not match Python's string order, so the same order is used
+        # here. Zones the database doesn't know go last.
+        names = set()
+        for view_stmts in stmts_by_view.itervalues():
+            names.update(view_stmts)
+        order = dict((name, i) for i, name in enumerate(
+            SOA.objects.filter(dns_enabled=True,
+                               root_domain__name__in=names)
+                       .order_by('root_domain__name')
+                       .values_list('root_domain__name', flat=True)))
+
+        def key(item):
+            return order.get(item[0], len(order)), item[0]
+
+        return dict((view_name, [stmt for _, stmt
+                                 in sorted(view_stmts.iteritems(), key=key)])
+                    for view_name, view_stmts in stmts_by_view.iteritems())
+
+    def get_serial_index_fname(self):
+        return self.serial_index or self.prod_dir.rstrip('/') + '.serials'
+
+    def load_serial_index(self):
+        """
+        Load the serial index, which maps each production zone file (relative
+        to `prod_dir`) to its serial and the mtime and size it had when the
+        serial was read.
+        """
+        try:
+            with open(self.get_serial_index_fname()) as fd:
+                self.serials = json.load(fd)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            self.serials = {}
+        except ValueError:
+            self.log_notice('Ignoring corrupt serial index {0}'
+                            .format(self.get_serial_index_fname()))
+            self.serials = {}
+
+    def save_serial_index(self):
+        index_fname = self.get_serial_index_fname()
+        with open(index_fname + '.tmp', 'w') as fd:
+            json.dump(self.serials, fd, separators=(',', ':'))
+        os.rename(index_fname + '.tmp', index_fname)
+
+    def index_serial(self, rel_fname):
+        """
+        Read the serial of a production zone file and add it to the serial
+        index. Return the serial, or '' if there is no such file.
+        """
+        prod_fname = os.path.join(self.prod_dir, rel_fname)
+        try:
+            st = os.stat(prod_fname)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            self.serials.pop(rel_fname, None)
+            return ''
+
+        entry = self.serials.get(rel_fname)
+        if entry and entry[1:] == [st.st_mtime, st.st_size]:
+            return entry[0]
+
+        serial = get_serial(prod_fname)
+        self.serials[rel_fname] = [serial, st.st_mtime, st.st_size]
+        return serial
+
+    def get_prod_serial(self, file_meta):
+        """
+        Return the serial of a zone's production file. The file is only read
+        if its mtime or size doesn't match the serial index.
+        """
+        return self.index_serial(file_meta['rel_fname'])
+
     def verify_previous_build(self, file_meta, view, root_domain, soa):
         force_rebuild, new_serial = False, None
-        serial = get_serial(os.path.join(file_meta['prod_fname']))
+        serial = self.get_prod_serial(file_meta)
         if not serial.isdigit():
             new_serial = int(time.time())
             force_rebuild = True
@@ -262,11 +563,161 @@ class DNSBuilder(MutexMixin, Logger):
                                                file_meta['rel_fname'])
         return file_meta
 
-    def build_zone_files(self, soa_pks_to_rebuild, force=False):
-        zone_stmts = {}
+    def build_soa_views(self, soa, root_domain, views_to_build, serial,
+                        prev_zhashes=None, force=False):
+        """
+        Render, write and check the zone file of every view in
+        `views_to_build` at serial `serial`. This is the unit of work handed
+        to a worker when zones are built in parallel.
+
+        `prev_zhashes` maps file names to the hashes recorded by the last
+        successful build. Unless `force` is true, if every view renders to
+        the same content as it did then, the staged files are removed and
+        nothing is checked.
+
+        Return a dict mapping each view's file name to the hash of its
+        content, whether the zone's files were written, and the staged files
+        that still need to be checked with named-checkzone (see
+        :func:`run_checkzones`).
+        """
+        prev_zhashes = prev_zhashes or {}
+        t_start = time.time()  # tic
+        with self.timed('fetch'):
+            records = fetch_zone_records(root_domain, soa)
+        self.log_debug('Fetched {0} records in {1} seconds'
+                       .format(soa, time.time() - t_start),
+                       root_domain=root_domain)
+        soa_data = render_soa_only(soa=soa, root_domain=root_domain)
+
+        zhashes = {}
+        stage_fnames = []
+        to_check = []
+        for view, file_meta in views_to_build:
+            self.log_debug(
+                'Rebuilding < {0} > view file {1}'
+                .format(view.name, file_meta['prod_fname']),
+                root_domain=root_domain)
+            view_data = iter_zone_data(view, root_domain, soa,
+                                       logf=self.log_notice,
+                                       zone_records=records)
+            zhash, stage_fname = self.build_zone(
+                view, file_meta, soa_data, view_data, root_domain, serial)
+            zhashes[file_meta['fname']] = zhash
+            if stage_fname:
+                stage_fnames.append((stage_fname, file_meta))
+                # Content that named-checkzone accepted last time doesn't
+                # need to be checked again.
+                if (ZONE_CHECK_EXTERNAL in self.zone_checks and
+                        zhash != prev_zhashes.get(file_meta['fname'])):
+                    to_check.append(stage_fname)
+
+        if not force and all(prev_zhashes.get(fname) == zhash
+                             for fname, zhash in zhashes.iteritems()):
+            self.log_debug('Zone data is unchanged since the last build. '
+                           'NO REBUILD needed.', root_domain=root_domain)
+            for stage_fname, _ in stage_fnames:
+                os.remove(stage_fname)
+            return zhashes, False, []
+
+        for stage_fname, file_meta in stage_fnames:
+            if ZONE_CHECK_BUILTIN in self.zone_checks:
+                with self.timed('check'):
+                    self.check_zone(stage_fname, root_domain)
+            if self.delta_dir:
+                self.write_zone_delta(stage_fname, file_meta, root_domain)
+
+        return zhashes, True, to_check
+
+    def write_zone_delta(self, stage_fname, file_meta, root_domain):
+        """
+        Write an nsupdate script to `delta_dir` that turns the zone's
+        production file into the staged one. Nothing is written for a zone
+        that isn't in production yet.
+        """
+        if not os.path.exists(file_meta['prod_fname']):
+            return
+        with open(file_meta['prod_fname']) as fd:
+            old = zone_records(fd, root_domain.name)
+        with open(stage_fname) as fd:
+            new = zone_records(fd, root_domain.name)
+
+        delta_fname = os.path.join(self.delta_dir,
+                                   file_meta['rel_fname'] + '.nsupdate')
+        delta_dir = os.path.dirname(delta_fname)
+        if not os.path.exists(delta_dir):
+            os.makedirs(delta_dir)
+        with open(delta_fname, 'w') as fd:
+            fd.writelines(render_nsupdate(root_domain.name, old, new))
+        self.log_debug('Wrote nsupdate script {0}'.format(delta_fname),
+                       root_domain=root_domain)
+
+    def get_zone_hashes(self):
+        """
+        Return the content hashes recorded by the last successful build as a
+        dict of dicts: {zone name: {file name: hash}}.
+        """
+        zone_hashes = {}
+        try:
+            build_run = DNSBuildRun.objects.latest('id')
+        except DNSBuildRun.DoesNotExist:
+            return zone_hashes
+
+        for zname, fname, zhash in (build_run.get_manifests()
+                                    .values_list('zname', 'files', 'zhash')):
+            zone_hashes.setdefault(zname, {})[fname] = zhash
+        return zone_hashes
 
-        for soa in (SOA.objects.filter(dns_enabled=True)
-                               .order_by("root_domain__name")):
+    def record_zone_hashes(self):
+        """
+        Save the content hash of every zone file the last build staged, so
+        the next build can tell which zones actually changed. This is only
+        done once they've been pushed. Only the latest `keep_build_runs`
+        build runs are kept.
+        """
+        built = len(self.zones_built)
+        build_run = DNSBuildRun(log='{0} zone{1} rebuilt: {2}'.format(
+            built, 's' if built != 1 else '', ', '.join(self.zones_built)))
+        build_run.save()
+        build_run.record_hashes(self.zone_hashes)
+        if self.keep_build_runs is not None:
+            kept = list(DNSBuildRun.objects.order_by('-id')
+                        .values_list('id', flat=True)[:self.keep_build_runs])
+            DNSBuildRun.objects.filter(id__lt=min(kept)).delete()
+
+    def get_zone_soas(self, zone_names):
+        """
+        Return the SOAs of the DNS-enabled zones named in `zone_names`. If
+        any of them doesn't exist, raise an exception.
+        """
+        soas = list(SOA.objects.filter(dns_enabled=True,
+                                       root_domain__name__in=zone_names)
+                               .select_related('root_domain')
+                               .order_by('root_domain__name'))
+        missing = set(zone_names).difference(
+            soa.root_domain.name for soa in soas)
+        if missing:
+            self.error('No DNS-enabled zone named {0}'.format(
+                ', '.join(sorted(missing))))
+        return soas
+
+    def build_zone_files(self, soa_pks_to_rebuild, force=False, soas=None):
+        """
+        Build the zone files of every DNS-enabled zone, or only those of the
+        zones in `soas`. Return the zone statements of the zones that were
+        looked at, as a dict: {view name: [zone statement]}.
+        """
+        zone_stmts = {}
+        zone_jobs = []
+        prev_zone_hashes = self.get_zone_hashes()
+        self.load_serial_index()
+        # The hashes of zones that aren't looked at are carried over.
+        self.zone_hashes = {} if soas is None else dict(prev_zone_hashes)
+        self.zones_built = []
+
+        if soas is None:
+            soas = (SOA.objects.filter(dns_enabled=True)
+                               .order_by("root_domain__name"))
+        for soa in soas:
             # If anything happens during this soa's build we need to mark
             # it as dirty so it can be rebuild
             try:
@@ -282,18 +733,31 @@ class DNSBuilder(MutexMixin, Logger):
                 # the zone is new, trigger the rebuilding of all the zone's
                 # view files. (Rebuilding all views in a zone keeps the serial
                 # synced across all views.)
-                # * Either rebuild all of a zone's view files because one view
-                # needed to be rebuilt due to tampering or the zone was dirty
-                # (again, this is to keep their serial synced) or just call
-                # named-checkzone on the existing zone files for good measure.
+                # * Either queue all of a zone's view files for rebuilding
+                # because one view needed to be rebuilt due to tampering or the
+                # zone was dirty (again, this is to keep their serial synced)
+                # or leave the existing zone files alone.
                 # Also generate a zone statement and add it to a dictionary for
                 # later use during BIND configuration generation.
+                # * Once every zone has been looked at, build the queued zones,
+                # possibly in parallel (see :func:`build_zones`).
 
+                # If a zone is only dirty, it is rendered but not rewritten
+                # unless its content differs from the last successful build.
+                # New, tampered-with and forced zones are always rewritten.
                 force_rebuild = (soa.pk in soa_pks_to_rebuild or soa.dirty
                                  or force)
-                if force_rebuild:
+                must_rebuild = force
+                if soa.dirty:
+                    # soa may have been read from the snapshot, so saving it
+                    # would write its stale fields back to the primary. Only
+                    # the flag is cleared.
+                    SOA.objects.using(DEFAULT_DB_ALIAS).filter(
+                        pk=soa.pk, dirty=True).update(dirty=False)
                     soa.dirty = False
-                    soa.save()
+
+                prev_zhashes = prev_zone_hashes.get(root_domain.name, {})
+                self.zone_hashes[root_domain.name] = prev_zhashes
 
                 self.log_debug('====== Processing {0} {1} ======'.format(
                     root_domain, soa.serial)
@@ -304,32 +768,6 @@ class DNSBuilder(MutexMixin, Logger):
                     root_domain=root_domain
                 )
 
-                def get_view_data(view):
-                    self.log_debug("++++++ Looking at < {0} > view ++++++"
-                                   .format(view.name), root_domain=root_domain)
-                    t_start = time.time()  # tic
-                    view_data = build_zone_data(view, root_domain, soa,
-                                                logf=self.log_notice)
-                    build_time = time.time() - t_start  # toc
-                    self.log_debug('< {0} > Built {1} data in {2} seconds'
-                                   .format(view.name, soa, build_time),
-                                   root_domain=root_domain)
-                    if not view_data:
-                        # Though there is no zone file, we keep it in the
-                        # config to claim authority (for DNS poison, etc.)
-                        self.log_debug(
-                            '< {0} > No data found in this view. '
-                            'No zone file will be made, but it will be '
-                            'included in the config for '
-                            'this view.'.format(view.name),
-                            root_domain=root_domain)
-                        return None
-                    self.log_debug(
-                        '< {0} > Non-empty data set for this '
-                        'view. Its zone file will be included in the '
-                        'config.'.format(view.name), root_domain=root_domain)
-                    return view_data
-
                 # This for loop decides which views will be canidates for
                 # rebuilding.
                 for view in View.objects.all():
@@ -347,6 +785,7 @@ class DNSBuilder(MutexMixin, Logger):
                     if was_bad_prev:
                         soa.serial = new_serial
                         force_rebuild = True
+                        must_rebuild = True
 
                     views_to_build.append(
                         (view, file_meta)
@@ -358,13 +797,19 @@ class DNSBuilder(MutexMixin, Logger):
                     ), root_domain=root_domain
                 )
 
-                if force_rebuild:
+                if must_rebuild:
                     # Bypass save so we don't have to save a possible stale
                     # 'dirty' value to the db.
                     SOA.objects.filter(pk=soa.pk).update(serial=soa.serial + 1)
                     self.log_debug('Zone will be rebuilt at serial {0}'
                                    .format(soa.serial + 1),
                                    root_domain=root_domain)
+                elif force_rebuild:
+                    # The serial is bumped once we know the zone changed.
+                    # See :func:`finish_zone`.
+                    self.log_debug('Zone will be rebuilt at serial {0} if '
+                                   'its data changed'.format(soa.serial + 1),
+                                   root_domain=root_domain)
                 else:
                     self.log_debug('Zone is stable at serial {0}'
                                    .format(soa.serial),
@@ -383,43 +828,104 @@ class DNSBuilder(MutexMixin, Logger):
                             self.render_zone_stmt(soa, root_domain, file_meta)
                         )
 
-                    # If it's dirty or we are rebuilding another view, rebuild
-                    # the zone
-                    if force_rebuild:
-                        self.log_debug(
-                            'Rebuilding < {0} > view file {1}'
-                            .format(view.name, file_meta['prod_fname']),
-                            root_domain=root_domain)
-                        view_data = get_view_data(view)
-                        if view_data is None:
-                            continue
-                        self.build_zone(
-                            view, file_meta,
-                            # Lazy string evaluation
-                            view_data.format(serial=soa.serial + 1),
-                            root_domain
-                        )
-                        self.run_checkzone(
-                            os.path.join(self.stage_dir,
-                                         file_meta['rel_fname']),
-                            root_domain)
-                    else:
+                    if not force_rebuild:
                         self.log_debug(
                             'NO REBUILD needed for < {0} > view file {1}'
                             .format(view.name, file_meta['prod_fname']),
                             root_domain=root_domain
                         )
+
+                # If it's dirty or we are rebuilding another view, rebuild
+                # the zone
+                if force_rebuild:
+                    zone_jobs.append(
+                        (soa, root_domain, views_to_build, soa.serial + 1,
+                         prev_zhashes, must_rebuild))
             except Exception:
                 soa.schedule_rebuild()
                 raise
 
+        self.build_zones(zone_jobs)
+
         return zone_stmts
 
+    def build_zones(self, zone_jobs):
+        """
+        Build every zone in `zone_jobs`. Zones are independent of each other,
+        so when `jobs` is greater than one they are handed out to a pool of
+        worker processes.
+
+        If a zone fails to build, it and every zone that hasn't finished
+        building are scheduled to be rebuilt before the error is raised. (Their
+        dirty flags were cleared while the build was being planned.)
+        """
+        remaining = dict((job[0].pk, job) for job in zone_jobs)
+
+        try:
+            # Workers can't read from this process's snapshot.
+            if self.jobs > 1 and len(zone_jobs) > 1 and not self.snapshot_db:
+                checks = self.build_zones_parallel(zone_jobs, remaining)
+            else:
+                checks = []
+                for job in zone_jobs:
+                    zhashes, changed, to_check = self.build_soa_views(*job)
+                    self.finish_zone(remaining.pop(job[0].pk), zhashes,
+                                     changed)
+                    checks.extend((job, zone_file) for zone_file in to_check)
+        except Exception:
+            for job in remaining.values():
+                job[0].schedule_rebuild()
+            raise
+
+        self.run_checkzones(checks)
+
+    def finish_zone(self, zone_job, zhashes, changed):
+        soa, root_domain, _, serial, _, force = zone_job
+        self.zone_hashes[root_domain.name] = zhashes
+        if not changed:
+            self.log_debug('Zone is stable at serial {0}'.format(soa.serial),
+                           root_domain=root_domain)
+            return
+
+        self.zones_built.append(root_domain.name)
+        if not force:
+            # This zone was only dirty, so its serial hasn't been bumped yet.
+            SOA.objects.filter(pk=soa.pk).update(serial=serial)
+
+    def build_zones_parallel(self, zone_jobs, remaining):
+        self.log_debug('Building {0} zones with {1} workers'.format(
+            len(zone_jobs), self.jobs))
+        # Forked workers must not share the parent's database connections.
+        for conn in connections.all():
+            conn.close()
+        pool = Pool(self.jobs, initializer=_init_zone_worker,
+                    initargs=(self.builder_opts,))
+        try:
+            results = pool.imap_unordered(_build_zone_job, [
+                (soa.pk, [(view.pk, file_meta)
+                          for view, file_meta in views_to_build],
+                 serial, prev_zhashes, force)
+                for soa, _, views_to_build, serial, prev_zhashes, force
+                in zone_jobs])
+            checks = []
+            for soa_pk, failure, zhashes, changed, to_check in results:
+                if failure:
+                    self.error(failure, root_domain=remaining[soa_pk][1])
+                job = remaining.pop(soa_pk)
+                self.finish_zone(job, zhashes, changed)
+                checks.extend((job, zone_file) for zone_file in to_check)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return checks
+
     def build_view_config(self, view_name, ztype, stmts):
         config_fname = "{0}.{1}".format(ztype, view_name)
         zone_stmts = '\n'.join(stmts).format(ztype=ztype)
-        stage_config = self.write_stage_config(config_fname, zone_stmts)
-        self.run_checkconf(stage_config)
+        return self.write_stage_config(config_fname, zone_stmts)
 
     def build_config_files(self, zone_stmts):
         # named-checkconf on config files
@@ -429,12 +935,60 @@ class DNSBuilder(MutexMixin, Logger):
                 ' | '.join([view_name for view_name in zone_stmts.keys()])
             )
         )
+        stage_configs = []
         for view_name, view_stmts in zone_stmts.iteritems():
             self.log_debug("Building config for view < {0} >"
                            .format(view_name))
-            self.build_view_config(view_name, 'master', view_stmts)
+            with self.timed('config'):
+                stage_configs.append(
+                    self.build_view_config(view_name, 'master', view_stmts))
+
+        with self.timed('check'):
+            failures = self.run_concurrently(
+                self.run_checkconf,
+                [(conf_file,) for conf_file in stage_configs])
+        if failures:
+            self.error('\n'.join(error for _, error in failures))
+
+    @contextmanager
+    def build_snapshot(self):
+        """
+        Read everything inside the block from one snapshot of `snapshot_db`,
+        if it's set. The snapshot must include the serials, dirty flags and
+        hashes written by the last build, so wait up to `snapshot_max_lag`
+        seconds for the replica to catch up with it.
+        """
+        if not self.snapshot_db:
+            yield
+            return
+
+        last_run = (DNSBuildRun.objects.using(DEFAULT_DB_ALIAS)
+                    .aggregate(Max('id'))['id__max'])
+        give_up = time.time() + self.snapshot_max_lag
+        while True:
+            with read_snapshot(self.snapshot_db):
+                seen_run = DNSBuildRun.objects.aggregate(Max('id'))['id__max']
+                if seen_run >= last_run:
+                    self.log_debug('Reading from a snapshot of {0}'.format(
+                        self.snapshot_db))
+                    yield
+                    return
+            if time.time() > give_up:
+                self.error('{0} is still behind the last build after {1} '
+                           'seconds'.format(self.snapshot_db,
+                                            self.snapshot_max_lag))
+            time.sleep(1)
+
+    def build(self, force=False, zones=None):
+        """
+        Build the zones that need to be rebuilt, or every zone if `force` is
+        true, and their config.
 
-    def build(self, force=False):
+        If `zones` is a list of zone names, only those zones are built
+        (whether or not they need to be) and every other zone is left alone.
+        Their statements in the production config are reused, and their
+        scheduled rebuilds stay scheduled.
+        """
         try:
             with open(self.stop_file) as stop_fd:
                 now = time.time()
@@ -456,19 +1010,44 @@ class DNSBuilder(MutexMixin, Logger):
                 raise
 
         self.log_info('Building...')
+        self.stage_stats = {}
+        self.zone_hashes = None
 
         try:
             remove_dir_contents(self.stage_dir)
-            self.dns_tasks = self.get_scheduled()
-
-            if not self.dns_tasks and not force:
-                self.log_info('Nothing to do!')
-                return
+            # Scripts from earlier builds may apply to zones that have since
+            # changed, so only this build's are kept.
+            if self.delta_dir and os.path.isdir(self.delta_dir):
+                remove_dir_contents(self.delta_dir)
+            # Time that isn't spent in another stage is spent planning.
+            with self.timed('plan'), self.build_snapshot():
+                self.dns_tasks = self.get_scheduled()
+
+                if zones is not None:
+                    soas = self.get_zone_soas(zones)
+                    soa_pks_to_rebuild = set(soa.pk for soa in soas)
+                    self.dns_tasks = [t for t in self.dns_tasks
+                                      if int(t.task) in soa_pks_to_rebuild]
+                    zone_stmts = self.merge_zone_stmts(
+                        self.build_zone_files(soa_pks_to_rebuild, force=force,
+                                              soas=soas),
+                        zones)
+                # A zone may have been marked dirty while its tasks were being
+                # deleted by the last build, so check for dirty zones too.
+                elif (not self.dns_tasks and not force and
+                        not SOA.objects.filter(dns_enabled=True,
+                                               dirty=True).exists()):
+                    self.log_info('Nothing to do!')
+                    return
+                else:
+                    soa_pks_to_rebuild = set(int(t.task)
+                                             for t in self.dns_tasks)
+                    zone_stmts = self.build_zone_files(soa_pks_to_rebuild,
+                                                       force=force)
 
-            # zone files
-            soa_pks_to_rebuild = set(int(t.task) for t in self.dns_tasks)
-            self.build_config_files(self.build_zone_files(soa_pks_to_rebuild,
-                                    force=force))
+                self.build_config_files(zone_stmts)
+            with self.timed('record'):
+                self.save_serial_index()
 
             self.log_info('DNS build successful')
         except Exception as e:
@@ -477,16 +1056,106 @@ class DNSBuilder(MutexMixin, Logger):
             raise
 
     def push(self, sanity_check=True):
-        self.repo.reset_and_pull()
+        """
+        Copy the files written by the last build to prod_dir, and commit and
+        push them. Only those files are reset, copied and added, so the rest
+        of the repo isn't scanned.
+        """
+        # The staging area is emptied at the start of every build, and zone
+        # files that didn't change are removed from it, so it holds exactly
+        # the files this build wrote.
+        staged = list_files(self.stage_dir)
+        self.repo.reset_and_pull(staged)
 
         try:
-            copy_tree(self.stage_dir, self.prod_dir)
+            copy_files(self.stage_dir, self.prod_dir, staged)
+            self.repo.commit_and_push('Update config',
+                                      sanity_check=sanity_check, paths=staged)
         except:
-            self.repo.reset_to_head()
+            self.repo.reset_to_head(staged)
             raise
 
-        self.repo.commit_and_push('Update config', sanity_check=sanity_check)
-        map(lambda t: t.delete(), self.dns_tasks)
+        # Recorded only now, so that if the push fails, the next build still
+        # compares against what's in prod_dir and rebuilds these zones.
+        if self.zone_hashes is not None:
+            with self.timed('record'):
+                self.record_zone_hashes()
+            self.zone_hashes = None
+
+        Task.objects.filter(pk__in=[t.pk for t in self.dns_tasks]).delete()
+
+        # Index the zone files that were just pushed.
+        self.load_serial_index()
+        for rel_fname in staged:
+            if not rel_fname.startswith('config' + os.sep):
+                self.index_serial(rel_fname)
+        self.save_serial_index()
+
+    def get_queue_state(self):
+        """
+        Return a value that changes whenever a zone is scheduled to be
+        rebuilt, and is false if there is nothing to build.
+        """
+        # End the current transaction so rows committed by other processes
+        # since it began are visible.
+        transaction.commit_unless_managed()
+        # Rescheduling a zone that's already scheduled adds no task, but does
+        # bump the task's scheduled_count.
+        tasks = Task.dns.aggregate(Max('id'), Sum('scheduled_count'))
+        last_task = tasks['id__max']
+        dirty = SOA.objects.filter(dns_enabled=True, dirty=True).count()
+        if not last_task and not dirty:
+            return None
+        return last_task, tasks['scheduled_count__sum'], dirty
+
+    def wait_for_changes(self, built_state=None):
+        """
+        Block until zones have been scheduled to be rebuilt, then until none
+        have been scheduled for `daemon_debounce` seconds or the first change
+        has waited `daemon_max_delay` seconds. Changes already seen when the
+        queue was in `built_state` are ignored. Return the queue's state.
+        """
+        first_change = last_change = last_state = None
+        while True:
+            state = self.get_queue_state()
+            now = time.time()
+            if state is None or state == built_state:
+                first_change = last_change = last_state = None
+            else:
+                if state != last_state:
+                    last_state, last_change = state, now
+                    first_change = first_change or now
+                if (now - last_change >= self.daemon_debounce or
+                        now - first_change >= self.daemon_max_delay):
+                    return state
+            time.sleep(self.daemon_poll_interval)
+
+    def run_daemon(self, push=False, sanity_check=True):
+        """
+        Build (and push) whenever zones are scheduled to be rebuilt, until the
+        process is stopped. A failed build is reported and retried after
+        `daemon_retry_interval` seconds. While the stop file exists,
+        :func:`build` refuses to run, so nothing is built.
+        """
+        self.log_info('Waiting for changes...')
+        built_state = None
+        while True:
+            try:
+                state = self.wait_for_changes(built_state)
+                self.build()
+                if push:
+                    self.push(sanity_check=sanity_check)
+            except Exception as e:
+                if not os.path.exists(self.stop_file):
+                    fail_mail('DNS build failed.\nOriginal exception: ' +
+                              e.message, subject='DNS build failed')
+                # Reconnect next time in case the connection was lost.
+                for conn in connections.all():
+                    conn.close()
+                time.sleep(self.daemon_retry_interval)
+                continue
+            # Without a push, the tasks that were built are still queued.
+            built_state = None if push else state
 
     def _lock_failure(self, pid):
         fail_mail(
@@ -497,3 +1166,33 @@ class DNSBuilder(MutexMixin, Logger):
         self.error(
             'Failed to acquire lock on {0}. Process {1} currently '
             'has it.'.format(self.lock_file, pid))
+
+
+# The DNSBuilder used by a zone worker process. See DNSBuilder.build_zones.
+_zone_worker = None
+
+
+def _init_zone_worker(builder_opts):
+    global _zone_worker
+    _zone_worker = DNSBuilder(**builder_opts)
+
+
+def _build_zone_job(job):
+    """
+    Build one zone in a worker process. Return the SOA's pk, the formatted
+    exception if the build failed, and the results of
+    :func:`DNSBuilder.build_soa_views`.
+    """
+    soa_pk, views_to_build, serial, prev_zhashes, force = job
+    try:
+        soa = SOA.objects.select_related('root_domain').get(pk=soa_pk)
+        views = View.objects.in_bulk([pk for pk, _ in views_to_build])
+        zhashes, changed, to_check = _zone_worker.build_soa_views(
+            soa, soa.root_domain,
+            [(views[view_pk], file_meta)
+             for view_pk, file_meta in views_to_build],
+            serial, prev_zhashes, force)
+    except Exception:
+        return (soa_pk, ''.join(format_exception(*sys.exc_info())),
+                None, False, [])
+    return soa_pk, None, zhashes, changed, to_check
@@ -21,6 +21,19 @@ class DNSBuildRun(models.Model):
         bm.save()
         return bm
 
+    def record_hashes(self, zone_hashes):
+        """
+        Record one :class:`BuildManifest` per zone file.
+
+        :param zone_hashes: {zone name: {file name: hash}}
+        """
+        BuildManifest.objects.bulk_create([
+            BuildManifest(zname=zname, files=fname, zhash=zhash,
+                          build_run=self)
+            for zname, zhashes in zone_hashes.iteritems()
+            for fname, zhash in zhashes.iteritems()
+        ])
+
     def stash(self, k, v):
         self.stats_json[k] = v
 
@@ -30,7 +30,8 @@ def _str_get_serial(text):
     # We already know it's in valid format.
     isSOA = False
     done = False
-    for raw_line in text.readlines():
+    # Iterate lazily; the SOA is near the top of the file.
+    for raw_line in text:
         if done:
             break
 
@@ -1,17 +1,22 @@
 import os
 import shutil
 from django.core.management import call_command
-from django.test import TestCase
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test import TestCase, TransactionTestCase
 from time import sleep
 
-from cyder.base.utils import remove_dir_contents
-from cyder.base.vcs import GitRepo, GitRepoManager, SanityCheckFailure
+from cyder.base.utils import remove_dir_contents, shell_out
+from cyder.base.vcs import (ChdirHandler, GitRepo, GitRepoManager,
+                            SanityCheckFailure)
 from cyder.core.system.models import System
 from cyder.cydhcp.interface.static_intr.models import StaticInterface
 from cyder.cydhcp.range.models import Range
 from cyder.cydns.cname.models import CNAME
 from cyder.cydns.cybind.builder import DNSBuilder
+from cyder.cydns.cybind.models import DNSBuildRun
+from cyder.cydns.cybind.zone_delta import apply_nsupdate, zone_records
 from cyder.cydns.domain.models import Domain
+from cyder.cydns.soa.models import SOA
 from cyder.cydns.view.models import View
 
 
@@ -32,7 +37,7 @@ BINDBUILD = {
 PROD_ORIGIN_DIR = '/tmp/cyder_dns_test/prod_origin/'
 
 
-class DNSBuildTest(TestCase):
+class DNSBuildTestMixin(object):
     fixtures = ['dns_build_test.json']
 
     def setUp(self):
@@ -55,10 +60,26 @@ class DNSBuildTest(TestCase):
         mgr.clone(PROD_ORIGIN_DIR, BINDBUILD['prod_dir'])
 
         self.builder = DNSBuilder(verbose=False, debug=False, **BINDBUILD)
+        if os.path.exists(self.builder.get_serial_index_fname()):
+            os.remove(self.builder.get_serial_index_fname())
         self.builder.repo.commit_and_push(empty=True, message='Initial commit')
 
-        super(DNSBuildTest, self).setUp()
+        super(DNSBuildTestMixin, self).setUp()
 
+    def get_zone_files(self):
+        zone_files = {}
+        for dirpath, dirnames, filenames in os.walk(BINDBUILD['prod_dir']):
+            if '.git' in dirnames:
+                dirnames.remove('.git')
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(path, BINDBUILD['prod_dir'])
+                with open(path) as fd:
+                    zone_files[rel_path] = fd.read()
+        return zone_files
+
+
+class DNSBuildTest(DNSBuildTestMixin, TestCase):
     def test_force(self):
         """Test that the 'force' argument works"""
 
@@ -98,6 +119,223 @@ class DNSBuildTest(TestCase):
 
         self.assertNotEqual(rev1, rev2)
 
+    def test_unchanged_zone(self):
+        """Test that a dirty zone whose data hasn't changed isn't rebuilt"""
+
+        self.builder.build(force=True)
+        self.builder.push(sanity_check=False)
+        rev1 = self.builder.repo.get_revision()
+        soa = Domain.objects.get(name='example.com').soa
+        serial1 = SOA.objects.get(pk=soa.pk).serial
+
+        soa.schedule_rebuild()
+
+        sleep(1)  # Ensure different serial if rebuilt.
+        self.builder.build()
+        self.builder.push(sanity_check=False)
+        rev2 = self.builder.repo.get_revision()
+        serial2 = SOA.objects.get(pk=soa.pk).serial
+
+        self.assertEqual(rev1, rev2)
+        self.assertEqual(serial1, serial2)
+
+    def test_zone_delta(self):
+        """Test that nsupdate scripts turn the old zones into the new ones"""
+
+        self.builder.build(force=True)
+        self.builder.push(sanity_check=False)
+        old_files = self.get_zone_files()
+
+        self.builder.delta_dir = '/tmp/cyder_dns_test/deltas'
+        if os.path.isdir(self.builder.delta_dir):
+            shutil.rmtree(self.builder.delta_dir)
+        os.makedirs(self.builder.delta_dir)
+        stale_fname = os.path.join(self.builder.delta_dir, 'stale.nsupdate')
+        with open(stale_fname, 'w') as fd:
+            fd.write('send\n')
+        CNAME.objects.get(fqdn='foo.example.com').delete()
+        Domain.objects.get(name='example.com').soa.schedule_rebuild()
+        self.builder.build()
+        self.assertFalse(os.path.exists(stale_fname))
+
+        deltas = 0
+        for dirpath, _, filenames in os.walk(self.builder.delta_dir):
+            for filename in filenames:
+                rel_fname = os.path.relpath(
+                    os.path.join(dirpath, filename),
+                    self.builder.delta_dir)[:-len('.nsupdate')]
+                # Zone files are named <zone>.<view>.
+                origin = os.path.basename(rel_fname).rsplit('.', 1)[0]
+                old = zone_records(old_files[rel_fname].splitlines(True),
+                                   origin)
+                with open(os.path.join(self.builder.stage_dir,
+                                       rel_fname)) as fd:
+                    new = zone_records(fd, origin)
+                with open(os.path.join(dirpath, filename)) as fd:
+                    updated = apply_nsupdate(old, fd)
+
+                self.assertNotEqual(old, updated)
+                # The serial is the new file's too.
+                self.assertEqual(new, updated)
+                deltas += 1
+        self.assertTrue(deltas)
+
+    def test_targeted_build(self):
+        """Test that building one zone leaves the other zones alone"""
+
+        self.builder.build(force=True)
+        self.builder.push(sanity_check=False)
+        files1 = self.get_zone_files()
+
+        CNAME.objects.get(fqdn='foo.example.com').delete()
+        org_soa = Domain.objects.get(name='example.org').soa
+        org_soa.schedule_rebuild()
+
+        sleep(1)  # Ensure different serial if rebuilt.
+        self.builder.build(zones=['example.com'])
+        self.builder.push(sanity_check=False)
+        files2 = self.get_zone_files()
+
+        self.assertEqual(sorted(files1), sorted(files2))
+        for fname in files1:
+            if os.path.basename(fname).startswith('example.com.'):
+                self.assertNotEqual(files1[fname], files2[fname])
+            else:
+                self.assertEqual(files1[fname], files2[fname])
+        self.assertTrue(SOA.objects.get(pk=org_soa.pk).dirty)
+
+        self.assertRaises(Exception, self.builder.build,
+                          zones=['nonexistent.com'])
+
+    def test_push_written_files(self):
+        """Test that push only commits the files the build wrote"""
+
+        self.builder.build(force=True)
+        self.builder.push(sanity_check=False)
+
+        CNAME.objects.get(fqdn='foo.example.com').delete()
+        self.builder.build()
+        self.builder.push(sanity_check=False)
+
+        with ChdirHandler(BINDBUILD['prod_dir']):
+            out, _, _ = shell_out('git show --name-only --format= HEAD')
+        changed = [fname for fname in out.splitlines() if fname]
+        self.assertTrue(changed)
+        for fname in changed:
+            self.assertTrue(fname.startswith('config/') or
+                            os.path.basename(fname).startswith('example.com.'))
+
+    def test_push_resets_other_changes(self):
+        """Test that push doesn't leave changes to other files behind"""
+
+        self.builder.build(force=True)
+        self.builder.push(sanity_check=False)
+
+        stray_fname = os.path.join(BINDBUILD['prod_dir'], 'stray')
+        with open(stray_fname, 'w') as fd:
+            fd.write('stray\n')
+        with ChdirHandler(BINDBUILD['prod_dir']):
+            shell_out('git add stray')
+
+        CNAME.objects.get(fqdn='foo.example.com').delete()
+        self.builder.build()
+        self.builder.push(sanity_check=False)
+
+        self.assertFalse(os.path.exists(stray_fname))
+        with ChdirHandler(BINDBUILD['prod_dir']):
+            out, _, _ = shell_out('git status --porcelain')
+        self.assertEqual(out, '')
+
+    def test_keep_build_runs(self):
+        """Test that old build runs are pruned but recent ones are kept"""
+
+        self.builder.keep_build_runs = 2
+        run_ids = []
+        for _ in range(3):
+            self.builder.build(force=True)
+            self.builder.push(sanity_check=False)
+            run_ids.append(DNSBuildRun.objects.latest('id').id)
+            sleep(1)  # Ensure different serial if rebuilt.
+
+        self.assertEqual(
+            sorted(DNSBuildRun.objects.values_list('id', flat=True)),
+            run_ids[1:])
+
+    def test_hashes_recorded_on_push(self):
+        """Test that zone hashes are only recorded once they're pushed"""
+
+        self.builder.build(force=True)
+        self.assertFalse(DNSBuildRun.objects.exists())
+        self.builder.push(sanity_check=False)
+        self.assertEqual(DNSBuildRun.objects.count(), 1)
+
+        self.assertRaises(Exception, DNSBuilder, keep_build_runs=0,
+                          **BINDBUILD)
+
+    def test_profile(self):
+        """Test that profiled builds are timed stage by stage"""
+
+        self.builder.profile = True
+        self.builder.build(force=True)
+        self.builder.push(sanity_check=False)
+        stats = self.builder.stage_stats
+
+        for stage in ('plan', 'fetch', 'render', 'write', 'check', 'config',
+                      'record'):
+            self.assertIn(stage, stats)
+            self.assertGreaterEqual(stats[stage]['seconds'], 0)
+
+    def test_wait_for_changes(self):
+        """Test that the daemon notices scheduled zones"""
+
+        self.builder.build(force=True)
+        self.builder.push(sanity_check=False)
+        self.assertIsNone(self.builder.get_queue_state())
+
+        self.builder.daemon_poll_interval = 0
+        self.builder.daemon_debounce = 0
+        Domain.objects.get(name='example.com').soa.schedule_rebuild()
+        state = self.builder.wait_for_changes()
+        self.assertTrue(state)
+
+        # Editing a zone that's already scheduled is a change too.
+        Domain.objects.get(name='example.com').soa.schedule_rebuild()
+        self.assertNotEqual(self.builder.get_queue_state(), state)
+
+        self.builder.build()
+        self.builder.push(sanity_check=False)
+        self.assertIsNone(self.builder.get_queue_state())
+
+    def test_serial_index(self):
+        """Test that tampered zone files are caught despite the serial index"""
+
+        self.builder.build(force=True)
+        self.builder.push(sanity_check=False)
+        rev1 = self.builder.repo.get_revision()
+
+        self.builder.load_serial_index()
+        zone_files = [f for f in self.get_zone_files()
+                      if not f.startswith('config')]
+        self.assertEqual(sorted(self.builder.serials), sorted(zone_files))
+
+        sleep(1)  # Ensure different serial if rebuilt.
+        self.builder.build()
+        self.builder.push(sanity_check=False)
+        rev2 = self.builder.repo.get_revision()
+        self.assertEqual(rev1, rev2)
+
+        prod_fname = os.path.join(BINDBUILD['prod_dir'], zone_files[0])
+        with open(prod_fname) as fd:
+            data = fd.read()
+        serial = self.builder.serials[zone_files[0]][0]
+        with open(prod_fname, 'w') as fd:
+            fd.write(data.replace(serial, str(int(serial) - 1), 1))
+
+        self.builder.build()
+        self.builder.push(sanity_check=False)
+        rev3 = self.builder.repo.get_revision()
+        self.assertNotEqual(rev2, rev3)
+
     def test_sanity_check_increase(self):
         """Test sanity check when line count increases"""
 
@@ -168,3 +406,62 @@ class DNSBuildTest(TestCase):
         self.builder.build()
         self.builder.push(sanity_check=True)
 
+
+class DNSParallelBuildTest(DNSBuildTestMixin, TransactionTestCase):
+    """
+    Worker processes have their own database connections, so they can only
+    see committed data.
+    """
+
+    def test_parallel_build(self):
+        """Test that building zones in parallel gives the same files"""
+
+        self.builder.build(force=True)
+        self.builder.push(sanity_check=False)
+        sequential_files = self.get_zone_files()
+
+        self.builder.jobs = 2
+        sleep(1)  # Ensure different serial if rebuilt.
+        self.builder.build(force=True)
+        self.builder.push(sanity_check=False)
+        parallel_files = self.get_zone_files()
+
+        self.assertEqual(sorted(sequential_files), sorted(parallel_files))
+        for name in sequential_files:
+            if name.startswith('config'):
+                self.assertEqual(sequential_files[name], parallel_files[name])
+        rev1 = self.builder.repo.get_revision()
+
+        self.builder.build()
+        self.builder.push(sanity_check=False)
+        rev2 = self.builder.repo.get_revision()
+
+        self.assertEqual(rev1, rev2)
+
+    def test_snapshot_build(self):
+        """Test building from a snapshot"""
+
+        self.builder.build(force=True)
+        self.builder.push(sanity_check=False)
+        rev1 = self.builder.repo.get_revision()
+
+        # The snapshot has its own transaction, so this can't be a TestCase.
+        # Read from a second connection to the test database.
+        connections.databases['snapshot'] = dict(
+            connections.databases[DEFAULT_DB_ALIAS])
+        self.addCleanup(connections['snapshot'].close)
+        self.builder.snapshot_db = 'snapshot'
+        self.builder.jobs = 2
+        CNAME.objects.get(fqdn='foo.example.com').delete()
+        sleep(1)  # Ensure different serial if rebuilt.
+        self.builder.build()
+        self.builder.push(sanity_check=False)
+        rev2 = self.builder.repo.get_revision()
+
+        self.assertNotEqual(rev1, rev2)
+
+        self.builder.build()
+        self.builder.push(sanity_check=False)
+        rev3 = self.builder.repo.get_revision()
+
+        self.assertEqual(rev2, rev3)
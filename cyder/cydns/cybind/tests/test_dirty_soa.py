@@ -14,6 +14,7 @@ from cyder.cydns.cname.models import CNAME
 from cyder.cydns.address_record.models import AddressRecord
 from cyder.cydns.nameserver.models import Nameserver
 from cyder.cydns.tests.utils import create_zone, DNSTest
+from cyder.middleware.task_batch import TaskBatchMiddleware
 
 
 class DirtySOATests(DNSTest):
@@ -195,3 +196,39 @@ class DirtySOATests(DNSTest):
             'label': 'asdfx5',
         }
         self.generic_dirty(TXT, create_data, update_data, self.soa)
+
+    def test_schedule_coalesces(self):
+        """Test that a zone is scheduled to be rebuilt only once"""
+        Task.dns.all().delete()
+        with Task.batch():
+            for i in xrange(5):
+                TXT.objects.create(
+                    ctnr=self.ctnr, label='coalesce{0}'.format(i),
+                    domain=self.dom, txt_data='some stuff')
+            self.assertEqual(Task.dns.count(), 0)
+        self.assertEqual(list(Task.dns.values_list('task', flat=True)),
+                         [str(self.soa.pk)])
+        self.assertTrue(SOA.objects.get(pk=self.soa.pk).dirty)
+
+        TXT.objects.create(ctnr=self.ctnr, label='coalesce5', domain=self.dom,
+                           txt_data='some stuff')
+        self.assertEqual(Task.dns.count(), 1)
+
+    def test_middleware_closes_batch(self):
+        """Test that a request's batch is closed however the request ends"""
+        middleware = TaskBatchMiddleware()
+        Task.dns.all().delete()
+        middleware.process_request(None)
+        TXT.objects.create(ctnr=self.ctnr, label='leak1', domain=self.dom,
+                           txt_data='some stuff')
+        self.assertEqual(Task.dns.count(), 0)
+
+        # The last request never reached process_response.
+        middleware.process_request(None)
+        self.assertEqual(Task.dns.count(), 1)
+
+        middleware.process_exception(None, Exception())
+        Task.dns.all().delete()
+        TXT.objects.create(ctnr=self.ctnr, label='leak2', domain=self.dom,
+                           txt_data='some stuff')
+        self.assertEqual(Task.dns.count(), 1)
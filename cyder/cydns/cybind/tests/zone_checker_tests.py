@@ -0,0 +1,71 @@
+from django.test import TestCase
+
+from cyder.cydns.cybind.zone_checker import check_zone, parse_zone
+
+
+SOA = """\
+example.com.  3600  IN  SOA  ns1.example.com. hostmaster.example.com. (
+\t\t1     ; Serial
+\t\t180     ; Refresh
+\t\t86400     ; Retry
+\t\t1209600     ; Expire
+\t\t180     ; Minimum
+)
+
+"""
+
+NS = "example.com.  3600  IN  NS  ns1.example.com.\n"
+
+
+def zone(*lines):
+    return (SOA + NS + ''.join(line + '\n' for line in lines)).splitlines(True)
+
+
+class ZoneCheckerTest(TestCase):
+    def test_valid_zone(self):
+        lines = zone(
+            'www.example.com.  3600  IN  A  10.0.0.1',
+            'foo.example.com.  3600  IN  CNAME  www.example.com.',
+            '_sip._tcp.example.com.  3600  IN  SRV  0 5 5060 www',
+            'txt.example.com.  3600  IN  TXT  (',
+            '    "a (quoted; string)"',
+            '    "b")',
+            '$GENERATE   0-255  10-0-1-$.example.com.  3600  IN  A  10.0.1.$',
+        )
+        self.assertEqual(check_zone(lines, 'example.com'), [])
+        self.assertEqual(len(list(parse_zone(lines, 'example.com'))), 262)
+
+    def test_missing_soa(self):
+        errors = check_zone(NS.splitlines(True), 'example.com')
+        self.assertEqual(len(errors), 2)
+
+    def test_missing_ns(self):
+        errors = check_zone(SOA.splitlines(True), 'example.com')
+        self.assertEqual(errors, ['example.com has no NS records at its apex'])
+
+    def test_cname_and_other_data(self):
+        errors = check_zone(zone(
+            'foo.example.com.  3600  IN  CNAME  www.example.com.',
+            'foo.example.com.  3600  IN  TXT  "bar"',
+        ), 'example.com')
+        self.assertEqual(
+            errors, ['foo.example.com has a CNAME and other data (TXT)'])
+
+    def test_bad_name(self):
+        errors = check_zone(zone(
+            'b@d.example.com.  3600  IN  A  10.0.0.1',
+            'a..example.com.  3600  IN  A  10.0.0.1',
+        ), 'example.com')
+        self.assertEqual(len(errors), 2)
+
+    def test_out_of_zone(self):
+        errors = check_zone(zone(
+            'www.example.org.  3600  IN  A  10.0.0.1',
+            '$GENERATE 0-1  $.1.10.in-addr.arpa.  3600  IN  PTR  www.',
+        ), 'example.com')
+        self.assertEqual(len(errors), 3)
+
+    def test_unbalanced_parentheses(self):
+        errors = check_zone(zone('foo.example.com.  3600  IN  TXT  ("a"'),
+                            'example.com')
+        self.assertEqual(len(errors), 1)
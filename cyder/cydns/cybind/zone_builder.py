@@ -1,6 +1,8 @@
+from collections import defaultdict
+from itertools import chain
+
 from django.db.models import Q
 
-from cyder.base.constants import IP_TYPE_4, IP_TYPE_6
 from cyder.cydns.address_record.models import AddressRecord
 from cyder.cydns.cname.models import CNAME
 from cyder.cydns.mx.models import MX
@@ -9,7 +11,6 @@ from cyder.cydns.ptr.models import PTR
 from cyder.cydns.srv.models import SRV
 from cyder.cydns.txt.models import TXT
 from cyder.cydns.sshfp.models import SSHFP
-from cyder.cydns.view.models import View
 from cyder.cydhcp.interface.static_intr.models import StaticInterface
 from cyder.cydhcp.range.models import Range
 
@@ -40,140 +41,229 @@ def render_soa_only(soa, root_domain):
     return BUILD_STR
 
 
-def render_rdtype(rdtype_set, **kwargs):
+def iter_rdtype(rdtype_set, **kwargs):
+    """
+    Render every object in ``rdtype_set`` and yield the results one at a
+    time. Unless ``sort`` is False, the rendered records are sorted, so only
+    this record type is held in memory at once.
+    """
     if len(rdtype_set) == 0:
-        return ""
+        return
 
-    rdtype_set = map(lambda obj: obj.bind_render_record(**kwargs), rdtype_set)
-    rdtype_set = (r.strip() for r in rdtype_set if r.strip())
-    if kwargs.pop('sort', True):
+    sort = kwargs.pop('sort', True)
+    rdtype_set = (obj.bind_render_record(**kwargs).strip()
+                  for obj in rdtype_set)
+    rdtype_set = (r for r in rdtype_set if r)
+    if sort:
         rdtype_set = sorted(rdtype_set, key=lambda s: s.lower())
 
-    return "\n".join(rdtype_set) + "\n"
-
-
-def _render_forward_zone(default_ttl, nameserver_set, mx_set,
-                         addressrecord_set, interface_set, cname_set, srv_set,
-                         txt_set, sshfp_set, range_set):
-    BUILD_STR = ""
-    BUILD_STR += render_rdtype(nameserver_set)
-    BUILD_STR += render_rdtype(mx_set)
-    BUILD_STR += render_rdtype(txt_set)
-    BUILD_STR += render_rdtype(sshfp_set)
-    BUILD_STR += render_rdtype(srv_set)
-    BUILD_STR += render_rdtype(cname_set)
-    BUILD_STR += render_rdtype(interface_set, rdtype='A')
-    BUILD_STR += render_rdtype(addressrecord_set)
-    BUILD_STR += render_rdtype(range_set, sort=False)
-    return BUILD_STR
+    empty = True
+    for r in rdtype_set:
+        empty = False
+        yield r + "\n"
+    if empty:
+        yield "\n"
 
 
-def render_forward_zone(view, mega_filter):
-    data = _render_forward_zone(
-        default_ttl=DEFAULT_TTL,
+def iter_ranges(range_set, **kwargs):
+    """
+    Like :func:`iter_rdtype`, but unsorted and a line at a time, since a
+    single range can generate thousands of lines.
+    """
+    if len(range_set) == 0:
+        return
 
-        nameserver_set=Nameserver.objects
-        .filter(mega_filter)
-        .filter(views__name=view.name).order_by('server'),
+    empty = True
+    for rng in range_set:
+        for rec in rng.iter_generate(**kwargs):
+            empty = False
+            yield rec + "\n"
+    if empty:
+        yield "\n"
 
-        mx_set=MX.objects
-        .filter(mega_filter)
-        .filter(views__name=view.name).order_by('server'),
 
-        addressrecord_set=AddressRecord.objects
-        .filter(mega_filter).filter(views__name=view.name)
-        .order_by('pk', 'ip_type', 'fqdn', 'ip_upper', 'ip_lower'),
+def render_rdtype(rdtype_set, **kwargs):
+    return "".join(iter_rdtype(rdtype_set, **kwargs))
+
+
+def _iter_forward_zone(default_ttl, nameserver_set, mx_set,
+                       addressrecord_set, interface_set, cname_set, srv_set,
+                       txt_set, sshfp_set, range_set):
+    return chain(
+        iter_rdtype(nameserver_set),
+        iter_rdtype(mx_set),
+        iter_rdtype(txt_set),
+        iter_rdtype(sshfp_set),
+        iter_rdtype(srv_set),
+        iter_rdtype(cname_set),
+        iter_rdtype(interface_set, rdtype='A'),
+        iter_rdtype(addressrecord_set),
+        iter_ranges(range_set),
+    )
 
-        interface_set=StaticInterface.objects
-        .filter(mega_filter, dns_enabled=True)
-        .filter(views__name=view.name)
-        .order_by('pk', 'ip_type', 'fqdn', 'ip_upper', 'ip_lower'),
 
-        cname_set=CNAME.objects
-        .filter(mega_filter)
-        .filter(views__name=view.name)
-        .order_by('fqdn'),
+def records_by_view(queryset):
+    """
+    Fetch ``queryset``'s objects, then the ids of their views, with one
+    query each however many views there are, and split the objects by view
+    in one pass.
 
-        srv_set=SRV.objects
-        .filter(mega_filter)
-        .filter(views__name=view.name)
-        .order_by('pk', 'fqdn'),
+        :returns: A dict mapping a view's pk to the list of objects in that
+            view, in the queryset's order.
+    """
+    view_ids = defaultdict(list)
+    for pk, view_id in queryset.order_by().values_list('id', 'views__id'):
+        if view_id is not None:
+            view_ids[pk].append(view_id)
 
-        txt_set=TXT.objects
-        .filter(mega_filter)
-        .filter(views__name=view.name)
-        .order_by('pk', 'fqdn'),
+    by_view = defaultdict(list)
+    for obj in queryset.iterator():
+        for view_id in view_ids.get(obj.pk, ()):
+            by_view[view_id].append(obj)
+    return by_view
 
-        sshfp_set=SSHFP.objects
-        .filter(mega_filter)
-        .filter(views__name=view.name)
-        .order_by('pk', 'fqdn'),
 
-        range_set=Range.objects
-        .filter(mega_filter)
-        .filter(views__name=view.name)
-        .order_by('start_upper', 'start_lower'),
-    )
-    return data
+def view_records(zone_records, view):
+    return dict((name, by_view.get(view.pk, []))
+                for name, by_view in zone_records.iteritems())
 
 
-def _render_reverse_zone(default_ttl, nameserver_set, interface_set,
-                         ptr_set, range_set):
-    BUILD_STR = ''
-    BUILD_STR += render_rdtype(nameserver_set)
-    BUILD_STR += render_rdtype(ptr_set)
-    BUILD_STR += render_rdtype(interface_set, reverse=True, rdtype='PTR')
-    BUILD_STR += render_rdtype(range_set, reverse=True)
-    return BUILD_STR
+def fetch_forward_zone(domain_filter):
+    return {
+        'nameserver_set': records_by_view(
+            Nameserver.objects
+            .filter(domain_filter)
+            .select_related('domain').order_by('server')),
 
+        'mx_set': records_by_view(
+            MX.objects
+            .filter(domain_filter).order_by('server')),
+
+        'addressrecord_set': records_by_view(
+            AddressRecord.objects
+            .filter(domain_filter)
+            .order_by('pk', 'ip_type', 'fqdn', 'ip_upper', 'ip_lower')),
+
+        'interface_set': records_by_view(
+            StaticInterface.objects
+            .filter(domain_filter, dns_enabled=True)
+            .order_by('pk', 'ip_type', 'fqdn', 'ip_upper', 'ip_lower')),
+
+        'cname_set': records_by_view(
+            CNAME.objects
+            .filter(domain_filter)
+            .order_by('fqdn')),
+
+        'srv_set': records_by_view(
+            SRV.objects
+            .filter(domain_filter)
+            .order_by('pk', 'fqdn')),
+
+        'txt_set': records_by_view(
+            TXT.objects
+            .filter(domain_filter)
+            .order_by('pk', 'fqdn')),
+
+        'sshfp_set': records_by_view(
+            SSHFP.objects
+            .filter(domain_filter)
+            .order_by('pk', 'fqdn')),
+
+        'range_set': records_by_view(
+            Range.objects
+            .filter(domain_filter)
+            .select_related('domain')
+            .order_by('start_upper', 'start_lower')),
+    }
 
-def render_reverse_zone(view, domain_mega_filter, rdomain_mega_filter,
-                        range_set, ip_type=IP_TYPE_4):
-    data = _render_reverse_zone(
-        default_ttl=DEFAULT_TTL,
 
-        nameserver_set=Nameserver.objects.filter(domain_mega_filter).filter(
-            views__name=view.name).order_by('server'),
+def iter_forward_zone(view, zone_records):
+    return _iter_forward_zone(
+        default_ttl=DEFAULT_TTL, **view_records(zone_records, view))
 
-        interface_set=(
+
+def render_forward_zone(view, zone_records):
+    return "".join(iter_forward_zone(view, zone_records))
+
+
+def _iter_reverse_zone(default_ttl, nameserver_set, interface_set,
+                       ptr_set, range_set):
+    return chain(
+        iter_rdtype(nameserver_set),
+        iter_rdtype(ptr_set),
+        iter_rdtype(interface_set, reverse=True, rdtype='PTR'),
+        iter_rdtype(range_set, reverse=True),
+    )
+
+
+def fetch_reverse_zone(domain_filter, rdomain_filter, range_set):
+    return {
+        'nameserver_set': records_by_view(
+            Nameserver.objects
+            .filter(domain_filter)
+            .select_related('domain').order_by('server')),
+
+        'interface_set': records_by_view(
             StaticInterface.objects
-            .filter(rdomain_mega_filter, dns_enabled=True)
-            .filter(views__name=view.name)
+            .filter(rdomain_filter, dns_enabled=True)
             .order_by('pk', 'ip_type', 'label', 'ip_upper', 'ip_lower')),
 
-        ptr_set=PTR.objects.filter(rdomain_mega_filter).filter(
-            views__name=view.name).order_by('pk', 'ip_upper',
-                                            'ip_lower'),
+        'ptr_set': records_by_view(
+            PTR.objects
+            .filter(rdomain_filter)
+            .order_by('pk', 'ip_upper', 'ip_lower')),
+
+        'range_set': (records_by_view(range_set.select_related('domain'))
+                      if range_set is not None else {}),
+    }
+
+
+def iter_reverse_zone(view, zone_records):
+    return _iter_reverse_zone(
+        default_ttl=DEFAULT_TTL, **view_records(zone_records, view))
 
-        range_set=range_set
-    )
-    return data
 
+def render_reverse_zone(view, zone_records):
+    return "".join(iter_reverse_zone(view, zone_records))
 
-def build_zone_data(view, root_domain, soa, logf):
+
+def fetch_zone_records(root_domain, soa):
     """
-    This function does the heavy lifting of building a zone. It coordinates
-    getting all of the data out of the db into BIND format.
+    Fetch every record in a zone for all views at once, so each view's zone
+    file can be rendered without going back to the database. Each record
+    set takes two queries however many views there are.
 
-        :param soa: The SOA corresponding to the zone being built.
-        :type soa: SOA
+        :returns: A dict mapping the name of a record set to the dict
+            returned by :func:`records_by_view`.
+    """
+    # Every domain in the zone, the root domain included, points at the
+    # zone's SOA, so one join finds the zone's records however many
+    # subdomains it has.
+    domain_filter = Q(domain__soa=soa)
 
-        :param root_domain: The root domain of this zone.
-        :type root_domain: str
+    if not root_domain.is_reverse:
+        return fetch_forward_zone(domain_filter)
 
-        :returns public_file_path: The path to the zone file in the STAGEING
-            dir
-        :type public_file_path: str
-        :returns public_data: The data that should be written to
-            public_file_path
-        :type public_data: str
+    rdomain_filter = Q(reverse_domain__soa=soa)
 
-        :returns view_zone_file: The path to the zone file in the STAGEING dir
-        :type view_zone_file: str
-        :param view_data: The data that should be written to view_zone_file
-        :type view_data: str
+    if root_domain.ip_type == '4':
+        range_set = (root_domain.get_related_ranges()
+                                .order_by('start_upper', 'start_lower'))
+    else:
+        range_set = None
+
+    return fetch_reverse_zone(domain_filter, rdomain_filter, range_set)
+
+
+def iter_zone_data(view, root_domain, soa, logf, zone_records=None):
+    """
+    Yield a view's zone data a piece at a time, so that a zone file can be
+    written without holding all of it in memory. The SOA record, which
+    :func:`render_soa_only` renders, is left out. Nothing is yielded if the
+    zone file shouldn't be built.
+
+    The arguments are the same as :func:`build_zone_data`'s.
     """
-    ztype = 'reverse' if root_domain.is_reverse else 'forward'
     if (soa.has_record_set(view=view, exclude_ns=True) and
             not root_domain.nameserver_set.filter(views=view).exists()):
         msg = ("The {0} zone has at least one record in the {1} view, but "
@@ -183,41 +273,45 @@ def build_zone_data(view, root_domain, soa, logf):
                .format(root_domain, view.name))
         fail_mail(msg, subject="Record(s) without NS records can't be built")
         logf(msg)
-        return ''
+        return
 
-    domains = soa.domain_set.all().order_by('name')
+    if zone_records is None:
+        zone_records = fetch_zone_records(root_domain, soa)
 
-    # Build the mega filter!
-    domain_mega_filter = Q(domain=root_domain)
-    for domain in domains:
-        domain_mega_filter = domain_mega_filter | Q(domain=domain)
+    if root_domain.is_reverse:
+        view_data = iter_reverse_zone(view, zone_records)
+    else:
+        view_data = iter_forward_zone(view, zone_records)
 
-    rdomain_mega_filter = Q(reverse_domain=root_domain)
-    for reverse_domain in domains:
-        rdomain_mega_filter = rdomain_mega_filter | Q(
-            reverse_domain=reverse_domain)
+    for data in view_data:
+        yield data
 
-    soa_data = render_soa_only(soa=soa, root_domain=root_domain)
-    if root_domain.ip_type == '4':
-        range_set = (root_domain.get_related_ranges()
-                                .filter(views__name=view.name)
-                                .order_by('start_upper', 'start_lower'))
-    else:
-        range_set = []
-
-    try:
-        if ztype == "forward":
-            view_data = render_forward_zone(view, domain_mega_filter)
-        else:
-            ip_type = (IP_TYPE_6 if root_domain.name.endswith('ip6.arpa')
-                       else IP_TYPE_4)
-            view_data = render_reverse_zone(
-                view, domain_mega_filter, rdomain_mega_filter, ip_type=ip_type,
-                range_set=range_set)
-    except View.DoesNotExist:
-        view_data = ""
+
+def build_zone_data(view, root_domain, soa, logf, zone_records=None):
+    """
+    This function does the heavy lifting of building a zone. It coordinates
+    getting all of the data out of the db into BIND format.
+
+        :param soa: The SOA corresponding to the zone being built.
+        :type soa: SOA
+
+        :param root_domain: The root domain of this zone.
+        :type root_domain: str
+
+        :param zone_records: The zone's records for every view, as returned
+            by :func:`fetch_zone_records`. Fetched if not given.
+        :type zone_records: dict
+
+        :returns view_data: The zone file's data, with a ``{serial}``
+            placeholder in the SOA record, or an empty string if there is
+            no zone file to build.
+        :type view_data: str
+    """
+    view_data = "".join(
+        iter_zone_data(view, root_domain, soa, logf, zone_records))
 
     if view_data:
+        soa_data = render_soa_only(soa=soa, root_domain=root_domain)
         view_data = soa_data + view_data
 
     return view_data
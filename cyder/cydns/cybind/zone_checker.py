@@ -0,0 +1,202 @@
+import re
+from collections import defaultdict, namedtuple
+
+
+CLASSES = ('IN', 'CH', 'HS')
+
+# Types that may share a name with a CNAME.
+CNAME_COMPANIONS = ('CNAME', 'RRSIG', 'NSEC')
+
+MAX_LABEL_LENGTH = 63
+MAX_NAME_LENGTH = 253
+
+TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[()]|;.*|[^\s"();]+')
+LABEL_RE = re.compile(r'^[A-Za-z0-9_/-]+$')
+
+ZoneRecord = namedtuple('ZoneRecord',
+                        'lineno name ttl rdclass rdtype rdata')
+
+
+class ZoneParseError(Exception):
+    pass
+
+
+def iter_entries(lines):
+    """
+    Yield each entry of a zone file as a line number, whether the entry
+    starts with whitespace (i.e. has no owner name), and its tokens.
+    Comments are dropped and parenthesized entries are joined.
+    """
+    depth = 0
+    entry = []
+    for lineno, line in enumerate(lines, 1):
+        if depth == 0:
+            start, blank_owner, entry = lineno, line[:1].isspace(), []
+        for token in TOKEN_RE.findall(line):
+            if token.startswith(';'):
+                break
+            elif token == '(':
+                depth += 1
+            elif token == ')':
+                depth -= 1
+                if depth < 0:
+                    raise ZoneParseError(
+                        "line {0}: unbalanced ')'".format(lineno))
+            else:
+                entry.append(token)
+        if depth == 0 and entry:
+            yield start, blank_owner, entry
+    if depth:
+        raise ZoneParseError("line {0}: unbalanced '('".format(start))
+
+
+def absolute_name(name, origin):
+    if name == '@':
+        return origin
+    if name.endswith('.'):
+        return name[:-1].lower()
+    return '{0}.{1}'.format(name, origin).lower()
+
+
+def parse_rr(tokens, lineno, name, default_ttl):
+    ttl, rdclass = default_ttl, 'IN'
+    tokens = list(tokens)
+    for _ in xrange(2):
+        if tokens and tokens[0].isdigit():
+            ttl = int(tokens.pop(0))
+        elif tokens and tokens[0].upper() in CLASSES:
+            rdclass = tokens.pop(0).upper()
+    if not tokens:
+        raise ZoneParseError("line {0}: no record type".format(lineno))
+    return ZoneRecord(lineno, name, ttl, rdclass, tokens[0].upper(),
+                      tokens[1:])
+
+
+def expand_generate(tokens, lineno, origin, default_ttl):
+    """
+    Yield the records a $GENERATE directive stands for. Only plain ``$``
+    substitution is supported, which is all Cyder writes.
+    """
+    try:
+        start, stop = map(int, tokens[0].split('-'))
+    except ValueError:
+        raise ZoneParseError(
+            "line {0}: bad $GENERATE range '{1}'".format(lineno, tokens[0]))
+    for i in xrange(start, stop + 1):
+        i = str(i)
+        lhs = absolute_name(tokens[1].replace('$', i), origin)
+        yield parse_rr([t.replace('$', i) for t in tokens[2:]], lineno, lhs,
+                       default_ttl)
+
+
+def parse_zone(lines, origin):
+    """
+    Parse the text of a zone file and yield a :class:`ZoneRecord` for each
+    record. Names are absolute, lowercase and have no trailing dot.
+
+    :param lines: The zone file's lines.
+    :type lines: An iterable of str, such as a file
+    :param origin: The name of the zone.
+    :type origin: str
+    """
+    origin = origin.rstrip('.').lower()
+    ttl = None
+    name = None
+    for lineno, blank_owner, tokens in iter_entries(lines):
+        directive = tokens[0].upper()
+        if directive == '$TTL':
+            ttl = int(tokens[1])
+        elif directive == '$ORIGIN':
+            origin = absolute_name(tokens[1], origin)
+        elif directive == '$GENERATE':
+            for record in expand_generate(tokens[1:], lineno, origin, ttl):
+                yield record
+        elif directive.startswith('$'):
+            raise ZoneParseError("line {0}: unsupported directive {1}"
+                                 .format(lineno, tokens[0]))
+        else:
+            if not blank_owner:
+                name = absolute_name(tokens.pop(0), origin)
+            elif name is None:
+                raise ZoneParseError(
+                    "line {0}: no owner name".format(lineno))
+            yield parse_rr(tokens, lineno, name, ttl)
+
+
+def check_name(name):
+    """Return why ``name`` isn't a valid owner name, or None if it is."""
+    if len(name) > MAX_NAME_LENGTH:
+        return 'name is longer than {0} characters'.format(MAX_NAME_LENGTH)
+    labels = name.split('.')
+    for i, label in enumerate(labels):
+        if not label:
+            return 'empty label'
+        if len(label) > MAX_LABEL_LENGTH:
+            return 'label {0} is longer than {1} characters'.format(
+                label, MAX_LABEL_LENGTH)
+        if label == '*' and i == 0:
+            continue
+        if not LABEL_RE.match(label):
+            return 'bad character in label {0}'.format(label)
+
+
+def in_zone(name, origin):
+    return name == origin or name.endswith('.' + origin)
+
+
+def check_zone(lines, origin):
+    """
+    Check the structure of a zone file without shelling out to
+    named-checkzone. This checks that the zone starts with an SOA at its
+    apex and has NS records there, that no name has a CNAME and other data,
+    that names are syntactically valid and that every name is in the zone.
+
+    :returns: A list of problems, which is empty if the zone is fine.
+    """
+    origin = origin.rstrip('.').lower()
+    errors = []
+    types_by_name = defaultdict(set)
+    cname_counts = defaultdict(int)
+    soa_count = 0
+    first = True
+
+    try:
+        for record in parse_zone(lines, origin):
+            if record.rdtype == 'SOA':
+                soa_count += 1
+            if first and (record.rdtype != 'SOA' or record.name != origin):
+                errors.append('line {0}: the first record must be the SOA '
+                              'of {1}'.format(record.lineno, origin))
+            first = False
+
+            problem = check_name(record.name)
+            if problem:
+                errors.append('line {0}: {1}: {2}'.format(
+                    record.lineno, record.name, problem))
+            elif not in_zone(record.name, origin):
+                errors.append('line {0}: {1} is out of zone'.format(
+                    record.lineno, record.name))
+
+            types_by_name[record.name].add(record.rdtype)
+            if record.rdtype == 'CNAME':
+                cname_counts[record.name] += 1
+    except ZoneParseError as e:
+        errors.append(unicode(e))
+        return errors
+
+    if soa_count == 0:
+        errors.append('{0} has no SOA record'.format(origin))
+    elif soa_count > 1:
+        errors.append('{0} has {1} SOA records'.format(origin, soa_count))
+    if 'NS' not in types_by_name[origin]:
+        errors.append('{0} has no NS records at its apex'.format(origin))
+
+    for name, count in sorted(cname_counts.iteritems()):
+        if count > 1:
+            errors.append('{0} has more than one CNAME'.format(name))
+        others = types_by_name[name].difference(CNAME_COMPANIONS)
+        if others:
+            errors.append('{0} has a CNAME and other data ({1})'.format(
+                name, ', '.join(sorted(others))))
+
+    return errors
@@ -0,0 +1,111 @@
+from cyder.cydns.cybind.zone_checker import parse_zone, TOKEN_RE
+
+
+SOA_SERIAL = 2  # The serial's index in an SOA's rdata
+
+
+class ZoneDeltaError(Exception):
+    pass
+
+
+def zone_records(lines, origin):
+    """
+    Parse a zone file into a dict mapping (name, class, type, rdata) to TTL,
+    where rdata is a string.
+    """
+    return dict(((r.name, r.rdclass, r.rdtype, ' '.join(r.rdata)), r.ttl)
+                for r in parse_zone(lines, origin))
+
+
+def get_soa(records):
+    for key in records:
+        if key[2] == 'SOA':
+            return key
+
+
+def render_nsupdate(origin, old, new):
+    """
+    Yield the lines of an nsupdate script that turns the records in `old`
+    into the records in `new`, both as returned by :func:`zone_records`.
+
+    The script only applies to the zone at the serial it had in `old`. It
+    sets the serial `new` has, so nameservers updated with it and those
+    given the new zone file agree on the zone's serial.
+    """
+    origin = origin.rstrip('.').lower()
+    old_soa, new_soa = get_soa(old), get_soa(new)
+    if old_soa is None or new_soa is None:
+        raise ZoneDeltaError('{0} has no SOA record'.format(origin))
+
+    yield '; {0}: serial {1} to {2}\n'.format(
+        origin, old_soa[3].split()[SOA_SERIAL],
+        new_soa[3].split()[SOA_SERIAL])
+    yield 'zone {0}.\n'.format(origin)
+    yield 'prereq yxrrset {0}. {1} SOA {2}\n'.format(
+        old_soa[0], old_soa[1], old_soa[3])
+
+    for key in sorted(old):
+        if key[2] != 'SOA' and new.get(key) != old[key]:
+            name, rdclass, rdtype, rdata = key
+            yield 'update delete {0}. {1} {2} {3}\n'.format(
+                name, rdclass, rdtype, rdata)
+
+    for key in sorted(new):
+        if key[2] != 'SOA' and old.get(key) != new[key]:
+            name, rdclass, rdtype, rdata = key
+            yield 'update add {0}. {1} {2} {3} {4}\n'.format(
+                name, new[key], rdclass, rdtype, rdata)
+
+    if old_soa != new_soa:
+        # Adding an SOA replaces the old one. Its serial is used instead of
+        # the old one incremented.
+        yield 'update add {0}. {1} {2} SOA {3}\n'.format(
+            new_soa[0], new[new_soa], new_soa[1], new_soa[3])
+
+    yield 'send\n'
+
+
+def apply_nsupdate(records, lines):
+    """
+    Apply an nsupdate script written by :func:`render_nsupdate` to a copy of
+    `records`, as a nameserver would, and return the result. Unless the
+    script sets the serial, it's incremented if anything changed.
+    """
+    records = dict(records)
+    changed = False
+    soa_added = False
+    for line in lines:
+        tokens = TOKEN_RE.findall(line)
+        if not tokens or tokens[0].startswith(';'):
+            continue
+        command = ' '.join(tokens[:2])
+        if command == 'prereq yxrrset':
+            name, rdclass, rdtype = tokens[2].rstrip('.'), tokens[3], tokens[4]
+            key = (name, rdclass, rdtype, ' '.join(tokens[5:]))
+            if key not in records:
+                raise ZoneDeltaError('Prerequisite failed: ' + line.strip())
+        elif command == 'update delete':
+            name, rdclass, rdtype = tokens[2].rstrip('.'), tokens[3], tokens[4]
+            key = (name, rdclass, rdtype, ' '.join(tokens[5:]))
+            if records.pop(key, None) is not None:
+                changed = True
+        elif command == 'update add':
+            name, ttl, rdclass, rdtype = (tokens[2].rstrip('.'),
+                                          int(tokens[3]), tokens[4],
+                                          tokens[5])
+            key = (name, rdclass, rdtype, ' '.join(tokens[6:]))
+            if rdtype == 'SOA':
+                del records[get_soa(records)]
+                soa_added = True
+            if records.get(key) != ttl:
+                records[key] = ttl
+                changed = True
+        elif tokens[0] not in ('zone', 'send'):
+            raise ZoneDeltaError('Unsupported command: ' + line.strip())
+
+    if changed and not soa_added:
+        soa = get_soa(records)
+        rdata = soa[3].split()
+        rdata[SOA_SERIAL] = str(int(rdata[SOA_SERIAL]) + 1)
+        records[soa[:3] + (' '.join(rdata),)] = records.pop(soa)
+    return records
@@ -1,4 +1,3 @@
-from string import Template
 from gettext import gettext as _
 
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
@@ -76,7 +75,7 @@ class Nameserver(CydnsRecord):
 
     def bind_render_record(self, pk=False, **kwargs):
         # We need to override this because fqdn is actually self.domain.name
-        template = Template(self.template).substitute(**self.justs)
+        template = self.get_bind_template()
         return template.format(
             rdtype=self.rdtype, rdclass='IN', bind_name=self.domain.name + '.',
             **self.__dict__
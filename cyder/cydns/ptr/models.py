@@ -8,7 +8,7 @@ from ipaddr import AddressValueError, IPv4Address, IPv6Address
 from cyder.base.utils import transaction_atomic
 from cyder.base.models import BaseModel
 from cyder.base.mixins import DisplayMixin, ObjectUrlMixin
-from cyder.cydhcp.range.utils import find_range
+from cyder.cydhcp.range.utils import find_range, update_static_usage
 from cyder.cydns.models import ViewMixin
 from cyder.cydns.domain.models import Domain, name_to_domain
 from cyder.cydns.ip.models import Ip
@@ -205,28 +205,24 @@ class PTR(BaseModel, BasePTR, Ip, ViewMixin, DisplayMixin, ObjectUrlMixin):
         self.full_clean()
 
         update_range_usage = kwargs.pop('update_range_usage', True)
-        old_range = None
+        old_ip = None
         if self.id is not None:
-            old_ip = PTR.objects.get(id=self.id).ip_str
-            old_range = find_range(old_ip)
+            old = PTR.objects.get(id=self.id)
+            old_ip = (old.ip_str, old.ip_type)
 
         super(PTR, self).save(*args, **kwargs)
         self.schedule_zone_rebuild()
-        rng = self.range
-        if rng and update_range_usage:
-            rng.save(commit=False)
-            if old_range:
-                old_range.save(commit=False)
+        if update_range_usage:
+            update_static_usage(old_ip, (self.ip_str, self.ip_type))
 
     @transaction_atomic
     def delete(self, *args, **kwargs):
         update_range_usage = kwargs.pop('update_range_usage', True)
         if self.reverse_domain.soa:
             self.reverse_domain.soa.schedule_rebuild()
-        rng = find_range(self.ip_str)
         super(PTR, self).delete(*args, **kwargs)
-        if rng and update_range_usage:
-            rng.save(commit=False)
+        if update_range_usage:
+            update_static_usage((self.ip_str, self.ip_type), None)
 
     def clean(self):
         super(PTR, self).clean()
@@ -1,7 +1,6 @@
 import time
 from gettext import gettext as _
 from itertools import chain
-from string import Template
 
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
@@ -104,7 +103,7 @@ class SOA(BaseModel, ObjectUrlMixin, DisplayMixin):
         # Domain models.py file for more info.
 
     def bind_render_record(self):
-        template = Template(self.template).substitute(**self.justs)
+        template = self.get_bind_template()
         return template.format(root_domain=self.root_domain,
                                rdtype=self.rdtype, rdclass='IN',
                                **self.__dict__)
@@ -164,8 +163,35 @@ class SOA(BaseModel, ObjectUrlMixin, DisplayMixin):
         reassign_reverse_records(root_domain, None)
 
     def has_record_set(self, view=None, exclude_ns=False):
-        for domain in self.domain_set.all():
-            if domain.has_record_set(view=view, exclude_ns=exclude_ns):
+        from cyder.cydhcp.interface.static_intr.models import StaticInterface
+        from cyder.cydns.address_record.models import AddressRecord
+        from cyder.cydns.cname.models import CNAME
+        from cyder.cydns.mx.models import MX
+        from cyder.cydns.nameserver.models import Nameserver
+        from cyder.cydns.ptr.models import PTR
+        from cyder.cydns.srv.models import SRV
+        from cyder.cydns.sshfp.models import SSHFP
+        from cyder.cydns.txt.models import TXT
+
+        # Query by zone membership rather than domain by domain so the
+        # number of queries doesn't grow with the number of subdomains.
+        object_sets = [
+            AddressRecord.objects.filter(domain__soa=self),
+            CNAME.objects.filter(domain__soa=self),
+            MX.objects.filter(domain__soa=self),
+            SRV.objects.filter(domain__soa=self),
+            SSHFP.objects.filter(domain__soa=self),
+            StaticInterface.objects.filter(domain__soa=self),
+            TXT.objects.filter(domain__soa=self),
+            PTR.objects.filter(reverse_domain__soa=self),
+        ]
+        if not exclude_ns:
+            object_sets.append(Nameserver.objects.filter(domain__soa=self))
+
+        for object_set in object_sets:
+            if view:
+                object_set = object_set.filter(views=view)
+            if object_set.exists():
                 return True
         return False
 
@@ -173,10 +199,12 @@ class SOA(BaseModel, ObjectUrlMixin, DisplayMixin):
         if MIGRATING and not force:
             return
 
-        Task.schedule_zone_rebuild(self)
         self.dirty = True
-        if save:
-            self.save()
+        # Within a batch (see Task.batch), only the first request to rebuild
+        # a zone needs to touch the database.
+        if Task.schedule_zone_rebuild(self) and save:
+            # Only the dirty flag changes, so skip save() and its full_clean.
+            SOA.objects.filter(pk=self.pk).update(dirty=True)
 
     @transaction_atomic
     def save(self, *args, **kwargs):
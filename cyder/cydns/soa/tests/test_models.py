@@ -1,8 +1,11 @@
 from django.core.exceptions import ValidationError
 
 from cyder.base.tests import ModelTestMixin, TestCase
+from cyder.core.ctnr.models import Ctnr
 from cyder.cydns.soa.models import SOA
 from cyder.cydns.domain.models import Domain
+from cyder.cydns.txt.models import TXT
+from cyder.cydns.view.models import View
 
 
 class SOATests(TestCase, ModelTestMixin):
@@ -120,3 +123,23 @@ class SOATests(TestCase, ModelTestMixin):
         self.assertEqual(Domain.objects.get(name='y').soa, None)
         for name in ('x.y', 'p.x.y', 'q.x.y', 'a.q.x.y', 'b.q.x.y', 'c.q.x.y'):
             self.assertEqual(Domain.objects.get(name=name).soa, soa_x_y)
+
+    def test_has_record_set(self):
+        d0 = Domain.objects.create(name='com')
+        soa = SOA.objects.create(
+            primary='ns1.foo.com', contact='email.foo.com', root_domain=d0)
+        Domain.objects.create(name='foo.com')
+        d2 = Domain.objects.create(name='bar.foo.com')
+        self.assertFalse(soa.has_record_set())
+
+        ctnr = Ctnr.objects.create(name='test_ctnr')
+        ctnr.domains.add(d2)
+        txt = TXT.objects.create(
+            label='baz', domain=d2, txt_data='Data data data', ctnr=ctnr)
+        self.assertTrue(soa.has_record_set())
+
+        public, _ = View.objects.get_or_create(name='public')
+        private, _ = View.objects.get_or_create(name='private')
+        txt.views.add(public)
+        self.assertTrue(soa.has_record_set(view=public))
+        self.assertFalse(soa.has_record_set(view=private))
@@ -1,5 +1,4 @@
 from gettext import gettext as _
-from string import Template
 
 from django.db import models
 
@@ -76,7 +75,7 @@ class TXT(LabelDomainMixin, CydnsRecord):
             return (('"%s"' % line[:TXT_LINE_LENGTH]) + "\n"
                     + length_format(line[TXT_LINE_LENGTH:]))
 
-        template = Template(self.template).substitute(**self.justs)
+        template = self.get_bind_template()
         bind_name = self.fqdn + "."
         if not self.ttl:
             self.ttl = 3600
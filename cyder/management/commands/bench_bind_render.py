@@ -0,0 +1,64 @@
+from optparse import make_option
+from string import Template
+from time import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cyder.cydns.address_record.models import AddressRecord
+
+
+class Command(BaseCommand):
+    help = ('Time rendering BIND records from a template compiled per record, '
+            'from the cached template, and from field tuples.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('-n', '--records',
+                    dest='records',
+                    type='int',
+                    default=100000,
+                    help='Number of records to render.'),
+    )
+
+    def handle(self, *args, **options):
+        n = options['records']
+        if n < 1:
+            raise CommandError('--records must be at least 1')
+
+        # Unsaved records, so only rendering is timed.
+        records = [
+            AddressRecord(
+                label='host{0}'.format(i),
+                fqdn='host{0}.example.com'.format(i), ttl=3600, ip_type='4',
+                ip_str='10.{0}.{1}.{2}'.format(i >> 16, (i >> 8) & 255,
+                                               i & 255))
+            for i in xrange(n)]
+
+        def render_uncompiled():
+            for r in records:
+                template = Template(r.template).substitute(**r.justs)
+                template.format(bind_name=r.fqdn + '.', rdtype=r.rdtype,
+                                rdclass='IN', **vars(r))
+
+        def render_compiled():
+            for r in records:
+                r.bind_render_record()
+
+        render, fields = AddressRecord.get_bind_formatter()
+        rows = []
+        for r in records:
+            values = dict(vars(r), bind_name=r.fqdn + '.', rdtype=r.rdtype,
+                          rdclass='IN')
+            rows.append(tuple(values[f] for f in fields))
+
+        def render_tuples():
+            for row in rows:
+                render(*row)
+
+        for name, f in (('uncompiled template', render_uncompiled),
+                        ('compiled template', render_compiled),
+                        ('field tuples', render_tuples)):
+            start = time()
+            f()
+            elapsed = time() - start
+            self.stdout.write('{0:20} {1:8.3f} s  {2:8.2f} us/record\n'.format(
+                name, elapsed, elapsed / n * 1e6))
@@ -0,0 +1,71 @@
+import json
+from optparse import make_option
+from time import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from cyder.cydns.cybind.builder import DNSBuilder
+from cyder.cydns.soa.models import SOA
+
+
+class Command(BaseCommand):
+    help = ('Time a forced DNS build stage by stage and print the results as '
+            'JSON. See generate_dns_data for making data to build.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('-p', '--push',
+                    dest='push',
+                    action='store_true',
+                    default=False,
+                    help='Also time pushing the build.'),
+        make_option('-j', '--jobs',
+                    dest='jobs',
+                    type='int',
+                    default=1,
+                    help='Number of zones to build at the same time. Stages '
+                         'run by worker processes are not timed.'),
+        make_option('-o', '--output',
+                    dest='output',
+                    default=None,
+                    help='File to write the results to, instead of stdout.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['jobs'] < 1:
+            raise CommandError('--jobs must be at least 1')
+
+        # Query counts come from the queries logged by the debug cursor.
+        for conn in connections.all():
+            conn.use_debug_cursor = True
+
+        zones = SOA.objects.filter(dns_enabled=True).count()
+        start = time()
+        with DNSBuilder(quiet=True, profile=True,
+                        jobs=options['jobs']) as b:
+            b.build(force=True)
+            if options['push']:
+                with b.timed('push'):
+                    b.push(sanity_check=False)
+        elapsed = time() - start
+
+        stages = b.stage_stats
+        results = {
+            'zones': zones,
+            'jobs': options['jobs'],
+            'pushed': options['push'],
+            'zone_files': sum(
+                len(zhashes) for zhashes in b.zone_hashes.itervalues()),
+            'stages': stages,
+            'total': {
+                'seconds': elapsed,
+                'queries': sum(s['queries'] for s in stages.itervalues()),
+            },
+        }
+
+        output = json.dumps(results, indent=2, sort_keys=True) + '\n'
+        if options['output']:
+            with open(options['output'], 'w') as fd:
+                fd.write(output)
+        else:
+            self.stdout.write(output)
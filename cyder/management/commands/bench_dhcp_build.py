@@ -0,0 +1,81 @@
+import json
+import os
+import resource
+from optparse import make_option
+from time import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from cyder.cydhcp.build.builder import DHCPBuilder
+from cyder.cydhcp.interface.dynamic_intr.models import DynamicInterface
+from cyder.cydhcp.interface.static_intr.models import StaticInterface
+
+
+class Command(BaseCommand):
+    help = ('Time a forced DHCP build and measure its peak memory use, and '
+            'print the results as JSON. Run it once per data size, since '
+            'peak memory only grows within a process. See generate_dns_data '
+            'for making data to build.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('-j', '--jobs',
+                    dest='jobs',
+                    type='int',
+                    default=1,
+                    help='Number of files (v4 and v6) to render at the same '
+                         'time.'),
+        make_option('-s', '--shard-dir',
+                    dest='shard_dir',
+                    default=None,
+                    help='Write sharded output to this directory.'),
+        make_option('-o', '--output',
+                    dest='output',
+                    default=None,
+                    help='File to write the results to, instead of stdout.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['jobs'] < 1:
+            raise CommandError('--jobs must be at least 1')
+
+        # Query counts come from the queries logged by the debug cursor.
+        for conn in connections.all():
+            conn.use_debug_cursor = True
+
+        hosts = (DynamicInterface.objects.filter(dhcp_enabled=True).count() +
+                 StaticInterface.objects.filter(dhcp_enabled=True).count())
+        start_queries = sum(len(conn.queries) for conn in connections.all())
+        start = time()
+        with DHCPBuilder(quiet=True, jobs=options['jobs'],
+                         shard_dir=options['shard_dir']) as b:
+            b.build(force=True)
+        elapsed = time() - start
+        queries = (sum(len(conn.queries) for conn in connections.all()) -
+                   start_queries)
+
+        # ru_maxrss is in kilobytes on Linux.
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if options['jobs'] > 1:
+            peak_kb = max(peak_kb, resource.getrusage(
+                resource.RUSAGE_CHILDREN).ru_maxrss)
+
+        results = {
+            'hosts': hosts,
+            'jobs': options['jobs'],
+            'sharded': options['shard_dir'] is not None,
+            'files_written': len(b.written_files),
+            'bytes_written': sum(
+                os.path.getsize(os.path.join(b.stage_dir, rel_path))
+                for rel_path in b.written_files),
+            'seconds': elapsed,
+            'queries': queries,
+            'peak_memory_kb': peak_kb,
+        }
+
+        output = json.dumps(results, indent=2, sort_keys=True) + '\n'
+        if options['output']:
+            with open(options['output'], 'w') as fd:
+                fd.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,96 @@
+import json
+import random
+from optparse import make_option
+from time import time
+
+import ipaddr
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from cyder.cydhcp.network.models import Network
+from cyder.cydhcp.range.models import Range
+
+
+class Command(BaseCommand):
+    help = ('Time Range.check_for_overlaps against many ranges and print the '
+            'results as JSON. The ranges are created in a transaction that '
+            'is rolled back at the end.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('-n', '--ranges',
+                    dest='ranges',
+                    type='int',
+                    default=20000,
+                    help='Number of ranges (of three addresses) to create.'),
+        make_option('-c', '--checks',
+                    dest='checks',
+                    type='int',
+                    default=1000,
+                    help='Number of overlap checks to time.'),
+        make_option('--network',
+                    dest='network',
+                    default='172.16.0.0/12',
+                    help='IPv4 network to create the ranges in. It must not '
+                         'exist yet.'),
+    )
+
+    def handle(self, *args, **options):
+        n_ranges = options['ranges']
+        n_checks = options['checks']
+        if n_ranges < 1 or n_checks < 1:
+            raise CommandError('--ranges and --checks must be at least 1')
+        network = ipaddr.IPv4Network(options['network']).masked()
+        if n_ranges * 4 + 1 > network.numhosts:
+            raise CommandError("That many ranges don't fit in {0}".format(
+                network))
+
+        with transaction.commit_manually():
+            try:
+                results = self.run(network, n_ranges, n_checks)
+            finally:
+                transaction.rollback()
+
+        self.stdout.write(json.dumps(results, indent=2, sort_keys=True) +
+                          '\n')
+
+    def make_range(self, network, start, end):
+        return Range(network=network, ip_type='4',
+                     start_str=str(ipaddr.IPv4Address(start)),
+                     end_str=str(ipaddr.IPv4Address(end)),
+                     start_upper=0, start_lower=start,
+                     end_upper=0, end_lower=end)
+
+    def run(self, network, n_ranges, n_checks):
+        net = Network.objects.create(network_str=str(network), ip_type='4')
+        # Range k is base + 4k + 1 through base + 4k + 3, so the address
+        # after each range is free.
+        base = int(network.network)
+        Range.objects.bulk_create(
+            [self.make_range(net, base + 4 * k + 1, base + 4 * k + 3)
+             for k in xrange(n_ranges)])
+
+        # Query counts come from the queries logged by the debug cursor.
+        connection.use_debug_cursor = True
+        results = {'ranges': n_ranges, 'checks': n_checks}
+        for kind, offset in (('free', 4), ('overlapping', 3)):
+            checks = [self.make_range(net, base + 4 * k + offset,
+                                      base + 4 * k + 4)
+                      for k in (random.randrange(n_ranges)
+                                for _ in xrange(n_checks))]
+            queries = len(connection.queries)
+            start = time()
+            overlaps = 0
+            for rng in checks:
+                try:
+                    rng.check_for_overlaps()
+                except ValidationError:
+                    overlaps += 1
+            elapsed = time() - start
+            results[kind] = {
+                'overlaps_found': overlaps,
+                'ms_per_check': elapsed * 1000 / n_checks,
+                'queries_per_check':
+                    float(len(connection.queries) - queries) / n_checks,
+            }
+        return results
@@ -1,3 +1,5 @@
+import signal
+import sys
 import syslog
 from optparse import make_option
 
@@ -30,6 +32,23 @@ class Command(BaseCommand):
                     action='store_true',
                     default=False,
                     help="Rebuild all zones even if they're up to date."),
+        make_option('-d', '--daemon',
+                    dest='daemon',
+                    action='store_true',
+                    default=False,
+                    help="Keep running and build whenever zones are "
+                         "scheduled to be rebuilt."),
+        make_option('-z', '--zone',
+                    dest='zones',
+                    action='append',
+                    default=None,
+                    help="Only build this zone, whether or not it's up to "
+                         "date. May be given more than once."),
+        make_option('-j', '--jobs',
+                    dest='jobs',
+                    type='int',
+                    default=None,
+                    help='Number of zones to build at the same time.'),
         make_option('-C', '--no-sanity-check',
                     dest='sanity_check',
                     action='store_false',
@@ -48,7 +67,24 @@ class Command(BaseCommand):
         builder_opts['quiet'] = verbosity == 0
         builder_opts['verbose'] = verbosity >= 2
 
+        if options['jobs'] is not None:
+            if options['jobs'] < 1:
+                raise CommandError('--jobs must be at least 1')
+            builder_opts['jobs'] = options['jobs']
+
+        if options['daemon'] and options['zones']:
+            raise CommandError("--zone can't be used with --daemon")
+
+        if options['daemon']:
+            # Exit through the lock's context manager so the lock is released.
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
         with DNSBuilder(**builder_opts) as b:
-            b.build(force=options['force_build'])
-            if options['push']:
-                b.push(sanity_check=options['sanity_check'])
+            if options['daemon']:
+                b.run_daemon(push=options['push'],
+                             sanity_check=options['sanity_check'])
+            else:
+                b.build(force=options['force_build'],
+                        zones=options['zones'])
+                if options['push']:
+                    b.push(sanity_check=options['sanity_check'])
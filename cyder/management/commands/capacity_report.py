@@ -0,0 +1,71 @@
+from optparse import make_option
+
+import ipaddr
+from django.core.management.base import BaseCommand, CommandError
+
+from cyder.cydhcp.constants import STATIC
+from cyder.cydhcp.network.models import Network
+from cyder.cydhcp.range.occupancy import OccupancyMap
+from cyder.cydhcp.utils import four_to_two
+
+
+class Command(BaseCommand):
+    help = ('Print how full every network and static range is, with its '
+            'largest free block. Networks too big to map are skipped.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('-t', '--ip-type',
+                    dest='ip_type',
+                    default=None,
+                    help="Only report on networks of this IP type ('4' or "
+                         "'6')."),
+        make_option('-m', '--min-usage',
+                    dest='min_usage',
+                    type='int',
+                    default=0,
+                    help='Only report on networks and ranges at least this '
+                         'full, in percent.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['ip_type'] not in (None, '4', '6'):
+            raise CommandError("--ip-type must be '4' or '6'")
+
+        networks = Network.objects.order_by('ip_type', 'ip_upper', 'ip_lower',
+                                            'prefixlen')
+        if options['ip_type']:
+            networks = networks.filter(ip_type=options['ip_type'])
+
+        self.stdout.write('\t'.join(('block', 'used', 'size', 'usage',
+                                     'largest free block')) + '\n')
+        for network in networks:
+            try:
+                occupancy = OccupancyMap.for_network(network)
+            except ValueError:
+                continue
+            self.report(network.network_str, occupancy, options['min_usage'])
+
+            ranges = (network.range_set.filter(range_type=STATIC)
+                             .order_by('start_upper', 'start_lower'))
+            for range_ in ranges:
+                start, end = four_to_two(range_.start_upper,
+                                         range_.start_lower,
+                                         range_.end_upper, range_.end_lower)
+                self.report('  {0} - {1}'.format(range_.start_str,
+                                                 range_.end_str),
+                            occupancy.submap(start, end),
+                            options['min_usage'])
+
+    def report(self, name, occupancy, min_usage):
+        if occupancy.usage < min_usage:
+            return
+        version = int(occupancy.ip_type)
+        block = occupancy.largest_free_block()
+        if block:
+            free = '{0} - {1} ({2})'.format(
+                ipaddr.IPAddress(block[0], version),
+                ipaddr.IPAddress(block[1], version), block[1] - block[0] + 1)
+        else:
+            free = 'none'
+        self.stdout.write('{0}\t{1}\t{2}\t{3}%\t{4}\n'.format(
+            name, occupancy.used, occupancy.size, occupancy.usage, free))
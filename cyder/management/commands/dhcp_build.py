@@ -24,6 +24,17 @@ class Command(BaseCommand):
                     action='store_false',
                     help="Do not log to syslog."),
         ### miscellaneous ###
+        make_option('-f', '--force-build',
+                    dest='force_build',
+                    action='store_true',
+                    default=False,
+                    help="Build even if nothing has changed."),
+        make_option('-j', '--jobs',
+                    dest='jobs',
+                    type='int',
+                    default=None,
+                    help='Number of files (v4 and v6) to render at the same '
+                         'time.'),
         make_option('-C', '--no-sanity-check',
                     dest='sanity_check',
                     action='store_false',
@@ -42,7 +53,12 @@ class Command(BaseCommand):
         builder_opts['quiet'] = verbosity == 0
         builder_opts['verbose'] = verbosity >= 2
 
+        if options['jobs'] is not None:
+            if options['jobs'] < 1:
+                raise CommandError('--jobs must be at least 1')
+            builder_opts['jobs'] = options['jobs']
+
         with DHCPBuilder(**builder_opts) as b:
-            b.build()
+            b.build(force=options['force_build'])
             if options['push']:
                 b.push(sanity_check=options['sanity_check'])
@@ -0,0 +1,176 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cyder.core.ctnr.models import Ctnr
+from cyder.core.system.models import System
+from cyder.core.task.models import Task
+from cyder.cydhcp.constants import DYNAMIC, STATIC
+from cyder.cydhcp.interface.dynamic_intr.models import DynamicInterface
+from cyder.cydhcp.interface.static_intr.models import StaticInterface
+from cyder.cydhcp.network.models import Network
+from cyder.cydhcp.range.models import Range
+from cyder.cydhcp.workgroup.models import Workgroup
+from cyder.cydns.address_record.models import AddressRecord
+from cyder.cydns.cname.models import CNAME
+from cyder.cydns.domain.models import Domain
+from cyder.cydns.mx.models import MX
+from cyder.cydns.nameserver.models import Nameserver
+from cyder.cydns.ptr.models import PTR
+from cyder.cydns.soa.models import SOA
+from cyder.cydns.srv.models import SRV
+from cyder.cydns.txt.models import TXT
+from cyder.cydns.view.models import View
+
+
+class Command(BaseCommand):
+    help = ('Generate synthetic zones to benchmark DNS and DHCP builds with. '
+            'Zone i is zone<i>.<suffix>, with the network 10.<i>.0.0/16 and '
+            'the reverse zone <i>.10.in-addr.arpa.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('-z', '--zones',
+                    dest='zones',
+                    type='int',
+                    default=10,
+                    help='Number of forward zones (at most 256).'),
+        make_option('-r', '--records',
+                    dest='records',
+                    type='int',
+                    default=100,
+                    help='Number of A, PTR, CNAME, MX, TXT and SRV records '
+                         'per zone, each.'),
+        make_option('-s', '--static-interfaces',
+                    dest='static_intrs',
+                    type='int',
+                    default=100,
+                    help='Number of static interfaces per zone.'),
+        make_option('-R', '--ranges',
+                    dest='ranges',
+                    type='int',
+                    default=1,
+                    help='Number of dynamic ranges (of 254 addresses) per '
+                         'zone.'),
+        make_option('-d', '--dynamic-interfaces',
+                    dest='dynamic_intrs',
+                    type='int',
+                    default=0,
+                    help='Number of dynamic interfaces per zone, spread '
+                         'over its dynamic ranges and all in the "bench" '
+                         'workgroup.'),
+        make_option('-V', '--views',
+                    dest='views',
+                    default='public,private',
+                    help='Comma-separated views to put the records in.'),
+        make_option('--suffix',
+                    dest='suffix',
+                    default='bench.test',
+                    help='Domain to create the zones under.'),
+    )
+
+    def handle(self, *args, **options):
+        n_zones = options['zones']
+        n_records = options['records']
+        n_intrs = options['static_intrs']
+        n_ranges = options['ranges']
+        n_dynamic = options['dynamic_intrs']
+        if not 1 <= n_zones <= 256:
+            raise CommandError('--zones must be between 1 and 256')
+        if min(n_records, n_intrs, n_ranges, n_dynamic) < 0:
+            raise CommandError('Counts must not be negative')
+        if n_dynamic and not n_ranges:
+            raise CommandError('Dynamic interfaces need dynamic ranges')
+        # Static addresses come from the bottom of each zone's /16 and
+        # dynamic ranges take whole /24s from the top.
+        if 1 + n_records + n_intrs > (256 - n_ranges) * 256 - 1:
+            raise CommandError("That many addresses don't fit in a /16")
+
+        self.views = [View.objects.get_or_create(name=name)[0]
+                      for name in options['views'].split(',')]
+        self.ctnr, _ = Ctnr.objects.get_or_create(name='bench')
+        self.workgroup, _ = Workgroup.objects.get_or_create(name='bench')
+        self.suffix = options['suffix']
+
+        for i in xrange(n_zones):
+            # Write each zone's build tasks once.
+            with Task.batch():
+                self.generate_zone(i, n_records, n_intrs, n_ranges,
+                                   n_dynamic)
+            self.stdout.write('Generated zone{0}.{1}\n'.format(i, self.suffix))
+
+    def make_zone(self, name):
+        domain = Domain.create_recursive(name=name)
+        self.ctnr.domains.add(domain)
+        ns = Nameserver.objects.create(domain=domain,
+                                       server='ns1.' + self.suffix)
+        ns.views.add(*self.views)
+        SOA.objects.create(primary='ns1.' + self.suffix,
+                           contact='hostmaster.' + self.suffix,
+                           root_domain=domain)
+        return domain.reload()
+
+    def add_views(self, record):
+        record.views.add(*self.views)
+
+    def generate_zone(self, i, n_records, n_intrs, n_ranges, n_dynamic):
+        name = 'zone{0}.{1}'.format(i, self.suffix)
+        zone = self.make_zone(name)
+        self.make_zone('{0}.10.in-addr.arpa'.format(i))
+
+        def ip(offset):
+            return '10.{0}.{1}.{2}'.format(i, offset >> 8, offset & 255)
+
+        network = Network.objects.create(
+            network_str='10.{0}.0.0/16'.format(i), ip_type='4')
+        if n_intrs:
+            static_range = Range.objects.create(
+                network=network, range_type=STATIC, ip_type='4',
+                start_str=ip(1 + n_records),
+                end_str=ip(n_records + n_intrs))
+            self.ctnr.ranges.add(static_range)
+        dynamic_ranges = []
+        for r in xrange(n_ranges):
+            dynamic_range = Range.objects.create(
+                network=network, range_type=DYNAMIC, ip_type='4',
+                domain=zone, start_str='10.{0}.{1}.1'.format(i, 255 - r),
+                end_str='10.{0}.{1}.254'.format(i, 255 - r))
+            self.add_views(dynamic_range)
+            self.ctnr.ranges.add(dynamic_range)
+            dynamic_ranges.append(dynamic_range)
+
+        for k in xrange(n_records):
+            host = 'host{0}.{1}'.format(k, name)
+            self.add_views(AddressRecord.objects.create(
+                label='host{0}'.format(k), domain=zone, ip_str=ip(1 + k),
+                ip_type='4', ctnr=self.ctnr))
+            self.add_views(PTR.objects.create(
+                ip_str=ip(1 + k), ip_type='4', fqdn=host, ctnr=self.ctnr))
+            self.add_views(CNAME.objects.create(
+                label='alias{0}'.format(k), domain=zone, target=host,
+                ctnr=self.ctnr))
+            self.add_views(MX.objects.create(
+                label='mx{0}'.format(k), domain=zone, server=host,
+                priority=10, ctnr=self.ctnr))
+            self.add_views(TXT.objects.create(
+                label='txt{0}'.format(k), domain=zone,
+                txt_data='benchmark record {0}'.format(k), ctnr=self.ctnr))
+            self.add_views(SRV.objects.create(
+                label='_svc{0}._tcp'.format(k), domain=zone, target=host,
+                port=80, priority=0, weight=0, ctnr=self.ctnr))
+
+        system = System.objects.create(name=name, ctnr=self.ctnr)
+        for k in xrange(n_intrs):
+            offset = 1 + n_records + k
+            self.add_views(StaticInterface.objects.create(
+                label='intr{0}'.format(k), domain=zone, ip_str=ip(offset),
+                ip_type='4', system=system,
+                mac='02:00:00:{0:02x}:{1:02x}:{2:02x}'.format(
+                    i, offset >> 8, offset & 255)))
+
+        for k in xrange(n_dynamic):
+            DynamicInterface.objects.create(
+                system=system, workgroup=self.workgroup,
+                range=dynamic_ranges[k % n_ranges],
+                mac='06:{0:02x}:{1:02x}:{2:02x}:{3:02x}:{4:02x}'.format(
+                    i, (k >> 24) & 255, (k >> 16) & 255, (k >> 8) & 255,
+                    k & 255))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cyder.cydhcp.range.utils import recompute_range_usage
+
+
+class Command(BaseCommand):
+    help = ('Recount how many addresses every range uses and update its '
+            'usage counter and percentage. Run this after importing data '
+            'with range usage updates turned off, or if the counters have '
+            'drifted.')
+
+    def handle(self, *args, **options):
+        with transaction.commit_on_success():
+            updated = recompute_range_usage()
+        self.stdout.write('Updated {0} ranges\n'.format(updated))
@@ -0,0 +1,25 @@
+from cyder.core.task.models import Task
+
+
+class TaskBatchMiddleware(object):
+    """
+    Collect the build tasks scheduled while handling a request, so a bulk
+    edit schedules each zone's rebuild once instead of once per record.
+
+    The batch is always ended, and its tasks written, however the request
+    ends. Changes that were committed before an error still need building.
+    """
+
+    def process_request(self, request):
+        # If an earlier request on this thread never reached
+        # process_response (say, another middleware raised first), its
+        # batch is still open. Close it so its tasks aren't held forever.
+        Task.end_batch(force=True)
+        Task.begin_batch()
+
+    def process_exception(self, request, exception):
+        Task.end_batch(force=True)
+
+    def process_response(self, request, response):
+        Task.end_batch(force=True)
+        return response
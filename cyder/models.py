@@ -24,3 +24,5 @@ from cyder.cydns.srv.models import *
 from cyder.cydns.sshfp.models import *
 from cyder.cydns.txt.models import *
 from cyder.cydns.view.models import *
+
+import cyder.cydhcp.build.signals  # register the handlers
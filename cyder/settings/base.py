@@ -17,7 +17,8 @@ from lib.path_utils import ROOT, path
 
 SLAVE_DATABASES = []
 
-DATABASE_ROUTERS = ('multidb.PinningMasterSlaveRouter',)
+DATABASE_ROUTERS = ('cyder.base.routers.SnapshotRouter',
+                    'multidb.PinningMasterSlaveRouter')
 
 ## Logging
 LOG_LEVEL = logging.INFO
@@ -380,6 +381,7 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.csrf.CsrfViewMiddleware',
     #'django_cas.middleware.CASMiddleware',
     'cyder.middleware.dev_authentication.DevAuthenticationMiddleware',
+    'cyder.middleware.task_batch.TaskBatchMiddleware',
 )
 
 TEMPLATE_CONTEXT_PROCESSORS += (
@@ -526,12 +528,55 @@ BINDBUILD = {
     # prod_dir.
     'bind_prefix': '/tmp/dns_prod/cyzones/',
 
+    # serial_index: Where to keep the serials of the zone files in prod_dir,
+    # so they don't have to be read from the zone files on every build. This
+    # shouldn't be under version control. None means prod_dir + '.serials'.
+    'serial_index': None,
+
     'lock_file': '/tmp/cyder_dns.lock',
     'pid_file': '/tmp/cyder_dns.pid',
     'named_checkzone': 'named-checkzone',
     'named_checkconf': 'named-checkconf',
     'named_checkzone_opts': '',
 
+    # jobs: How many zones to render, write and check at the same time. Each
+    # job is a separate process with its own database connection.
+    'jobs': 1,
+
+    # zone_checks: How staged zone files are checked. 'builtin' checks their
+    # structure in-process. 'named-checkzone' runs named_checkzone on each
+    # zone file whose content changed since the last successful build.
+    'zone_checks': ('builtin', 'named-checkzone'),
+
+    # check_jobs: How many named-checkzone and named-checkconf processes to
+    # run at the same time.
+    'check_jobs': 4,
+
+    # delta_dir: Where to write, for each rebuilt zone file, an nsupdate
+    # script that turns the file in prod_dir into the new one. Scripts are
+    # named after the zone file with '.nsupdate' appended, only apply to the
+    # zone at its old serial, and set the new file's serial. Like stage_dir,
+    # it's emptied at the start of every build, so it only holds the last
+    # build's scripts. This shouldn't be under version control. None means
+    # no scripts are written.
+    'delta_dir': None,
+
+    # snapshot_db: The database (usually one of SLAVE_DATABASES) to read
+    # from during a build, inside a single REPEATABLE READ snapshot. Writes
+    # still go to the primary. Zones are built one at a time in this mode,
+    # since worker processes can't share the snapshot. None means reading
+    # from the primary.
+    'snapshot_db': None,
+
+    # snapshot_max_lag: How many seconds to wait for snapshot_db to catch up
+    # with the last build before giving up.
+    'snapshot_max_lag': 60,
+
+    # keep_build_runs: How many of the most recent build runs, each with the
+    # content hash of every zone file it built, to keep. Older ones are
+    # deleted after each build. None means all of them are kept.
+    'keep_build_runs': 100,
+
     # None means no limit
     'line_decrease_limit': 500,
     'line_increase_limit': 500,
@@ -541,6 +586,15 @@ BINDBUILD = {
 
     'last_run_file': '/tmp/cyder.last_run',
     'log_syslog': False,
+
+    # bindbuild --daemon: Check for scheduled zones every poll_interval
+    # seconds, and build once none have been scheduled for debounce seconds
+    # or the oldest change has waited max_delay seconds. After a failed
+    # build, wait retry_interval seconds.
+    'daemon_poll_interval': 2,
+    'daemon_debounce': 5,
+    'daemon_max_delay': 60,
+    'daemon_retry_interval': 300,
 }
 
 
@@ -574,6 +628,26 @@ DHCPBUILD = {
         'check_file': None,
     },
 
+    # snapshot_db: The database (usually one of SLAVE_DATABASES) to read
+    # from during a build, inside a single REPEATABLE READ snapshot. None
+    # means reading from the primary.
+    'snapshot_db': None,
+
+    # shard_dir: If set, each container's classes, VRF class, subnet and
+    # workgroup is written to its own file under this directory (relative to
+    # stage_dir and prod_dir), and each target_file just includes them. Only
+    # the files whose contents changed are rewritten and pushed.
+    'shard_dir': None,
+
+    # shard_include_dir: Where dhcpd finds shard_dir. None means shard_dir,
+    # relative to dhcpd's working directory.
+    'shard_include_dir': None,
+
+    # jobs: How many of the v4 and v6 files to render at the same time. Each
+    # job is a separate process. The data is loaded before they start, so
+    # they don't query the database.
+    'jobs': 1,
+
     # None means no limit
     'line_decrease_limit': 500,
     'line_increase_limit': 500,